@@ -0,0 +1,272 @@
+'''
+Trip counts of a bikeshare city rolled up once, for the charts of the "LA Bikeshare Analysis" notebook.
+
+    cube = load_cube('LosAngeles').first_year()
+    cube.by_month()          # trips by month & pass type
+    cube.by_weekday()        # trips by day of the week (Monday=0)
+    cube.by_time_of_day()    # trips by 5-minute start slot
+    cube.by_station()        # origins & destinations by station
+    cube.by_bike()           # last start & end time and trips of each bike
+
+The cube holds the number of trips for each (date, 5-minute slot, weekday, pass type, start station,
+end station), built with one groupby over the trips, plus the trips of each bike in each 5-minute slot
+(with the last start & return) for the utilization queries, so that a window cuts both at the same
+slots. The notebook's aggregates read these few columns instead of the raw trips (the time of day
+histogram no longer rewrites every timestamp).
+
+load_cube() keeps a partial cube for each trip CSV next to the trip cache of trip_data.py, keyed by
+the SHA-1 of the CSV, so a new quarter of trips only rolls up the new file; the partial cubes are
+added together on load.
+'''
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from trip_data import refresh_cache
+
+
+# Minutes per time of day slot
+SLOT_MINUTES = 5
+
+# Format of the partial cubes
+CUBE_VERSION = 2
+
+DIMENSIONS = ['date', 'slot', 'weekday', 'passholder_type', 'start_station_id', 'end_station_id']
+BIKE_DIMENSIONS = ['bike_id', 'date', 'slot']
+CATEGORIES = ['passholder_type', 'start_station_id', 'end_station_id']
+
+
+class RidershipCube():
+
+    def __init__(self, cells, bikes, first_start=None):
+        self.cells       = cells
+        self.bikes       = bikes
+        self.first_start = first_start if first_start is not None else _first_start(cells)
+
+
+    @classmethod
+    def build(cls, trips):
+        '''
+        Rolls up a DataFrame of trips (start_time & end_time parsed; the pass type, stations & bike ID
+        are optional, as some systems do not have them)
+        '''
+        start = trips['start_time']
+        keys = pd.DataFrame({
+            'date':    start.dt.normalize(),
+            'slot':    ((start.dt.hour * 60 + start.dt.minute) // SLOT_MINUTES).astype('int16'),
+            'weekday': start.dt.weekday.astype('int8'),
+        })
+        for name in CATEGORIES:
+            keys[name] = trips[name] if name in trips else pd.Series(pd.NA, index=trips.index, dtype='category')
+        cells = keys.groupby(DIMENSIONS, observed=True, dropna=False).size().rename('trips').astype('int32').reset_index()
+
+        # Trips of each bike per 5-minute slot, with the last start & return
+        if 'bike_id' in trips:
+            slots = pd.DataFrame({'bike_id': trips['bike_id'], 'date': keys['date'], 'slot': keys['slot'],
+                                  'start_time': start, 'end_time': trips['end_time']})
+            bikes = slots.groupby(BIKE_DIMENSIONS, observed=True).agg(
+                trips=('start_time', 'size'), last_start=('start_time', 'max'), last_end=('end_time', 'max')).reset_index()
+            bikes['trips'] = bikes['trips'].astype('int32')
+        else:
+            bikes = _empty_bikes()
+        return cls(_categorize(cells), bikes, start.min() if len(start) else None)
+
+
+    @classmethod
+    def merge(cls, cubes):
+        '''
+        One cube adding up the trips of several (e.g. one per trip file)
+        '''
+        cubes = [cube for cube in cubes if len(cube.cells)]
+        if not cubes:
+            return cls(_empty_cells(), _empty_bikes())
+        if len(cubes) == 1:
+            return cubes[0]
+        cells = _categorize(pd.concat([cube.cells for cube in cubes], ignore_index=True))
+        cells = cells.groupby(DIMENSIONS, observed=True, dropna=False)['trips'].sum().reset_index()
+        bikes = pd.concat([cube.bikes for cube in cubes], ignore_index=True)
+        if bikes['bike_id'].dtype == object:
+            bikes['bike_id'] = bikes['bike_id'].astype(str).astype('category')
+        bikes = bikes.groupby(BIKE_DIMENSIONS, observed=True).agg(
+            trips=('trips', 'sum'), last_start=('last_start', 'max'), last_end=('last_end', 'max')).reset_index()
+        return cls(_categorize(cells), bikes, min(cube.first_start for cube in cubes if cube.first_start is not None))
+
+
+    def window(self, start=None, end=None):
+        '''
+        The cube for the trips starting from start up to (not including) end, to the 5-minute slot;
+        the trip counts and the per-bike table are cut at the same slots
+        '''
+        keep = _in_window(_slot_times(self.cells), start, end)
+        bike_keep = _in_window(_slot_times(self.bikes), start, end)
+        return RidershipCube(self.cells[keep].reset_index(drop=True), self.bikes[bike_keep].reset_index(drop=True))
+
+
+    def first_year(self):
+        '''
+        The first 365 days of trips, like the notebook's time_format(); the trips of the 5-minute slot
+        holding the cut-off all count, as the cube does not keep the exact start times
+        '''
+        if self.first_start is None:
+            return self
+        return self.window(end=self.first_start + pd.Timedelta(days=365))
+
+
+    def by_month(self):
+        '''
+        Trips by month & pass type, as trips.groupby([start_time.dt.to_period("M"), 'passholder_type']).size()
+        '''
+        month = self.cells['date'].dt.to_period('M').rename('start_time')
+        return self.cells.groupby([month, 'passholder_type'], observed=True)['trips'].sum()
+
+
+    def by_weekday(self):
+        '''
+        Trips by day of the week, Monday=0 to Sunday=6
+        '''
+        return self.cells.groupby('weekday')['trips'].sum().reindex(range(7), fill_value=0).to_frame('trips')
+
+
+    def by_time_of_day(self, minutes=SLOT_MINUTES):
+        '''
+        Trips by start time of day, in buckets of minutes (a multiple of SLOT_MINUTES), indexed by the
+        time on 1/1/2000 like the notebook's resampled series
+        '''
+        bucket = self.cells['slot'] // (minutes // SLOT_MINUTES)
+        counts = self.cells.groupby(bucket)['trips'].sum().reindex(range(24 * 60 // minutes), fill_value=0)
+        counts.index = pd.Timestamp(2000, 1, 1) + pd.to_timedelta(counts.index * minutes, unit='m')
+        return counts
+
+
+    def by_station(self):
+        '''
+        Origins (o_ct) & destinations (d_ct) by station ID
+        '''
+        origins = self.cells.groupby('start_station_id', observed=True)['trips'].sum().rename('o_ct')
+        destinations = self.cells.groupby('end_station_id', observed=True)['trips'].sum().rename('d_ct')
+        return pd.merge(origins.to_frame(), destinations.to_frame(), left_index=True, right_index=True)
+
+
+    def od_matrix(self):
+        '''
+        Trips from each start station (rows) to each end station (columns)
+        '''
+        return self.cells.groupby(['start_station_id', 'end_station_id'], observed=True)['trips'].sum().unstack(fill_value=0)
+
+
+    def by_bike(self):
+        '''
+        Last start time, last end time & trips of each bike, as the notebook's by_bike
+        '''
+        return self.bikes.groupby('bike_id', observed=True).agg(
+            start_time=('last_start', 'max'), end_time=('last_end', 'max'), trips=('trips', 'sum'))
+
+
+    def bike_days(self):
+        '''
+        Bikes in use & trips per day, with the trips per bike per day
+        '''
+        days = self.bikes.groupby('date').agg(bikes=('bike_id', 'nunique'), trips=('trips', 'sum'))
+        days['trips_per_bike'] = days['trips'] / days['bikes']
+        return days
+
+
+def load_cube(city, data_dir='data', cache_dir=None, workers=None):
+    '''
+    The cube of a city's trips. Partial cubes are kept per trip CSV (see trip_data.refresh_cache) and
+    only the CSVs that are new or changed since the last call are rolled up again
+
+    :param str city: Folder of the city under data_dir, e.g. 'LosAngeles'
+    :param str data_dir: Folder holding the cities
+    :param str cache_dir: Folder of the trip cache. Default is <city>/trip_cache
+    :param int workers: Processes reading trip CSVs
+    '''
+    cache_dir, files = refresh_cache(city, data_dir, cache_dir, workers)
+    cube_dir = os.path.join(cache_dir, 'cube')
+    if not os.path.isdir(cube_dir):
+        os.makedirs(cube_dir)
+    manifest = _read_manifest(cube_dir)
+
+    cubes = []
+    for name, entry in files:
+        stem = os.path.splitext(entry['parquet'])[0]
+        cells_path, bikes_path = [os.path.join(cube_dir, '%s.%s.parquet' % (stem, part)) for part in ('cells', 'bikes')]
+        cached = manifest['files'].get(name)
+        if cached is None or cached['sha1'] != entry['sha1'] or not (os.path.exists(cells_path) and os.path.exists(bikes_path)):
+            cube = RidershipCube.build(pd.read_parquet(os.path.join(cache_dir, entry['parquet'])))
+            cube.cells.to_parquet(cells_path, index=False)
+            cube.bikes.to_parquet(bikes_path, index=False)
+            first_start = cube.first_start.isoformat() if cube.first_start is not None else None
+            manifest['files'][name] = {'sha1': entry['sha1'], 'first_start': first_start}
+        else:
+            first_start = pd.Timestamp(cached['first_start']) if cached['first_start'] else None
+            cube = RidershipCube(pd.read_parquet(cells_path), pd.read_parquet(bikes_path), first_start)
+        cubes.append(cube)
+
+    # Forget the partial cubes of trip files that are gone
+    stems = set(os.path.splitext(entry['parquet'])[0] for name, entry in files)
+    manifest['files'] = dict((name, cached) for name, cached in manifest['files'].items() if name in dict(files))
+    for path in os.listdir(cube_dir):
+        if path.endswith('.parquet') and path.split('.')[0] not in stems:
+            os.remove(os.path.join(cube_dir, path))
+    _write_manifest(cube_dir, manifest)
+    return RidershipCube.merge(cubes)
+
+
+def _categorize(cells):
+
+    # The categories of each file differ, and an ID can be a number in one file and text in another
+    for name in CATEGORIES:
+        if cells[name].dtype == object:
+            cells[name] = cells[name].astype(str).where(cells[name].notna()).astype('category')
+    return cells
+
+
+def _slot_times(table):
+    return table['date'] + pd.to_timedelta(table['slot'].astype('int64') * SLOT_MINUTES, unit='m')
+
+
+def _in_window(slot_start, start, end):
+    keep = np.ones(len(slot_start), dtype=bool)
+    if start is not None:
+        keep &= (slot_start >= pd.Timestamp(start).floor('%dmin' % SLOT_MINUTES)).values
+    if end is not None:
+        keep &= (slot_start < pd.Timestamp(end)).values
+    return keep
+
+
+def _first_start(cells):
+    if not len(cells):
+        return None
+    first = cells[cells['date'] == cells['date'].min()]
+    return first['date'].iloc[0] + pd.Timedelta(minutes=int(first['slot'].min()) * SLOT_MINUTES)
+
+
+def _empty_cells():
+    return pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'), 'slot': pd.Series(dtype='int16'),
+                         'weekday': pd.Series(dtype='int8'), 'passholder_type': pd.Series(dtype='category'),
+                         'start_station_id': pd.Series(dtype='category'), 'end_station_id': pd.Series(dtype='category'),
+                         'trips': pd.Series(dtype='int32')})
+
+
+def _empty_bikes():
+    return pd.DataFrame({'bike_id': pd.Series(dtype='category'), 'date': pd.Series(dtype='datetime64[ns]'),
+                         'slot': pd.Series(dtype='int16'), 'trips': pd.Series(dtype='int32'),
+                         'last_start': pd.Series(dtype='datetime64[ns]'), 'last_end': pd.Series(dtype='datetime64[ns]')})
+
+
+def _read_manifest(cube_dir):
+    path = os.path.join(cube_dir, 'manifest.json')
+    if os.path.exists(path):
+        with open(path) as fin:
+            manifest = json.load(fin)
+        if manifest.get('version') == CUBE_VERSION:
+            return manifest
+    return {'version': CUBE_VERSION, 'files': {}}
+
+
+def _write_manifest(cube_dir, manifest):
+    with open(os.path.join(cube_dir, 'manifest.json'), 'w') as fout:
+        json.dump(manifest, fout, indent=1, sort_keys=True)
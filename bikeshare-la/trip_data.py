@@ -0,0 +1,292 @@
+'''
+Typed, cached loading of the bikeshare trip files, from the "LA Bikeshare Analysis" notebook.
+
+    trips = load_trips('LosAngeles')
+
+The notebook's load_data() read every CSV under data/<city>/trip_data with an untyped read_csv and
+time_format() parsed the start and end times again on every run. load_trips() reads the files in a
+pool of processes with explicit dtypes (categorical pass types, integer bike & station IDs, parsed
+times), renames the columns of each city to the Los Angeles names, and keeps one Parquet file per
+source CSV in data/<city>/trip_cache. The cache is keyed by a fingerprint of each source file (size,
+modification time and SHA-1), so later runs read the Parquet files and only new or changed CSVs are
+read again.
+
+To build the caches ahead of time, and compare with the notebook's loader:
+
+    python trip_data.py LosAngeles Minneapolis Boston WashingtonDC Philadelphia --workers 4 --compare
+'''
+import argparse
+import datetime
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+
+import pandas as pd
+
+
+# Format of the cache manifest
+CACHE_VERSION = 1
+
+# Columns of each city named as in the Los Angeles files
+CITY_COLUMNS = {
+    'LosAngeles':   {'start_station': 'start_station_id',
+                     'end_station': 'end_station_id'},
+    'Minneapolis':  {'Start date': 'start_time',
+                     'End date': 'end_time',
+                     'Account type': 'passholder_type',
+                     'Start terminal': 'start_station_id',
+                     'End terminal': 'end_station_id'},
+    'Boston':       {'Start date': 'start_time',
+                     'End date': 'end_time',
+                     'Member type': 'passholder_type',
+                     'Bike number': 'bike_id',
+                     'Start station number': 'start_station_id',
+                     'End station number': 'end_station_id'},
+    'WashingtonDC': {'Start date': 'start_time',
+                     'End date': 'end_time',
+                     'Member Type': 'passholder_type',
+                     'Bike#': 'bike_id'},
+}
+
+# Types of the trip columns, by their Los Angeles names; other columns are left to read_csv. The
+# integers are nullable, as some files have trips without a duration or ID
+TRIP_DTYPES = {
+    'trip_id':             'Int64',
+    'duration':            'Int32',
+    'start_station_id':    'Int32',
+    'end_station_id':      'Int32',
+    'bike_id':             'Int32',
+    'plan_duration':       'Int16',
+    'start_lat':           'float64',
+    'start_lon':           'float64',
+    'end_lat':             'float64',
+    'end_lon':             'float64',
+    'trip_route_category': 'category',
+    'passholder_type':     'category',
+}
+INTEGER_DTYPES = ('Int16', 'Int32', 'Int64')
+TIME_COLUMNS = ['start_time', 'end_time']
+
+# Timestamp formats tried on the first value of a file, before falling back to pandas' own parser
+TIME_FORMATS = ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M']
+
+
+def load_trips(city, data_dir='data', cache_dir=None, workers=None):
+    '''
+    Trips of a city, with typed columns; reads the CSVs that changed since the last call in parallel
+
+    :param str city: Folder of the city under data_dir, e.g. 'LosAngeles'
+    :param str data_dir: Folder holding the cities (trip CSVs in <city>/trip_data)
+    :param str cache_dir: Folder of the Parquet cache. Default is <city>/trip_cache
+    :param int workers: Processes reading CSVs. Default is the number of CPUs
+    '''
+    cache_dir, files = refresh_cache(city, data_dir, cache_dir, workers)
+    return _concat([pd.read_parquet(os.path.join(cache_dir, entry['parquet'])) for name, entry in files])
+
+
+def refresh_cache(city, data_dir='data', cache_dir=None, workers=None):
+    '''
+    Brings the Parquet cache of a city up to date with its trip CSVs. Returns the cache folder and the
+    manifest entry (size, mtime, sha1, rows, parquet) of each CSV, as [(CSV name, entry), ...]
+    '''
+    csvs = sorted(glob.glob(os.path.join(data_dir, city, 'trip_data', '*.csv')))
+    cache_dir = cache_dir or os.path.join(data_dir, city, 'trip_cache')
+    if not csvs:
+        raise IOError("No trip CSVs in %s" % os.path.join(data_dir, city, 'trip_data'))
+
+    manifest = _read_manifest(cache_dir)
+    entries = dict((os.path.basename(path), _cached_entry(manifest, path, cache_dir)) for path in csvs)
+    stale = [path for path in csvs if entries[os.path.basename(path)] is None]
+
+    # Read the new & changed files; each process writes its own Parquet file
+    if stale:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        jobs = [(path, CITY_COLUMNS.get(city, {}), cache_dir) for path in stale]
+        workers = min(workers or multiprocessing.cpu_count(), len(jobs))
+        if workers > 1:
+            pool = multiprocessing.Pool(workers)
+            try:
+                results = pool.map(_ingest_file, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_ingest_file(job) for job in jobs]
+        for path, entry in zip(stale, results):
+            entries[os.path.basename(path)] = entry
+
+    # Drop the cache files of CSVs that are gone, and record the new fingerprints
+    for name, entry in manifest['files'].items():
+        if name not in entries and os.path.exists(os.path.join(cache_dir, entry['parquet'])):
+            os.remove(os.path.join(cache_dir, entry['parquet']))
+    if entries != manifest['files']:
+        manifest['files'] = entries
+        _write_manifest(cache_dir, manifest)
+
+    return cache_dir, [(os.path.basename(path), entries[os.path.basename(path)]) for path in csvs]
+
+
+def read_trip_csv(path, columns=None):
+    '''
+    One trip CSV as a typed DataFrame, with the columns renamed to the Los Angeles names
+
+    :param str path: CSV file
+    :param dict columns: Source column name -> Los Angeles name (see CITY_COLUMNS)
+    '''
+    columns = columns or {}
+    header = pd.read_csv(path, nrows=0).columns
+    names = dict((source, columns.get(source, source)) for source in header)
+    dtype = dict((source, TRIP_DTYPES[name]) for source, name in names.items() if name in TRIP_DTYPES)
+    try:
+        trips = pd.read_csv(path, dtype=dtype)
+    except (ValueError, TypeError, OverflowError):
+        # Some systems have IDs that are not numbers (e.g. Boston's bike numbers); those are kept as text
+        trips = pd.read_csv(path, dtype=dict((source, 'category' if t in INTEGER_DTYPES else t)
+                                             for source, t in dtype.items()))
+        for source, t in dtype.items():
+            if t in INTEGER_DTYPES:
+                trips[source] = _integer_or_category(trips[source], t)
+
+    trips = trips.rename(columns=names)
+    for name in TIME_COLUMNS:
+        if name in trips:
+            trips[name] = parse_times(trips[name])
+    return trips
+
+
+def parse_times(values):
+    '''
+    Timestamps of a column, parsed with one format (guessed from its first value) where possible
+    '''
+    first = values.dropna()
+    if not len(first):
+        return pd.to_datetime(values)
+    for fmt in TIME_FORMATS:
+        try:
+            datetime.datetime.strptime(str(first.iloc[0]), fmt)
+        except ValueError:
+            continue
+        try:
+            return pd.to_datetime(values, format=fmt)
+        except ValueError:
+            break
+    return pd.to_datetime(values)
+
+
+def file_fingerprint(path):
+    '''
+    (size, modification time, SHA-1) of a file
+    '''
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''):
+            digest.update(block)
+    stat = os.stat(path)
+    return stat.st_size, int(stat.st_mtime), digest.hexdigest()
+
+
+def _ingest_file(job):
+    path, columns, cache_dir = job
+    size, mtime, sha1 = file_fingerprint(path)
+    trips = read_trip_csv(path, columns)
+    parquet = os.path.splitext(os.path.basename(path))[0] + '.parquet'
+    trips.to_parquet(os.path.join(cache_dir, parquet + '.tmp'), index=False)
+    _replace(os.path.join(cache_dir, parquet + '.tmp'), os.path.join(cache_dir, parquet))
+    return {'size': size, 'mtime': mtime, 'sha1': sha1, 'rows': len(trips), 'parquet': parquet}
+
+
+def _cached_entry(manifest, path, cache_dir):
+
+    # The manifest entry of a CSV if its cache file is current, else None. The SHA-1 is only worked out
+    # when the size or modification time changed, so a copied but unchanged file is not read again
+    entry = manifest['files'].get(os.path.basename(path))
+    if entry is None or not os.path.exists(os.path.join(cache_dir, entry['parquet'])):
+        return None
+    stat = os.stat(path)
+    if stat.st_size == entry['size'] and int(stat.st_mtime) == entry['mtime']:
+        return entry
+    size, mtime, sha1 = file_fingerprint(path)
+    if sha1 != entry['sha1']:
+        return None
+    return dict(entry, size=size, mtime=mtime)
+
+
+def _read_manifest(cache_dir):
+    path = os.path.join(cache_dir, 'manifest.json')
+    if os.path.exists(path):
+        with open(path) as fin:
+            manifest = json.load(fin)
+        if manifest.get('version') == CACHE_VERSION:
+            return manifest
+    return {'version': CACHE_VERSION, 'files': {}}
+
+
+def _write_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, 'manifest.json')
+    with open(path + '.tmp', 'w') as fout:
+        json.dump(manifest, fout, indent=1, sort_keys=True)
+    _replace(path + '.tmp', path)
+
+
+def _replace(src, dst):
+
+    # os.rename does not replace an existing file on Windows
+    if os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def _integer_or_category(values, dtype):
+    numbers = pd.to_numeric(values.astype(object), errors='coerce')
+    if numbers.notna().sum() == values.notna().sum():
+        return numbers.astype(dtype)
+    return values.astype(str).where(values.notna()).astype('category')
+
+
+def _concat(frames):
+
+    # Categories differ from file to file (and an ID can be a number in one file and text in another),
+    # so those columns are made categorical again over all the files
+    trips = pd.concat(frames, ignore_index=True)
+    for name in TRIP_DTYPES:
+        if name in trips and trips[name].dtype == object:
+            trips[name] = trips[name].astype(str).where(trips[name].notna()).astype('category')
+    return trips
+
+
+def _load_data(city, data_dir='data'):
+
+    # The notebook's loader, for --compare
+    csvs = glob.glob(os.path.join(data_dir, city, 'trip_data', '*.csv'))
+    trips = pd.concat((pd.read_csv(f) for f in csvs), ignore_index=True)
+    trips = trips.rename(columns=CITY_COLUMNS.get(city, {}))
+    for name in TIME_COLUMNS:
+        try:
+            trips[name] = pd.to_datetime(trips[name])
+        except ValueError:
+            # The files of a city can have different formats; newer pandas only infers one per column
+            trips[name] = pd.to_datetime(trips[name], format='mixed')
+    return trips
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Build (or refresh) the Parquet trip caches of the bikeshare cities.")
+    parser.add_argument("cities", nargs='+', help="city folders under --data-dir, e.g. LosAngeles")
+    parser.add_argument("--data-dir", default='data', help="folder holding the cities")
+    parser.add_argument("--workers", type=int, default=None, help="processes reading CSVs (default: number of CPUs)")
+    parser.add_argument("--compare", action='store_true', help="also time the notebook's untyped loader")
+    args = parser.parse_args()
+
+    for city in args.cities:
+        t0 = time.time()
+        trips = load_trips(city, args.data_dir, workers=args.workers)
+        print("%s: %d trips in %.1f s, %.1f MB" % (city, len(trips), time.time() - t0, trips.memory_usage(deep=True).sum() / 1e6))
+        if args.compare:
+            t0 = time.time()
+            trips = _load_data(city, args.data_dir)
+            print("%s (notebook loader): %d trips in %.1f s, %.1f MB" % (city, len(trips), time.time() - t0, trips.memory_usage(deep=True).sum() / 1e6))
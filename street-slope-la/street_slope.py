@@ -0,0 +1,488 @@
+'''
+Street slopes for the LA centerline, the Python version of streetslope.Rmd.
+
+    python street_slope.py --centerline Streets_Centerline.shp --intersections Data/Intersections.shp
+        --raster n35w119/floatn35w119_13.flt --raster n34w119/floatn34w119_13.flt
+        --pavement Data/Street_Pavement_Condition.shp --output shp/streets_slope.shp --summary slope_summary.csv
+
+The notebook merged the two NED tiles into one raster in memory and only took the elevation at the
+two intersections of each BOE segment. Here the tiles are memory-mapped (GridFloat .flt/.hdr, as the
+NED 1/3 arc-second tiles are also published; other formats are read window by window with rasterio),
+and each segment is also sampled every --step meters along its line, so besides the grade between
+its intersections (the notebook's slope) it gets the steepest grade along the way, the average grade
+and the total climb. Points are sampled in blocks of --window-cells cells: only that window of the
+raster is read for each block, so the whole raster is never loaded. The segments are split into tiles
+of the same size, which are sampled in a pool of --workers processes.
+
+--summary writes the length-weighted grade statistics of the streets, citywide and by street
+designation.
+'''
+import argparse
+import math
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Spacing of the elevation samples along a segment, in meters (the NED 1/3 arc-second cells are ~10 m)
+SAMPLE_STEP = 10.0
+
+# Raster cells per side of a window read at once (2048 x 2048 float32 cells is 16 MB), and of a tile of segments
+WINDOW_CELLS = 2048
+
+# Fields of the BOE centerline, BSS pavement & intersection layers, by the names used in the notebook
+CENTERLINE_FIELDS = {'asset_id': 'ASSETID', 'fromint_id': 'INT_ID_FRO', 'toint_id': 'INT_ID_TO', 'sect_id': 'SECT_ID',
+                     'street': 'STNAME', 'old_desig': 'OLD_STREET', 'new_desig': 'Street_Des'}
+PAVEMENT_FIELDS = {'sect_id': 'SECT_ID', 'width_ft': 'ZWIDTH'}
+INTERSECTION_FIELDS = {'clnode_id': 'CL_NODE_ID'}
+
+# Segments left out, as in the notebook: private / closed / unknown streets and segments of 50 m or less
+EXCLUDED_SECT_IDS = ['closed', 'private', 'none', 'outside']
+EXCLUDED_DESIGNATIONS = ['Unknown Type or Closed Street']
+MIN_LENGTH = 50.0
+
+# Grades (percent) for the share of street length steeper than each, in the summary
+GRADE_BREAKS = [5, 10, 15, 20]
+
+EARTH_RADIUS = 6371008.8
+
+
+class ElevationRaster():
+    '''
+    One elevation tile, read a window at a time. GridFloat files (.flt with its .hdr) are memory-mapped;
+    anything else is opened with rasterio
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.splitext(path)[1].lower() == '.flt':
+            header = _read_header(os.path.splitext(path)[0] + '.hdr')
+            self.nrows, self.ncols = int(header['nrows']), int(header['ncols'])
+            self.cellsize = float(header['cellsize'])
+            corner = 0.5 * self.cellsize if 'xllcenter' in header else 0.0
+            self.left = float(header.get('xllcorner', header.get('xllcenter'))) - corner
+            self.top = float(header.get('yllcorner', header.get('yllcenter'))) - corner + self.nrows * self.cellsize
+            self.nodata = float(header['nodata_value']) if 'nodata_value' in header else None
+            dtype = '>f4' if header.get('byteorder', 'lsbfirst').lower() == 'msbfirst' else '<f4'
+            self.values = np.memmap(path, dtype=dtype, mode='r', shape=(self.nrows, self.ncols))
+            self.dataset = None
+            prj = os.path.splitext(path)[0] + '.prj'
+            self.crs = open(prj).read() if os.path.exists(prj) else None
+        else:
+            import rasterio
+            self.dataset = rasterio.open(path)
+            transform = self.dataset.transform
+            self.nrows, self.ncols = self.dataset.height, self.dataset.width
+            self.cellsize, self.left, self.top = transform.a, transform.c, transform.f
+            self.nodata = self.dataset.nodata
+            self.values = None
+            self.crs = self.dataset.crs.to_wkt() if self.dataset.crs else None
+        self.right = self.left + self.ncols * self.cellsize
+        self.bottom = self.top - self.nrows * self.cellsize
+
+
+    def read_window(self, row0, row1, col0, col1):
+        '''
+        Elevations of rows row0:row1 & columns col0:col1 as float64, NaN for no data
+        '''
+        if self.values is not None:
+            window = np.array(self.values[row0:row1, col0:col1], dtype=np.float64)
+        else:
+            from rasterio.windows import Window
+            window = self.dataset.read(1, window=Window(col0, row0, col1 - col0, row1 - row0)).astype(np.float64)
+        if self.nodata is not None:
+            window[window == self.nodata] = np.nan
+        return window
+
+
+    def contains(self, x, y):
+        return (x >= self.left) & (x < self.right) & (y > self.bottom) & (y <= self.top)
+
+
+    def sample(self, x, y, method='bilinear', window_cells=WINDOW_CELLS):
+        '''
+        Elevation at each point (NaN outside the raster). 'simple' takes the cell the point is in, like
+        raster::extract(method='simple'); 'bilinear' interpolates between the four nearest cell centers.
+        The points are grouped in blocks of window_cells x window_cells cells and one window is read per block
+        '''
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        z = np.full(len(x), np.nan)
+        inside = np.flatnonzero(self.contains(x, y))
+        if not len(inside):
+            return z
+
+        # Fractional row & column of each point, from the cell centers
+        col = (x[inside] - self.left) / self.cellsize - 0.5
+        row = (self.top - y[inside]) / self.cellsize - 0.5
+        if method == 'simple':
+            row0 = np.clip(np.floor(row + 0.5), 0, self.nrows - 1).astype(np.int64)
+            col0 = np.clip(np.floor(col + 0.5), 0, self.ncols - 1).astype(np.int64)
+        else:
+            row0 = np.clip(np.floor(row), 0, max(self.nrows - 2, 0)).astype(np.int64)
+            col0 = np.clip(np.floor(col), 0, max(self.ncols - 2, 0)).astype(np.int64)
+
+        # Points of the same block are contiguous in this order
+        block = (row0 // window_cells) * (self.ncols // window_cells + 1) + col0 // window_cells
+        order = np.argsort(block, kind='mergesort')
+        bounds = np.flatnonzero(np.diff(block[order])) + 1
+        for points in np.split(order, bounds):
+            r0, c0 = row0[points].min(), col0[points].min()
+            window = self.read_window(r0, min(row0[points].max() + 2, self.nrows), c0, min(col0[points].max() + 2, self.ncols))
+            r, c = row0[points] - r0, col0[points] - c0
+            if method == 'simple':
+                z[inside[points]] = window[r, c]
+                continue
+            r1, c1 = np.minimum(r + 1, window.shape[0] - 1), np.minimum(c + 1, window.shape[1] - 1)
+            fr = np.clip(row[points] - row0[points], 0, 1)
+            fc = np.clip(col[points] - col0[points], 0, 1)
+            z[inside[points]] = ((window[r, c] * (1 - fc) + window[r, c1] * fc) * (1 - fr) +
+                                 (window[r1, c] * (1 - fc) + window[r1, c1] * fc) * fr)
+        return z
+
+
+class ElevationMosaic():
+    '''
+    Several tiles read as one raster; where they overlap the first tile wins, like raster::merge
+    '''
+
+    def __init__(self, paths):
+        self.rasters = [ElevationRaster(path) for path in paths]
+        self.cellsize = self.rasters[0].cellsize
+        self.left = min(raster.left for raster in self.rasters)
+        self.top = max(raster.top for raster in self.rasters)
+        self.crs = self.rasters[0].crs
+        self.geographic = self.crs is None or self.crs.lstrip().upper().startswith(('GEOGCS', 'GEOGCRS'))
+
+
+    def sample(self, x, y, method='bilinear', window_cells=WINDOW_CELLS):
+        '''
+        Elevation at each point. With several tiles, 'bilinear' interpolates between the four cell
+        centers around the point taken from whichever tile holds each, so there is no step at the seams
+        '''
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        if len(self.rasters) == 1:
+            return self.rasters[0].sample(x, y, method, window_cells)
+        if method == 'simple':
+            return self._cells(x, y, window_cells)
+
+        col = (x - self.left) / self.cellsize - 0.5
+        row = (self.top - y) / self.cellsize - 0.5
+        col0, row0 = np.floor(col), np.floor(row)
+        fc, fr = col - col0, row - row0
+        corner = lambda dr, dc: self._cells(self.left + (col0 + dc + 0.5) * self.cellsize, self.top - (row0 + dr + 0.5) * self.cellsize, window_cells)
+        return ((corner(0, 0) * (1 - fc) + corner(0, 1) * fc) * (1 - fr) +
+                (corner(1, 0) * (1 - fc) + corner(1, 1) * fc) * fr)
+
+
+    def _cells(self, x, y, window_cells):
+
+        # The cell under each point, from the first tile that holds it
+        z = np.full(len(x), np.nan)
+        todo = np.ones(len(x), dtype=bool)
+        for raster in self.rasters:
+            points = np.flatnonzero(todo & raster.contains(x, y))
+            if len(points):
+                z[points] = raster.sample(x[points], y[points], 'simple', window_cells)
+                todo[points] = False
+        return z
+
+
+    def tile_of(self, x, y, window_cells=WINDOW_CELLS):
+        '''
+        Tile (window_cells x window_cells cells of the first tile) holding each point, as one integer
+        '''
+        size = window_cells * self.cellsize
+        return np.floor((self.top - np.asarray(y)) / size).astype(np.int64) * 100000 + np.floor((np.asarray(x) - self.left) / size).astype(np.int64)
+
+
+def segment_profiles(lines, mosaic, step=SAMPLE_STEP, method='bilinear', window_cells=WINDOW_CELLS):
+    '''
+    Samples the elevation every step meters along each line (an (n, 2) array of x, y in the raster's
+    coordinates), all lines at once. Returns a DataFrame with the length (m), the elevation at each end,
+    the grade between the ends, the average & steepest grade along the line (percent), the climb (m, up
+    or down) and the number of samples
+    '''
+    sizes = np.array([len(line) for line in lines], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    xy = np.concatenate(lines) if len(lines) else np.zeros((0, 2))
+    segment = np.repeat(np.arange(len(lines)), sizes)
+
+    # Distance from the start of its line to each vertex
+    step_length = _distances(xy[:-1], xy[1:], mosaic.geographic) if len(xy) else np.zeros(0)
+    step_length = np.concatenate([[0.0], np.where(segment[1:] == segment[:-1], step_length, 0.0)])
+    along = np.cumsum(step_length)
+    along -= np.repeat(along[starts[:-1]], sizes) if len(lines) else 0
+    length = along[starts[1:] - 1] if len(lines) else np.zeros(0)
+
+    # Equal intervals of at most step meters, with a sample at each end
+    intervals = np.maximum(np.ceil(length / step), 1).astype(np.int64)
+    sample_starts = np.concatenate([[0], np.cumsum(intervals + 1)])
+    sample_segment = np.repeat(np.arange(len(lines)), intervals + 1)
+    k = np.arange(sample_starts[-1]) - np.repeat(sample_starts[:-1], intervals + 1)
+    sample_along = length[sample_segment] * k / intervals[sample_segment]
+
+    # The vertex before each sample: each line gets its own band of the key, wider than any line
+    band = np.concatenate([[0.0], np.cumsum(length + 1.0)])[:-1]
+    vertex = np.searchsorted(along + band[segment], sample_along + band[sample_segment], side='right') - 1
+    vertex = np.clip(vertex, starts[sample_segment], np.maximum(starts[sample_segment + 1] - 2, starts[sample_segment]))
+    following = np.minimum(vertex + 1, starts[sample_segment + 1] - 1)
+    span = along[following] - along[vertex]
+    t = np.where(span > 0, (sample_along - along[vertex]) / np.where(span > 0, span, 1), 0.0)
+    sample_xy = xy[vertex] + (xy[following] - xy[vertex]) * t[:, None]
+
+    z = mosaic.sample(sample_xy[:, 0], sample_xy[:, 1], method, window_cells)
+
+    # Grades of the intervals between consecutive samples of a line
+    rise = np.abs(np.diff(z))
+    same_line = sample_segment[1:] == sample_segment[:-1]
+    run = (length / intervals)[sample_segment[:-1]]
+    grade = np.where(same_line & (run > 0), rise / np.where(run > 0, run, 1) * 100, np.nan)
+    first_interval = sample_starts[:-1] - np.arange(len(lines))
+    grade = grade[same_line]
+    rise = rise[same_line]
+    if len(lines):
+        climb = np.add.reduceat(np.nan_to_num(rise), first_interval)
+        max_grade = np.fmax.reduceat(grade, first_interval)
+        missing = np.add.reduceat(np.isnan(rise).astype(np.int64), first_interval) > 0
+    else:
+        climb = max_grade = np.zeros(0)
+        missing = np.zeros(0, dtype=bool)
+
+    start_elev, end_elev = z[sample_starts[:-1]], z[sample_starts[1:] - 1]
+    positive = length > 0
+    return pd.DataFrame({
+        'length_m':      length,
+        'start_elev':    start_elev,
+        'end_elev':      end_elev,
+        'profile_grade': np.where(positive, np.abs(end_elev - start_elev) / np.where(positive, length, 1) * 100, np.nan),
+        'mean_grade':    np.where(positive & ~missing, climb / np.where(positive, length, 1) * 100, np.nan),
+        'max_grade':     np.where(missing, np.nan, max_grade),
+        'climb_m':       np.where(missing, np.nan, climb),
+        'samples':       intervals + 1,
+    })
+
+
+def slope_segments(lines, raster_paths, step=SAMPLE_STEP, method='bilinear', window_cells=WINDOW_CELLS, workers=None):
+    '''
+    segment_profiles() of every line, split into tiles of window_cells cells (by the first vertex of
+    each line) that are sampled in a pool of processes. The rows are in the order of lines
+    '''
+    mosaic = ElevationMosaic(raster_paths)
+    if not len(lines):
+        return segment_profiles(lines, mosaic, step, method, window_cells)
+    first = np.array([line[0] for line in lines])
+    tile = mosaic.tile_of(first[:, 0], first[:, 1], window_cells)
+    order = np.argsort(tile, kind='mergesort')
+    members = np.split(order, np.flatnonzero(np.diff(tile[order])) + 1)
+    jobs = [([lines[i] for i in m], raster_paths, step, method, window_cells) for m in members]
+
+    workers = min(workers or multiprocessing.cpu_count(), len(jobs))
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(_profile_tile, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        # A mosaic per tile here too, so the pages mapped for one tile are let go before the next
+        results = [_profile_tile(job) for job in jobs]
+
+    profiles = pd.concat(results, ignore_index=True)
+    profiles.index = np.concatenate(members)
+    return profiles.sort_index()
+
+
+def street_slopes(centerline, intersections, raster_paths, pavement=None, step=SAMPLE_STEP, method='bilinear',
+                  window_cells=WINDOW_CELLS, workers=None, keep_all=False):
+    '''
+    The notebook's streets table, with the profile of each segment: a DataFrame with the centerline
+    fields, the elevation of the intersections at each end & the grade between them ('slope'), and the
+    columns of segment_profiles(). Also returns the line of each row
+
+    :param str centerline: BOE street centerline (Streets_Centerline.shp)
+    :param str intersections: Intersections layer, with the CL_NODE_ID of the segment ends
+    :param list raster_paths: Elevation tiles (NED 1/3 arc-second), first one wins where they overlap
+    :param str pavement: BSS Street Pavement Condition layer, for the street width (optional)
+    :param float step: Spacing of the samples along each segment, in meters
+    :param str method: 'bilinear' or 'simple' (the cell under each point, as in the notebook)
+    :param int window_cells: Cells per side of a raster window & of a tile of segments
+    :param int workers: Processes sampling the tiles. Default is the number of CPUs
+    :param bool keep_all: Keep the private / closed / unknown streets & the short segments
+    '''
+    mosaic = ElevationMosaic(raster_paths)
+    streets, lines = read_layer(centerline, CENTERLINE_FIELDS, mosaic.crs)
+    nodes, points = read_layer(intersections, INTERSECTION_FIELDS, mosaic.crs)
+
+    # Elevation of each intersection, joined to both ends of the segments
+    nodes['int_elev'] = mosaic.sample([p[0][0] for p in points], [p[0][1] for p in points], method, window_cells)
+    nodes = nodes.drop_duplicates('clnode_id')
+    streets = streets.merge(nodes.rename(columns={'clnode_id': 'fromint_id', 'int_elev': 'from_elev'}), how='left', on='fromint_id')
+    streets = streets.merge(nodes.rename(columns={'clnode_id': 'toint_id', 'int_elev': 'to_elev'}), how='left', on='toint_id')
+
+    profiles = slope_segments(lines, raster_paths, step, method, window_cells, workers)
+    streets = pd.concat([streets, profiles.reset_index(drop=True)], axis=1)
+    streets['slope'] = (streets['from_elev'] - streets['to_elev']).abs() / streets['length_m'] * 100
+
+    keep = np.ones(len(streets), dtype=bool)
+    if not keep_all:
+        keep = (streets['sect_id'].notna() & ~streets['sect_id'].astype(str).isin(EXCLUDED_SECT_IDS) &
+                streets['old_desig'].notna() & ~streets['old_desig'].isin(EXCLUDED_DESIGNATIONS) &
+                (streets['length_m'] > MIN_LENGTH)).values
+
+    # Street width from the pavement layer; SECT_ID is 1:many, so the first width is kept for each segment
+    if pavement:
+        widths, _ = read_layer(pavement, PAVEMENT_FIELDS, None, geometry=False)
+        widths['sect_id'] = widths['sect_id'].astype(str)
+        streets['sect_id'] = streets['sect_id'].astype(str).where(streets['sect_id'].notna())
+        streets = streets.merge(widths.drop_duplicates('sect_id'), how='left', on='sect_id')
+
+    return streets[keep].reset_index(drop=True), [line for line, k in zip(lines, keep) if k]
+
+
+def length_weighted_stats(streets, by='new_desig'):
+    '''
+    Length-weighted grade statistics, citywide and for each value of the by column: total length (km),
+    mean of the segment grades weighted by length, the same for the steepest grade of each segment, and
+    the share of the length steeper than each of GRADE_BREAKS
+    '''
+    def stats(group):
+        valid = group[group['slope'].notna() & (group['length_m'] > 0)]
+        weights = valid['length_m']
+        row = {'segments': len(group), 'length_km': group['length_m'].sum() / 1000.0,
+               'grade': np.average(valid['slope'], weights=weights) if len(valid) else np.nan,
+               'mean_grade': _weighted(valid['mean_grade'], weights), 'max_grade': _weighted(valid['max_grade'], weights)}
+        for grade in GRADE_BREAKS:
+            row['share_over_%d' % grade] = weights[valid['slope'] > grade].sum() / weights.sum() if len(valid) else np.nan
+        return pd.Series(row)
+
+    columns = ['segments', 'length_km', 'grade', 'mean_grade', 'max_grade'] + ['share_over_%d' % grade for grade in GRADE_BREAKS]
+    rows = [('All', stats(streets))] + [(name, stats(group)) for name, group in streets.groupby(by)]
+    return pd.DataFrame([row for name, row in rows], index=pd.Index([name for name, row in rows], name=by))[columns]
+
+
+def read_layer(path, fields, crs=None, geometry=True):
+    '''
+    The fields of a vector layer (renamed from fields' values to its keys) as a DataFrame, and the
+    coordinates of each feature as (n, 2) arrays, reprojected to crs (a WKT) when it differs
+    '''
+    import fiona
+    records, shapes = [], []
+    with fiona.open(path) as layer:
+        transform = _transformer(layer.crs_wkt, crs) if geometry else None
+        for feature in layer:
+            properties = feature['properties']
+            records.append(dict((name, properties.get(source)) for name, source in fields.items()))
+            if geometry:
+                shapes.append(_coordinates(feature['geometry'], transform))
+    table = pd.DataFrame.from_records(records, columns=list(fields))
+    return table, shapes
+
+
+def write_layer(streets, lines, path, crs=None):
+    '''
+    The streets as a CSV, or with their lines as a shapefile / GeoPackage (by the extension of path)
+    '''
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        streets.to_csv(path, index=False)
+        return
+    import fiona
+    drivers = {'.shp': 'ESRI Shapefile', '.gpkg': 'GPKG'}
+    if extension not in drivers:
+        raise ValueError("Unknown output format %s; use .csv, .shp or .gpkg" % path)
+    types = dict((name, 'float' if streets[name].dtype.kind == 'f' else 'int' if streets[name].dtype.kind in 'iu' else 'str')
+                 for name in streets.columns)
+    schema = {'geometry': 'LineString', 'properties': [(name[:10] if extension == '.shp' else name, types[name]) for name in streets.columns]}
+    with fiona.open(path, 'w', driver=drivers[extension], schema=schema, crs_wkt=crs) as out:
+        for row, line in zip(streets.itertuples(index=False), lines):
+            properties = dict((name, None if _missing(value) else str(value) if t == 'str' else value.item() if hasattr(value, 'item') else value)
+                              for (name, t), value in zip(schema['properties'], row))
+            out.write({'geometry': {'type': 'LineString', 'coordinates': [tuple(p) for p in line]}, 'properties': properties})
+
+
+def _profile_tile(job):
+    lines, raster_paths, step, method, window_cells = job
+    return segment_profiles(lines, ElevationMosaic(raster_paths), step, method, window_cells)
+
+
+def _distances(a, b, geographic):
+
+    # Great circle distance (m) between lon/lat points, or planar distance for projected coordinates
+    if not geographic:
+        return np.hypot(b[:, 0] - a[:, 0], b[:, 1] - a[:, 1])
+    lon1, lat1, lon2, lat2 = [np.radians(v) for v in (a[:, 0], a[:, 1], b[:, 0], b[:, 1])]
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(h, 1)))
+
+
+def _coordinates(geometry, transform):
+
+    # Vertices of a point, line or multi-part line, with the parts of a multi-part line one after the other
+    if geometry is None:
+        return np.full((1, 2), np.nan)
+    kind, coords = geometry['type'], geometry['coordinates']
+    if kind == 'Point':
+        coords = [coords]
+    elif kind == 'MultiLineString':
+        coords = [p for part in coords for p in part]
+    xy = np.array([p[:2] for p in coords], dtype=np.float64)
+    if transform is not None and len(xy):
+        xy[:, 0], xy[:, 1] = transform.transform(xy[:, 0], xy[:, 1])
+    return xy
+
+
+def _transformer(source_wkt, target_wkt):
+
+    # A pyproj transformer between two CRS, or None when either is unknown or they are the same
+    if not source_wkt or not target_wkt:
+        return None
+    from pyproj import CRS, Transformer
+    source, target = CRS.from_wkt(source_wkt), CRS.from_wkt(target_wkt)
+    if source == target:
+        return None
+    return Transformer.from_crs(source, target, always_xy=True)
+
+
+def _read_header(path):
+    with open(path) as fin:
+        return dict((line.split()[0].lower(), line.split()[1]) for line in fin if len(line.split()) >= 2)
+
+
+def _weighted(values, weights):
+    valid = values.notna()
+    return np.average(values[valid], weights=weights[valid]) if valid.any() else np.nan
+
+
+def _missing(value):
+    try:
+        return value is None or (isinstance(value, float) and math.isnan(value)) or value is pd.NA
+    except TypeError:
+        return False
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Grade of each street segment of the LA centerline, from the NED elevation tiles.")
+    parser.add_argument("--centerline", required=True, help="BOE street centerline (Streets_Centerline.shp)")
+    parser.add_argument("--intersections", default=os.path.join('Data', 'Intersections.shp'), help="intersections with the CL_NODE_ID of the segment ends")
+    parser.add_argument("--raster", action='append', required=True, help="elevation tile (.flt GridFloat is memory-mapped, other formats need rasterio); repeat for each tile")
+    parser.add_argument("--pavement", default=None, help="BSS Street Pavement Condition layer, for the street widths")
+    parser.add_argument("--output", default=os.path.join('shp', 'streets_slope.shp'), help="output .shp, .gpkg or .csv")
+    parser.add_argument("--summary", default=None, help="CSV of the length-weighted grade statistics, citywide & by street designation")
+    parser.add_argument("--step", type=float, default=SAMPLE_STEP, help="meters between the samples along a segment")
+    parser.add_argument("--method", choices=['bilinear', 'simple'], default='bilinear', help="'simple' takes the cell under each point, as the notebook did")
+    parser.add_argument("--window-cells", type=int, default=WINDOW_CELLS, help="raster cells per side of a window read at once, and of a tile of segments")
+    parser.add_argument("--workers", type=int, default=None, help="processes sampling the tiles (default: number of CPUs)")
+    parser.add_argument("--keep-all", action='store_true', help="keep private / closed / unknown streets and segments of 50 m or less")
+    args = parser.parse_args()
+
+    streets, lines = street_slopes(args.centerline, args.intersections, args.raster, args.pavement, args.step, args.method,
+                                   args.window_cells, args.workers, args.keep_all)
+    write_layer(streets, lines, args.output, ElevationMosaic(args.raster).crs)
+    print("%d segments, %.0f km; steepest: %s" % (len(streets), streets['length_m'].sum() / 1000.0,
+          ", ".join("%s %.1f%%" % (row.street, row.slope) for row in streets[streets['length_m'] > 150].nlargest(5, 'slope').itertuples())))
+    if args.summary:
+        length_weighted_stats(streets).to_csv(args.summary)
@@ -0,0 +1,417 @@
+'''
+TF-IDF string matching, from the "String Matching at Scale" notebook.
+
+    titlematch = StringMatch(source_titles, target_titles)
+    titlematch.tokenize()
+    match_df = titlematch.match()
+
+For large jobs, match() can split the source strings into blocks and run the top-n sparse product of
+each block in a pool of processes; match_chunks() streams the matches of each block as it finishes:
+
+    match_df = titlematch.match(workers=8, max_memory_mb=4000)
+
+    for matches in titlematch.match_chunks(workers=8, chunk_rows=5000):
+        ...  # [(row idx, title, candidate idx, candidate title, score), ...]
+
+Only the target matrix, the block being multiplied and the top-n results are held by each process,
+so memory is bounded by the size of the target rather than by the size of the source.
+
+When the same target list is matched against again and again, TargetIndex saves its vectorized form
+once and memory-maps it on load, so a lookup only has to vectorize the source strings.
+'''
+import json
+import multiprocessing
+import os
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+from sklearn.preprocessing import normalize
+from scipy.sparse import csr_matrix
+import pandas as pd
+
+try:
+    # sparse_dot_topn >= 1.0
+    from sparse_dot_topn import sp_matmul_topn
+except ImportError:
+    # Older releases, as used in the notebook
+    sp_matmul_topn = None
+    import sparse_dot_topn.sparse_dot_topn as ct
+
+
+# Source rows per block when neither chunk_rows nor max_memory_mb is given
+DEFAULT_CHUNK_ROWS = 10000
+
+# Format of the files written by TargetIndex.save()
+INDEX_VERSION = 1
+
+
+class StringMatch():
+
+    def __init__(self, source_names, target_names):
+        self.source_names = source_names
+        self.target_names = target_names
+        self.ct_vect      = None
+        self.tfidf_vect   = None
+        self.vocab        = None
+        self.sprse_mtx    = None
+
+
+    def tokenize(self, analyzer='char_wb', n=3):
+        '''
+        Tokenizes the list of strings, based on the selected analyzer
+
+        :param str analyzer: Type of analyzer ('char_wb', 'word'). Default is trigram
+        :param str n: If using n-gram analyzer, the gram length
+        '''
+        # Create initial count vectorizer & fit it on both lists to get vocab
+        self.ct_vect = CountVectorizer(analyzer=analyzer, ngram_range=(n, n))
+        self.vocab   = self.ct_vect.fit(self.source_names + self.target_names).vocabulary_
+
+        # Create tf-idf vectorizer
+        self.tfidf_vect  = TfidfVectorizer(vocabulary=self.vocab, analyzer=analyzer, ngram_range=(n, n))
+
+
+    def match(self, ntop=1, lower_bound=0, output_fmt='df', chunk_rows=None, workers=None, max_memory_mb=None):
+        '''
+        Main match function. Default settings return only the top candidate for every source string.
+
+        :param int ntop: The number of top-n candidates that should be returned
+        :param float lower_bound: The lower-bound threshold for keeping a candidate, between 0-1.
+                                   Default set to 0, so consider all canidates
+        :param str output_fmt: The output format. Either dataframe ('df') or dict ('dict')
+        :param int chunk_rows: Match the source strings in blocks of this many rows (see match_chunks)
+        :param int workers: Number of processes matching blocks; implies chunked matching
+        :param int max_memory_mb: Memory ceiling for chunked matching, used to size the blocks
+        '''
+        if chunk_rows or workers or max_memory_mb:
+            self._chunked_cossim_top(ntop, lower_bound, chunk_rows, workers, max_memory_mb)
+        else:
+            self._awesome_cossim_top(ntop, lower_bound)
+
+        if output_fmt == 'df':
+            match_output = self._make_matchdf()
+        elif output_fmt == 'dict':
+            match_output = self._make_matchdict()
+
+        return match_output
+
+
+    def match_chunks(self, ntop=1, lower_bound=0, chunk_rows=None, workers=None, max_memory_mb=None):
+        '''
+        Generator of matches, one list per block of source rows, in the order the blocks finish.
+
+        :param int ntop: The number of top-n candidates that should be returned
+        :param float lower_bound: The lower-bound threshold for keeping a candidate, between 0-1
+        :param int chunk_rows: Source rows per block. Default is sized from max_memory_mb, or 10,000
+        :param int workers: Number of processes. Default is one per core
+        :param int max_memory_mb: Ceiling for the memory of all workers together (estimated)
+
+        Yields: A list of (row idx, title, candidate idx, candidate title, score) tuples
+        '''
+        for rows, cols, vals in self._block_products(ntop, lower_bound, chunk_rows, workers, max_memory_mb):
+            yield [(row, self.source_names[row], col, self.target_names[col], val)
+                   for row, col, val in zip(rows.tolist(), cols.tolist(), vals.tolist())]
+
+
+    def _vectorize(self):
+        ''' Source & (transposed) target tf-idf matrices '''
+        A = self.tfidf_vect.fit_transform(self.source_names).tocsr()
+        B = self.tfidf_vect.fit_transform(self.target_names).transpose().tocsr()
+        return A, B
+
+
+    def _awesome_cossim_top(self, ntop, lower_bound):
+        ''' https://gist.github.com/ymwdalex/5c363ddc1af447a9ff0b58ba14828fd6#file-awesome_sparse_dot_top-py '''
+        A, B = self._vectorize()
+        self.sprse_mtx = _topn_product(A, B, ntop, lower_bound)
+
+
+    def _chunked_cossim_top(self, ntop, lower_bound, chunk_rows, workers, max_memory_mb):
+        ''' Same result as _awesome_cossim_top, computed block by block '''
+        rows, cols, vals = [], [], []
+        for block_rows, block_cols, block_vals in self._block_products(ntop, lower_bound, chunk_rows, workers, max_memory_mb):
+            rows.append(block_rows)
+            cols.append(block_cols)
+            vals.append(block_vals)
+
+        # Blocks can finish in any order; rebuild the CSR matrix sorted by row
+        rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+        order = np.argsort(rows, kind='stable')
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(self.source_names)))])
+        self.sprse_mtx = csr_matrix((vals[order], cols[order], indptr), shape=(len(self.source_names), len(self.target_names)))
+
+
+    def _block_products(self, ntop, lower_bound, chunk_rows, workers, max_memory_mb):
+        ''' (rows, cols, scores) arrays for each block of source rows, as the blocks finish '''
+        A, B = self._vectorize()
+        workers = workers or multiprocessing.cpu_count()
+        if not chunk_rows:
+            chunk_rows = _chunk_rows(A, B, ntop, workers, max_memory_mb) if max_memory_mb else DEFAULT_CHUNK_ROWS
+        blocks = ((start, A[start:start + chunk_rows]) for start in range(0, A.shape[0], chunk_rows))
+
+        if workers == 1:
+            _init_worker(B, ntop, lower_bound)
+            for block in blocks:
+                yield _match_block(block)
+            return
+
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(B, ntop, lower_bound))
+        try:
+            for result in pool.imap_unordered(_match_block, blocks):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+    def _make_matchdf(self):
+        ''' Build dataframe for result return '''
+        return _make_matchdf(self.sprse_mtx, self.source_names, self.target_names)
+
+
+    def _make_matchdict(self):
+        ''' Build dictionary for result return '''
+        return _make_matchdict(self.sprse_mtx)
+
+
+class TargetIndex():
+    '''
+    A target list that is vectorized once and saved to disk: the fitted vocabulary, the IDF weights and
+    the transposed tf-idf matrix. Loading memory-maps the matrix & names, so it takes milliseconds and
+    processes loading the same index share its pages; a lookup only vectorizes the source strings and
+    runs the sparse product.
+
+        index = TargetIndex.build(imdb_ttl_list)
+        index.save('imdb_index')
+
+        index = TargetIndex.load('imdb_index')
+        match_df = index.match(['Confessional, The (Confessionnal, Le) (1995)'])
+
+    The source strings are weighted with the target's IDF, so scores can differ slightly from
+    StringMatch.match(), which fits the weights on each list separately.
+    '''
+
+    def __init__(self, vocab, idf, B, target_names, analyzer='char_wb', n=3):
+        self.vocab        = vocab
+        self.idf          = idf
+        self.B            = B
+        self.target_names = target_names
+        self.analyzer     = analyzer
+        self.n            = n
+        self.ct_vect      = CountVectorizer(vocabulary=vocab, analyzer=analyzer, ngram_range=(n, n))
+        self._target_rows = None
+
+
+    @classmethod
+    def build(cls, target_names, analyzer='char_wb', n=3):
+        '''
+        Fits the vocabulary & IDF weights on the target list and builds its tf-idf matrix
+
+        :param list target_names: The strings to match to
+        :param str analyzer: Type of analyzer ('char_wb', 'word'). Default is trigram
+        :param int n: If using n-gram analyzer, the gram length
+        '''
+        tfidf_vect = TfidfVectorizer(analyzer=analyzer, ngram_range=(n, n))
+        B = tfidf_vect.fit_transform(target_names).transpose().tocsr()
+        vocab = dict((gram, int(col)) for gram, col in tfidf_vect.vocabulary_.items())
+        return cls(vocab, tfidf_vect.idf_, B, list(target_names), analyzer, n)
+
+
+    def save(self, path):
+        '''
+        Writes the index to the folder path (created if needed): .npy arrays for the matrix, the IDF
+        weights and the name offsets, the names as one UTF-8 file, and the vocabulary as JSON
+        '''
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, 'indptr.npy'), np.asarray(self.B.indptr))
+        np.save(os.path.join(path, 'indices.npy'), np.asarray(self.B.indices))
+        np.save(os.path.join(path, 'data.npy'), np.asarray(self.B.data))
+        np.save(os.path.join(path, 'idf.npy'), np.asarray(self.idf))
+
+        encoded = [name.encode('utf-8') for name in self.target_names]
+        np.save(os.path.join(path, 'name_offsets.npy'), np.concatenate([[0], np.cumsum([len(e) for e in encoded])]).astype(np.int64))
+        with open(os.path.join(path, 'names.bin'), 'wb') as fout:
+            fout.write(b''.join(encoded))
+
+        with open(os.path.join(path, 'index.json'), 'w') as fout:
+            json.dump({'version': INDEX_VERSION, 'analyzer': self.analyzer, 'n': self.n,
+                       'shape': list(self.B.shape), 'vocab': self.vocab}, fout)
+
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Opens an index written by save(); the arrays & names are memory-mapped, not read
+
+        :param str path: The index folder
+        '''
+        with open(os.path.join(path, 'index.json')) as fin:
+            meta = json.load(fin)
+        if meta['version'] != INDEX_VERSION:
+            raise ValueError('%s is a version %s index, expected version %s' % (path, meta['version'], INDEX_VERSION))
+
+        # Copy-on-write maps: the pages are still shared between processes (nothing writes to them),
+        # and sparse_dot_topn >= 1.0 does not accept read-only arrays
+        arrays = dict((name, np.load(os.path.join(path, name + '.npy'), mmap_mode='c'))
+                      for name in ('indptr', 'indices', 'data', 'idf', 'name_offsets'))
+        B = csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(meta['shape']), copy=False)
+        names = _NameList(np.memmap(os.path.join(path, 'names.bin'), dtype=np.uint8, mode='r'), arrays['name_offsets'])
+        return cls(meta['vocab'], arrays['idf'], B, names, meta['analyzer'], meta['n'])
+
+
+    def vectorize(self, source_names):
+        ''' Tf-idf matrix of the source strings, with the target's vocabulary & IDF weights '''
+        counts = self.ct_vect.transform(source_names).astype(np.float64)
+        return normalize(counts.multiply(np.asarray(self.idf)).tocsr())
+
+
+    def match(self, source_names, ntop=1, lower_bound=0, output_fmt='df'):
+        '''
+        Top candidates in the target list for each source string
+
+        :param list source_names: The strings to match
+        :param int ntop: The number of top-n candidates that should be returned
+        :param float lower_bound: The lower-bound threshold for keeping a candidate, between 0-1
+        :param str output_fmt: The output format. Either dataframe ('df') or dict ('dict')
+        '''
+        sprse_mtx = self.match_vectors(self.vectorize(source_names), ntop, lower_bound)
+        if output_fmt == 'df':
+            return _make_matchdf(sprse_mtx, source_names, self.target_names)
+        elif output_fmt == 'dict':
+            return _make_matchdict(sprse_mtx)
+
+
+    def match_vectors(self, A, ntop=1, lower_bound=0):
+        '''
+        Top-n sparse matrix (source rows x target columns) for source strings that are already
+        vectorized, e.g. rows of one vectorize() call spread over several subset() indexes
+        '''
+        return _topn_product(A, self.B, ntop, lower_bound)
+
+
+    def subset(self, target_idx):
+        '''
+        Index over some of the targets, with the same vocabulary & IDF weights, so scores do not change;
+        used to match a block of sources against only its candidate targets. Candidate indexes in its
+        matches are positions in target_idx
+
+        :param list target_idx: Positions of the targets to keep
+        '''
+        if self._target_rows is None:
+            self._target_rows = self.B.transpose().tocsr()
+        B = self._target_rows[np.asarray(target_idx, dtype=np.int64)].transpose().tocsr()
+        return TargetIndex(self.vocab, self.idf, B, [self.target_names[i] for i in target_idx], self.analyzer, self.n)
+
+
+class _NameList():
+    ''' Read-only list of the target names, decoded from the memory-mapped names file when accessed '''
+
+    def __init__(self, blob, offsets):
+        self.blob    = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+
+def _make_matchdf(sprse_mtx, source_names, target_names):
+    ''' Build dataframe for result return '''
+    # CSR matrix -> COO matrix
+    cx = sprse_mtx.tocoo()
+
+    # COO matrix to list of tuples
+    match_list = []
+    for row,col,val in zip(cx.row, cx.col, cx.data):
+        match_list.append((row, source_names[row], col, target_names[col], val))
+
+    # List of tuples to dataframe
+    colnames = ['Row Idx', 'Title', 'Candidate Idx', 'Candidate Title', 'Score']
+    match_df = pd.DataFrame(match_list, columns=colnames)
+
+    return match_df
+
+
+def _make_matchdict(sprse_mtx):
+    ''' Build dictionary for result return '''
+    # CSR matrix -> COO matrix
+    cx = sprse_mtx.tocoo()
+
+    # dict value should be tuple of values
+    match_dict = {}
+    for row,col,val in zip(cx.row, cx.col, cx.data):
+        if match_dict.get(row):
+            match_dict[row].append((col,val))
+        else:
+            match_dict[row] = [(col, val)]
+
+    return match_dict
+
+
+def _topn_product(A, B, ntop, lower_bound):
+    ''' A * B, keeping only the ntop largest values above lower_bound in each row '''
+    if sp_matmul_topn is not None:
+        return sp_matmul_topn(A, B, top_n=ntop, threshold=lower_bound)
+
+    M, _ = A.shape
+    _, N = B.shape
+
+    idx_dtype = np.int32
+
+    nnz_max = M * ntop
+
+    indptr = np.zeros(M+1, dtype=idx_dtype)
+    indices = np.zeros(nnz_max, dtype=idx_dtype)
+    data = np.zeros(nnz_max, dtype=A.dtype)
+
+    ct.sparse_dot_topn(
+        M, N, np.asarray(A.indptr, dtype=idx_dtype),
+        np.asarray(A.indices, dtype=idx_dtype),
+        A.data,
+        np.asarray(B.indptr, dtype=idx_dtype),
+        np.asarray(B.indices, dtype=idx_dtype),
+        B.data,
+        ntop,
+        lower_bound,
+        indptr, indices, data)
+
+    return csr_matrix((data,indices,indptr), shape=(M,N))
+
+
+def _chunk_rows(A, B, ntop, workers, max_memory_mb):
+    '''
+    Source rows per block so that the estimated memory of all workers stays under max_memory_mb:
+    each worker holds a copy of B, scratch space for one accumulator per target column, and one block
+    of A with its top-n results (twice, while it is sent back to the parent).
+    '''
+    b_bytes = B.data.nbytes + B.indices.nbytes + B.indptr.nbytes
+    scratch_bytes = B.shape[1] * 16
+    row_bytes = (A.data.nbytes + A.indices.nbytes) / float(max(A.shape[0], 1)) + 8 + ntop * 16
+    available = max_memory_mb * 2 ** 20 - workers * (b_bytes + scratch_bytes)
+    if available <= 0:
+        raise MemoryError('%d workers need about %d MB for their copies of the target matrix; '
+                          'raise max_memory_mb or use fewer workers' % (workers, workers * (b_bytes + scratch_bytes) / 2 ** 20))
+    return int(max(1, available / (workers * 2 * row_bytes)))
+
+
+# Target matrix & settings of a worker process, set by _init_worker
+_worker_state = {}
+
+def _init_worker(B, ntop, lower_bound):
+    ''' Keeps the target matrix in the worker, so it is sent once instead of with every block '''
+    _worker_state.update(B=B, ntop=ntop, lower_bound=lower_bound)
+
+
+def _match_block(block):
+    ''' Top-n product of one block of source rows; rows are numbered within the whole source '''
+    start, A_block = block
+    cx = _topn_product(A_block, _worker_state['B'], _worker_state['ntop'], _worker_state['lower_bound']).tocoo()
+    return cx.row.astype(np.int64) + start, cx.col.astype(np.int64), cx.data
@@ -0,0 +1,128 @@
+#### BOE Intersection Cleaning #####
+
+#### The first cleaning steps of ArcPy_boe_Int.py in a single pass over the intersection layer: each
+#### point is routed to the table of every category it falls in (empty TO/FROM, dead-end, freeway) or,
+#### if none, has its street names uppercased & alphabetized and goes to the cleaned table. All four
+#### tables are written while the layer is read, a batch of rows at a time, so memory does not grow with
+#### the size of the layer and the street names are never matched back to their rows by position.
+####
+####     python CleanIntersections.py --workspace /data/boe.gpkg --input raw_intersections
+####
+#### Tables are read & written through Common/DataAccess.py; the point locations are written as X and Y
+#### fields.
+
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+import DataAccess as da
+from DataAccess import env
+
+##### Input #####
+env.workspace = "Z:/GIS/DataLibrary/Transportation/BOE_Centerline_Intersections150930/boe_output.gdb"
+raw_int = "raw_intersections"
+boe_int = "StreetIntersections"
+
+# Output table of each removed category (the same as ArcPy_boe_Int.py)
+CategoryTables = OrderedDict([("empty", "boe_int_empty"), ("dead_end", "boe_int_DE"), ("freeway", "boe_int_fwy")])
+
+# Fields that are not copied to the output (geometry & object IDs of the input)
+SkipFields = ["SHAPE", "GEOM", "GEOMETRY", "OBJECTID", "FID", "OID"]
+
+# AssetID & CL_NODE_ID are converted to strings, like the field mapping of ArcPy_boe_Int.py
+IdFields = ["ASSETID", "CL_NODE_ID"]
+
+
+##### Rules #####
+def Categories(values):
+
+    # Removed categories a point falls in; the expressions of ArcPy_boe_Int.py:
+    #   "FROM_ST" = '' AND "TO_ST" = ''   "TO_ST" = 'D/E'   "TOOLTIP" LIKE '%FRWY%'
+    from_st, to_st = values.get("FROM_ST") or "", values.get("TO_ST") or ""
+    categories = []
+    if from_st == "" and to_st == "":
+        categories.append("empty")
+    if to_st == "D/E":
+        categories.append("dead_end")
+    if "FRWY" in (values.get("TOOLTIP") or ""):
+        categories.append("freeway")
+    return categories
+
+
+def RemovedReason(values):
+
+    # First removed category of a point, None if it is kept
+    categories = Categories(values)
+    return categories[0] if categories else None
+
+
+def StreetPair(values):
+
+    # FROM_ST & TO_ST in alphabetical order, upper case
+    from_st, to_st = str(values.get("FROM_ST") or "").upper(), str(values.get("TO_ST") or "").upper()
+    return (from_st, to_st) if from_st < to_st else (to_st, from_st)
+
+
+def IdText(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def InputFields(table, xy_fields=None):
+    return [f for f in da.ListFields(table) if f.upper() not in SkipFields and f not in (xy_fields or [])]
+
+
+##### Main Function #####
+def CleanIntersections(in_table, out_table=boe_int, category_tables=CategoryTables, xy_fields=None):
+
+    # Returns the number of rows written to each output
+    t0 = time.time()
+    fields = InputFields(in_table, xy_fields)
+    shape = list(xy_fields) if xy_fields else ["SHAPE@XY"]
+    out_fields = fields + ["X", "Y"]
+    field_types = dict((f, "String") for f in IdFields + ["FROM_ST", "TO_ST", "TOOLTIP"] if f in fields)
+    field_types.update(X="Real", Y="Real")
+
+    cursors = OrderedDict((name, da.InsertCursor(table, out_fields, field_types)) for name, table in category_tables.items())
+    cursors["kept"] = da.InsertCursor(out_table, out_fields, field_types)
+    try:
+        for row in da.SearchCursor(in_table, fields + shape):
+            values = dict(zip(fields, row))
+            x, y = row[len(fields):] if xy_fields else (row[-1] or (None, None))
+            for id_field in IdFields:
+                if id_field in values:
+                    values[id_field] = IdText(values[id_field])
+
+            categories = Categories(values)
+            if not categories:
+                values["FROM_ST"], values["TO_ST"] = StreetPair(values)
+                categories = ["kept"]
+            out_row = [values[f] for f in fields] + [x, y]
+            for category in categories:
+                cursors[category].insertRow(out_row)
+    finally:
+        for cursor in cursors.values():
+            cursor.close()
+
+    counts = OrderedDict((name, cursor.count) for name, cursor in cursors.items())
+    print("Cleaned %s in %.1f s: %s" % (in_table, time.time() - t0, ", ".join("%d %s" % (n, name) for name, n in counts.items())))
+    return counts
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Route empty, dead-end & freeway BOE intersection points to their own tables and alphabetize the street names of the rest.")
+    parser.add_argument("--workspace", default=env.workspace, help="geodatabase, GeoPackage, SQLite file or folder holding the intersection table")
+    parser.add_argument("--input", default=raw_int, help="intersection points")
+    parser.add_argument("--output", default=boe_int, help="table for the kept intersections (written to the workspace)")
+    parser.add_argument("--xy-fields", default=None, help="X,Y fields to read the location from, for tables without geometry (e.g. CSV)")
+    args = parser.parse_args()
+
+    env.workspace = args.workspace
+    CleanIntersections(args.input, args.output, CategoryTables, args.xy_fields.split(",") if args.xy_fields else None)
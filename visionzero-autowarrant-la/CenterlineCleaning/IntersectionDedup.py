@@ -0,0 +1,138 @@
+#### BOE Intersection Deduplication #####
+
+#### Does the cleaning of ArcPy_boe_Int.py without ArcGIS: drops the empty, dead-end and freeway
+#### intersection points, then merges duplicate points in one pass instead of FindIdentical plus one
+#### Integrate per FEAT_SEQ group. Points are duplicates when they have the same street pair (FROM_ST and
+#### TO_ST in either order, ignoring case) and lie within the tolerance of each other, directly or through
+#### a chain of duplicates. Each group becomes one point at the mean of its locations, with the ASSETIDs
+#### and CL_NODE_IDs of the group joined by "_".
+####
+#### Points are put in a grid with cells as wide as the tolerance, so each point is only compared with
+#### the points of the same street pair in its own and the 8 neighbouring cells:
+####
+####     python IntersectionDedup.py --workspace /data/boe.gpkg --input StreetIntersections --output StreetIntersections_clean
+####
+#### The input is read through Common/DataAccess.py (GeoPackage / file geodatabase points, or a CSV or
+#### Parquet table with --xy-fields); the cleaned table is written with X and Y fields in one write.
+
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+import DataAccess as da
+from DataAccess import env
+from CleanIntersections import RemovedReason, StreetPair, IdText, InputFields
+
+##### Input #####
+env.workspace = "Z:/GIS/DataLibrary/Transportation/BOE_Centerline_Intersections150930/boe_output.gdb"
+boe_int = "StreetIntersections"
+boe_int_clean = "StreetIntersections_clean"
+xy_tol = 200  # in the units of the coordinates (feet for State Plane CA V)
+
+
+##### Read & Filter #####
+def ReadIntersections(table, xy_fields=None):
+
+    # Returns the copied field names and a list of (fields dict, x, y) for the points to dedup, plus
+    # the number of points dropped for each reason
+    fields = InputFields(table, xy_fields)
+    shape = list(xy_fields) if xy_fields else ["SHAPE@XY"]
+    points, removed = [], OrderedDict([("empty", 0), ("dead_end", 0), ("freeway", 0), ("no_location", 0)])
+    for row in da.SearchCursor(table, fields + shape):
+        values = dict(zip(fields, row))
+        x, y = row[len(fields):] if xy_fields else (row[-1] or (None, None))
+        reason = RemovedReason(values)
+        if reason is None and (x is None or y is None):
+            reason = "no_location"
+        if reason is not None:
+            removed[reason] += 1
+            continue
+        points.append((values, x, y))
+    return fields, points, removed
+
+
+##### Cluster #####
+def ClusterPoints(points, tolerance):
+
+    # Groups of point positions; points of the same street pair within tolerance are linked (union-find)
+    if tolerance <= 0:
+        raise ValueError("The tolerance must be more than 0, not %r" % tolerance)
+    parent = list(range(len(points)))
+
+    def Find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    grid = {}
+    tolerance_sq = tolerance * tolerance
+    for i, (values, x, y) in enumerate(points):
+        pair = StreetPair(values)
+        cx, cy = int(x // tolerance), int(y // tolerance)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in grid.get((pair, cx + dx, cy + dy), ()):
+                    if (points[j][1] - x) ** 2 + (points[j][2] - y) ** 2 <= tolerance_sq:
+                        root_i, root_j = Find(i), Find(j)
+                        if root_i != root_j:
+                            parent[max(root_i, root_j)] = min(root_i, root_j)
+        grid.setdefault((pair, cx, cy), []).append(i)
+
+    # In the order of each group's first point
+    groups = OrderedDict()
+    for i in range(len(points)):
+        groups.setdefault(Find(i), []).append(i)
+    return list(groups.values())
+
+
+##### Merge #####
+def MergeGroup(points, group, fields):
+
+    # One output row: the first point's fields with the street pair in order, the joined IDs and the
+    # mean location
+    values = dict(points[group[0]][0])
+    values["FROM_ST"], values["TO_ST"] = StreetPair(values)
+    for id_field in ("ASSETID", "CL_NODE_ID"):
+        if id_field in values:
+            values[id_field] = "_".join(IdText(points[i][0][id_field]) or "" for i in group)
+    x = sum(points[i][1] for i in group) / float(len(group))
+    y = sum(points[i][2] for i in group) / float(len(group))
+    return [values[f] for f in fields] + [x, y, len(group)]
+
+
+##### Main Function #####
+def DedupIntersections(in_table, out_table, tolerance=xy_tol, xy_fields=None):
+
+    t0 = time.time()
+    fields, points, removed = ReadIntersections(in_table, xy_fields)
+    print("Read %d intersection points (removed %s)" % (len(points),
+        ", ".join("%d %s" % (n, reason) for reason, n in removed.items())))
+
+    groups = ClusterPoints(points, tolerance)
+    print("Found %d duplicate groups (%d points)" % (sum(1 for g in groups if len(g) > 1), sum(len(g) for g in groups if len(g) > 1)))
+
+    field_types = dict((f, "String") for f in ("ASSETID", "CL_NODE_ID", "FROM_ST", "TO_ST") if f in fields)
+    field_types.update(X="Real", Y="Real", N_MERGED="Integer")
+    da.WriteTable(out_table, fields + ["X", "Y", "N_MERGED"], (MergeGroup(points, group, fields) for group in groups), field_types)
+    print("Wrote %d intersections to %s in %.1f s" % (len(groups), out_table, time.time() - t0))
+    return len(groups)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Remove dead-end, freeway & empty BOE intersection points and merge duplicates.")
+    parser.add_argument("--workspace", default=env.workspace, help="geodatabase, GeoPackage, SQLite file or folder holding the intersection table")
+    parser.add_argument("--input", default=boe_int, help="intersection points")
+    parser.add_argument("--output", default=boe_int_clean, help="table for the cleaned intersections (written to the workspace)")
+    parser.add_argument("--tolerance", type=float, default=xy_tol, help="distance within which points of the same street pair are merged, in coordinate units")
+    parser.add_argument("--xy-fields", default=None, help="X,Y fields to read the location from, for tables without geometry (e.g. CSV)")
+    args = parser.parse_args()
+    if args.tolerance <= 0:
+        parser.error("--tolerance must be more than 0")
+
+    env.workspace = args.workspace
+    DedupIntersections(args.input, args.output, args.tolerance, args.xy_fields.split(",") if args.xy_fields else None)
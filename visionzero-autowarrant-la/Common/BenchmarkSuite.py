@@ -0,0 +1,171 @@
+#### Benchmark Suite #####
+
+#### Runs the signal warrant, left-turn warrant and road diet scripts on synthetic SWITRS tables
+#### (SyntheticSWITRS.py) at several multiples of the City of Los Angeles, and records the wall time,
+#### peak memory and throughput (collisions per second) of each run. Every result is appended to a
+#### history file (one JSON object per line) together with the git commit, so runs can be compared:
+####
+####     python BenchmarkSuite.py --scales 1,10,100
+####     python BenchmarkSuite.py --scales 0.1 --pipelines signal,road-diet --compare
+####
+#### Each script runs in its own process with --profile, so the peak memory is the script's own and
+#### the stage timings from its profile report are kept with the result. Runs that take longer than
+#### --timeout are stopped and recorded as timed out.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from SyntheticSWITRS import SyntheticSWITRS
+
+Root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+# Kept outside the source tree, so the results of one machine are not committed with the code
+HistoryFile = os.path.join(os.path.expanduser("~"), ".visionzero", "benchmark_history.jsonl")
+
+# Script and arguments of each pipeline; {workspace}, {folder}, {segments}, {intersections} and {collisions} are filled in per run
+Pipelines = OrderedDict([
+	("signal", ["NewSignals/SigWarrantSearch.py", "--workspace", "{workspace}", "--output", "{folder}/potential_signals.csv"]),
+	("left-turn", ["ProtectedLeft/ProtLWarrantSearch.py", "--workspace", "{workspace}"]),
+	("road-diet", ["SafetyBenefitEstimation/ArcPy_RoadDietCalc.py", "--workspace", "{workspace}", "--segments", "{segments}",
+		"--intersections", "{intersections}", "--output", "{folder}/road_diet_stats.csv"]),
+	# Loads as many LAPD-like collisions as the SWITRS table has into a SQLite stand-in, then exports them
+	("lapd-export", ["DbPrep/CollisionData/LapdExport.py", "--db", "{folder}/lapd.sqlite", "--output", "{folder}/collisions.ndjson",
+		"--load-synthetic", "{collisions}"]),
+])
+
+
+##### Run One Pipeline #####
+def RunPipeline(pipeline, workspace, folder, corridor_csvs, collisions, timeout):
+
+	profile_path = os.path.join(folder, "%s_profile.json" % pipeline)
+	args = [sys.executable, os.path.join(Root, Pipelines[pipeline][0])] + [
+		arg.format(workspace=workspace, folder=folder, segments=corridor_csvs[0], intersections=corridor_csvs[1], collisions=collisions)
+		for arg in Pipelines[pipeline][1:]]
+	args += ["--profile", profile_path, "--log-level", "WARNING"]
+
+	# Poll instead of using a subprocess timeout, which Python 2 does not have
+	t0 = time.time()
+	with open(os.path.join(folder, "%s.log" % pipeline), "w") as log:
+		process = subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT)
+		while process.poll() is None:
+			if timeout and time.time() - t0 > timeout:
+				process.kill()
+				process.wait()
+				return "timeout", time.time() - t0, None
+			time.sleep(0.05)
+	wall = time.time() - t0
+
+	if process.returncode != 0:
+		return "failed", wall, None
+	with open(profile_path) as fin:
+		return "ok", wall, json.load(fin)
+
+
+##### Run the Suite #####
+def RunSuite(scales, pipelines, table_format="sqlite", timeout=None, history=HistoryFile, seed=2016, workdir=None):
+
+	run_id = time.strftime("%Y-%m-%dT%H:%M:%S")
+	commit = GitCommit()
+	results = []
+	for scale in scales:
+		folder = tempfile.mkdtemp(prefix="switrs_%s_" % scale, dir=workdir)
+		try:
+			workspace = os.path.join(folder, "switrs.sqlite") if table_format == "sqlite" else os.path.join(folder, "tables")
+			t0 = time.time()
+			generator = SyntheticSWITRS(scale, seed)
+			corridor_csvs = generator.Write(workspace, table_format)
+			print("Scale %s: generated %d collisions in %.1f s" % (scale, generator.sizes["collisions"], time.time() - t0))
+
+			for pipeline in pipelines:
+				status, wall, profile = RunPipeline(pipeline, workspace, folder, corridor_csvs, generator.sizes["collisions"], timeout)
+				result = OrderedDict([
+					("run_id", run_id),
+					("commit", commit),
+					("host", platform.node()),
+					("python", platform.python_version()),
+					("pipeline", pipeline),
+					("scale", scale),
+					("format", table_format),
+					("collisions", generator.sizes["collisions"]),
+					("status", status),
+					("wall_seconds", round(wall, 3)),
+					("peak_memory_mb", profile["peak_memory_mb"] if profile else None),
+					("collisions_per_second", round(generator.sizes["collisions"] / wall, 1) if status == "ok" else None),
+					("stages", profile["stages"] if profile else None),
+					("counters", profile["counters"] if profile else None),
+				])
+				results.append(result)
+				print("  %-10s %-8s %9.2f s %9s MB %12s collisions/s" % (pipeline, status, wall,
+					result["peak_memory_mb"], result["collisions_per_second"]))
+		finally:
+			shutil.rmtree(folder, ignore_errors=True)
+
+	if history:
+		if os.path.dirname(history) and not os.path.isdir(os.path.dirname(history)):
+			os.makedirs(os.path.dirname(history))
+		with open(history, "a") as fout:
+			for result in results:
+				fout.write(json.dumps(result) + "\n")
+	return results
+
+
+##### Compare with Earlier Runs #####
+def LoadHistory(history=HistoryFile):
+	if not os.path.exists(history):
+		return []
+	with open(history) as fin:
+		return [json.loads(line) for line in fin if line.strip()]
+
+
+def Compare(results, history_rows):
+
+	# Each result against the latest earlier ok run of the same pipeline, scale and format
+	print("%-10s %8s  %10s %10s %8s  %10s %10s" % ("pipeline", "scale", "wall (s)", "before", "change", "MB", "before"))
+	for result in results:
+		earlier = [row for row in history_rows if row["run_id"] < result["run_id"] and row["status"] == "ok" and
+			(row["pipeline"], row["scale"], row["format"]) == (result["pipeline"], result["scale"], result["format"])]
+		if not earlier or result["status"] != "ok":
+			print("%-10s %8s  %10s %10s %8s" % (result["pipeline"], result["scale"], result["wall_seconds"], "-", result["status"]))
+			continue
+		before = max(earlier, key=lambda row: row["run_id"])
+		change = (result["wall_seconds"] - before["wall_seconds"]) / max(before["wall_seconds"], 1e-9) * 100
+		print("%-10s %8s  %10.2f %10.2f %+7.1f%%  %10s %10s" % (result["pipeline"], result["scale"], result["wall_seconds"],
+			before["wall_seconds"], change, result["peak_memory_mb"], before["peak_memory_mb"]))
+
+
+def GitCommit():
+	try:
+		return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=Root, stderr=subprocess.STDOUT).decode("ascii").strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+##### Run the Benchmark #####
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Benchmark the warrant & road diet scripts on synthetic SWITRS data.")
+	parser.add_argument("--scales", default="1,10,100", help="comma-separated multiples of the City of Los Angeles")
+	parser.add_argument("--pipelines", default=",".join(Pipelines), help="comma-separated, from: " + ", ".join(Pipelines))
+	parser.add_argument("--format", default="sqlite", choices=["sqlite", "csv", "parquet"], help="format of the synthetic tables")
+	parser.add_argument("--timeout", type=float, default=3600, help="seconds before a run is stopped (0 for no limit)")
+	parser.add_argument("--history", default=HistoryFile, help="JSON lines file the results are appended to (default: ~/.visionzero/benchmark_history.jsonl)")
+	parser.add_argument("--workdir", default=None, help="folder for the synthetic tables (default: the system temp folder)")
+	parser.add_argument("--seed", type=int, default=2016)
+	parser.add_argument("--compare", action="store_true", help="compare with the previous run in the history file")
+	args = parser.parse_args()
+
+	pipelines = [p.strip() for p in args.pipelines.split(",") if p.strip()]
+	for pipeline in pipelines:
+		if pipeline not in Pipelines:
+			parser.error("unknown pipeline %s" % pipeline)
+	history_rows = LoadHistory(args.history)
+	results = RunSuite([float(s) for s in args.scales.split(",")], pipelines, args.format, args.timeout or None, args.history, args.seed, args.workdir)
+	if args.compare:
+		Compare(results, history_rows)
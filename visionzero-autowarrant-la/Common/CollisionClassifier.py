@@ -0,0 +1,161 @@
+#### Collision Classifier #####
+
+#### The party rules of the warrant scripts, evaluated for all collisions at once over the arrays of a
+#### PartyIndex instead of one collision at a time:
+####   SignalRule    SigWarrantSearch.PartyFilter: after dropping parties with an excluded movement
+####                 (A, C, K, N, O, Q by default), the first two parties travel in conflicting directions
+####                 (N/S vs E/W)
+####   RoadDietRule  ArcPy_RoadDietCalc.PartyFilter: the collision code (0, 3, 4 or None) for a corridor's
+####                 directions, and whether any party has OAF violation section 22350 (speeding)
+####
+#### Both return one row per collision. The row-by-row PartyFilter functions stay in the scripts as the
+#### reference; CompareClassifier.py checks that both give the same result for every collision. The
+#### excluded movements & PCF categories can be changed per call, for the --sweep mode of the scripts.
+
+import numpy as np
+
+# A: Stopped, C: Ran Off Road, K: Parking Maneuver, N: Crossed Into Opposing Lane, O: Parked, Q: Traveling Wrong Way
+ExcludedMovements = ["A", "C", "K", "N", "O", "Q"]
+
+# Primary collision factor categories targeted by a road diet
+PcfCategories = ['03','06','07','09','10','11']
+
+# Party types
+Driver = 1
+Pedestrian = 2
+Bicyclist = 4
+
+Speeding = 22350
+LeftTurn = "E"
+Opposing = {"N": "S", "S": "N", "E": "W", "W": "E"}
+
+# Collision code for collisions PartyFilter discards (it returns None)
+Discarded = -1
+
+
+##### Signal Warrant #####
+def SignalRule(party_index, excluded=ExcludedMovements):
+
+	# Boolean per collision of the index (aligned with party_index.case_ids)
+	kept = ~np.isin(party_index.movement, _Codes(excluded))
+	first, second = _FirstPositions(party_index, kept, 2)
+
+	has_two = second >= 0
+	first_dir = party_index.direction[np.maximum(first, 0)]
+	second_dir = party_index.direction[np.maximum(second, 0)]
+	north_south, east_west = _Codes(["N", "S"]), _Codes(["E", "W"])
+	conflicting = ((np.isin(first_dir, north_south) & np.isin(second_dir, east_west)) |
+		(np.isin(first_dir, east_west) & np.isin(second_dir, north_south)))
+	return has_two & conflicting
+
+
+def SignalCases(party_index, excluded=ExcludedMovements):
+
+	# Set of the CASE_IDs meeting the signal warrant party criteria
+	return set(party_index.case_ids[SignalRule(party_index, excluded)].tolist())
+
+
+##### Road Diet #####
+def RoadDietRule(party_index, direction, case_ids, alcohol, pcf, pcf_categories=PcfCategories):
+
+	# For each collision in case_ids (with its ALCOHOL_INVOLVED & PCF_VIOL_CATEGORY), returns the
+	# collision code (Discarded where PartyFilter returns None) and the OAF 22350 flag
+	parties = RoadDietParties(party_index, direction, case_ids)
+	return RoadDietCodes(parties, alcohol, pcf, pcf_categories), parties[3]
+
+
+def RoadDietParties(party_index, direction, case_ids):
+
+	# The party side of the rule for each collision in case_ids, which does not depend on the collision
+	# fields: (listed parties, has a listed left turn, left turn opposed, OAF 22350 flag)
+	positions, found = Lookup(party_index, case_ids)
+	if not len(party_index.case_ids):
+		empty = np.zeros(len(positions), dtype=bool)
+		return np.zeros(len(positions), dtype=np.int64), empty, empty, empty
+	codes, speeding = _RoadDietCodes(party_index, direction)
+	n_listed, has_left_turn, opposed = codes
+	return (np.where(found, n_listed[positions], 0), has_left_turn[positions], opposed[positions],
+		np.where(found, speeding[positions], False))
+
+
+def RoadDietCodes(parties, alcohol, pcf, pcf_categories=PcfCategories):
+
+	# Collision code per collision, from its RoadDietParties and its ALCOHOL_INVOLVED & PCF_VIOL_CATEGORY
+	n_listed, has_left_turn, opposed = parties[:3]
+	alcohol = np.array([value == 'Y' for value in alcohol], dtype=bool)
+	in_category = np.array([value in pcf_categories for value in pcf], dtype=bool)
+
+	# Two or more listed parties: alcohol -> 0; PCF in category -> 4 for an opposed left turn, 0 for
+	# another left turn, 3 otherwise; PCF out of category -> 0. One listed party -> 0, none -> None
+	col_code = np.zeros(len(n_listed), dtype=np.int8)
+	targeted = (n_listed >= 2) & ~alcohol & in_category
+	col_code[targeted & ~has_left_turn] = 3
+	col_code[targeted & has_left_turn & opposed] = 4
+	col_code[n_listed < 1] = Discarded
+	return col_code
+
+
+def _RoadDietCodes(party_index, direction):
+
+	# Parties listed by PartyFilter: drivers travelling in one of the corridor's directions,
+	# pedestrians and bicyclists
+	corridor_dirs = _Codes([d for d in direction if d is not None and len(d) == 1])
+	driver = (party_index.party_type == Driver) & np.isin(party_index.direction, corridor_dirs)
+	listed = driver | (party_index.party_type == Pedestrian) | (party_index.party_type == Bicyclist)
+	starts = party_index.offsets[:-1]
+
+	n_listed = _GroupSum(listed, party_index)
+	speeding = _GroupSum(party_index.oaf_section == Speeding, party_index) > 0
+
+	# Direction of the first listed left turn, and whether a listed party travels the opposite way
+	left_turn = listed & (party_index.movement == LeftTurn.encode("ascii"))
+	first_turn = _FirstPositions(party_index, left_turn, 1)[0]
+	has_left_turn = first_turn >= 0
+	turn_dir = party_index.direction[np.maximum(first_turn, 0)]
+
+	opposed = np.zeros(len(starts), dtype=bool)
+	for turn, opposite in Opposing.items():
+		travels_opposite = _GroupSum(listed & (party_index.direction == opposite.encode("ascii")), party_index) > 0
+		opposed |= (turn_dir == turn.encode("ascii")) & travels_opposite
+	return (n_listed, has_left_turn, has_left_turn & opposed), speeding
+
+
+##### Helpers #####
+def Lookup(party_index, case_ids):
+
+	# Position of each CASE_ID in the index, and whether it is there at all
+	case_ids = np.asarray([int(case_id) for case_id in case_ids], dtype=np.int64)
+	positions = np.searchsorted(party_index.case_ids, case_ids)
+	positions = np.minimum(positions, max(len(party_index.case_ids) - 1, 0))
+	found = (party_index.case_ids[positions] == case_ids) if len(party_index.case_ids) else np.zeros(len(case_ids), dtype=bool)
+	return positions, found
+
+
+def _GroupSum(mask, party_index):
+
+	# Count of True per collision; every collision in the index has at least one party
+	if not len(party_index.case_ids):
+		return np.zeros(0, dtype=np.int64)
+	return np.add.reduceat(mask.astype(np.int64), party_index.offsets[:-1])
+
+
+def _FirstPositions(party_index, mask, n):
+
+	# Party positions of the first n parties per collision where mask is True (-1 if there are fewer)
+	result = [np.full(len(party_index.case_ids), -1, dtype=np.int64) for i in range(n)]
+	positions = np.flatnonzero(mask)
+	groups = np.searchsorted(party_index.offsets, positions, side="right") - 1
+	if not len(positions):
+		return result
+
+	# Rank of each selected party within its collision
+	group_starts = np.flatnonzero(np.append(True, groups[1:] != groups[:-1]))
+	ranks = np.arange(len(positions)) - np.repeat(group_starts, np.diff(np.append(group_starts, len(positions))))
+	for i in range(n):
+		selected = ranks == i
+		result[i][groups[selected]] = positions[selected]
+	return result
+
+
+def _Codes(values):
+	return np.asarray([value.encode("ascii") for value in values], dtype="S1")
@@ -0,0 +1,584 @@
+#### Collision Store #####
+
+#### One copy of the SWITRS collisions & parties for all the analyses, instead of a geodatabase per year
+#### range. Each table is split by collision year into Arrow IPC files, which are memory-mapped when read,
+#### so a query only pages in what it uses and the columns are read without a copy:
+####
+####   <store>/store.json                          tables, schema, years & source table names
+####   <store>/collisions/year=2013/data.arrow     the collisions of 2013, in the order of the source
+####   <store>/collisions/year=2013/IntID.*.npy    index: sorted IntIDs, offsets & row numbers
+####   <store>/parties/year=2013/data.arrow        the parties of the 2013 collisions
+####
+#### Collisions are indexed by IntID & SegID, parties by CASE_ID. Ingesting a year that is already in the
+#### store replaces it, so new years are appended with the same command:
+####
+####     python CollisionStore.py ingest --store /data/switrs_store --workspace /data/WarrantSearch2009to2013.gdb
+####     python CollisionStore.py ingest --store /data/switrs_store --workspace /data/SWITRS2014to2016.gpkg --collisions SWITRS2014_to_2016 --parties Collisions2014to2016PartiesJoin
+####     python CollisionStore.py info --store /data/switrs_store
+####
+#### The store is also a DataAccess workspace: the collision & party tables can be opened by their own
+#### names or by the names of any table ingested into them (e.g. SWITRS2009_to_2013), and only the years
+#### of env.years are read (the --years argument of the scripts). Where clauses are pushed down: an
+#### IntID / SegID / CASE_ID equality or IN list is looked up in the index, a COLLISION_DATE range skips
+#### whole years, and the rest is an Arrow filter. Other tables (e.g. the intersections, copied with
+#### --tables) are read from the folder like any folder workspace. Parties2013DriversUorLTurn is made
+#### from the store too: the drivers making a left or U-turn in the years read (the latest year if --years
+#### is not given, like the source table), with their IntID.
+####
+#### In Python, CollisionStore(path).Collisions(...) & .Parties(...) return Arrow tables for a date range,
+#### intersections, segments and severities.
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import DataAccess as da
+from WhereClause import Parse, Evaluate, Fields, ToArrowExpression, ParseDate
+
+ManifestFile = "store.json"
+StoreVersion = 1
+
+# Logical tables: the source table they are usually ingested from, key & indexed fields
+Tables = OrderedDict([
+	("collisions", {"source": "SWITRS2009_to_2013", "key": "CASE_ID", "date_field": "COLLISION_DATE", "index_fields": ["IntID", "SegID"]}),
+	("parties", {"source": "Collisions2009to2013PartiesJoin", "key": "Parties_CASE_ID", "index_fields": ["Parties_CASE_ID"]}),
+])
+
+# Left/U-turn drivers table of the left-turn warrant, made from the parties & collisions of the years read
+LeftTurnTable = "Parties2013DriversUorLTurn"
+LeftTurnFields = ["Parties_CASE_ID", "Parties_DIR_OF_TRAVEL", "SWITRS2009_to_2013_IntID"]
+
+# Drivers (PARTY_TYPE 1) making a U-turn (E) or left turn (F), as a where clause tree so the literals are
+# cast to the stored types
+DriversUorLTurn = ("and", ("cmp", "=", "Parties_PARTY_TYPE", 1), ("in", "Parties_MOVE_PRE_ACC", ["E", "F"]))
+
+# Source fields that are not copied (geometry & object IDs)
+SkipFields = ["SHAPE", "GEOM", "GEOMETRY", "OBJECTID", "FID", "OID", "SHAPE_LENGTH", "SHAPE_AREA"]
+
+# Partition of collisions without a date
+NoYear = 0
+
+# Largest index lookup read row by row rather than with Arrow compute
+SmallFilter = 64
+
+
+class CollisionStore(object):
+
+	def __init__(self, path):
+		self.path = path
+		manifest_path = os.path.join(path, ManifestFile)
+		if os.path.exists(manifest_path):
+			with open(manifest_path) as fin:
+				self.manifest = json.load(fin, object_pairs_hook=OrderedDict)
+			if self.manifest["version"] != StoreVersion:
+				raise da.DataAccessError("%s is a version %s collision store, expected version %s" % (path, self.manifest["version"], StoreVersion))
+		else:
+			self.manifest = OrderedDict([("version", StoreVersion), ("tables", OrderedDict())])
+		self._partitions = {}
+
+	##### Tables #####
+	def TableName(self, table):
+
+		# Logical name of a store table, from its own name or the name of a table ingested into it
+		for name, info in self.manifest["tables"].items():
+			if table.lower() == name or table.lower() in [s.lower() for s in info["sources"]]:
+				return name
+		if table.lower() == LeftTurnTable.lower() and "parties" in self.manifest["tables"]:
+			return LeftTurnTable
+		return None
+
+	def ListFields(self, name):
+		if name == LeftTurnTable:
+			return list(LeftTurnFields)
+		return [field for field, _ in self.manifest["tables"][name]["schema"]]
+
+	def Years(self, name="collisions", years=None):
+
+		# Years in the store, within (first, last) if given
+		stored = sorted(int(year) for year in self.manifest["tables"].get(name, {}).get("years", {}))
+		if years is None:
+			return stored
+		return [year for year in stored if years[0] <= year <= years[1]]
+
+	def Partition(self, name, year):
+		key = (name, year)
+		if key not in self._partitions:
+			self._partitions[key] = Partition(os.path.join(self.path, name, "year=%d" % year), Tables[name]["index_fields"])
+		return self._partitions[key]
+
+	##### Query #####
+	def Select(self, name, fields, tree=None, years=None):
+
+		# Arrow tables (one per year) with the fields of the rows matching the where clause tree
+		if name == LeftTurnTable:
+			for table in self._LeftTurnDrivers(years):
+				yield _Filter(table, tree).select(list(fields))
+			return
+
+		needed = list(OrderedDict.fromkeys(list(fields) + (Fields(tree) if tree is not None else [])))
+		for partition, rows in self._Partitions(name, tree, years):
+			if rows is None:
+				yield _Filter(partition.table, tree).select(list(fields))
+			else:
+				# Only the index rows (of the columns needed) are copied out of the memory map
+				yield _Filter(partition.table.select(needed).take(rows), tree).select(list(fields))
+
+	def SelectRows(self, name, fields, tree=None, years=None):
+
+		# Tuples of the fields of the rows matching the where clause tree; the few rows of an index lookup
+		# (e.g. those of one intersection) are read straight from the memory map, without Arrow compute
+		needed = list(OrderedDict.fromkeys(list(fields) + (Fields(tree) if tree is not None else [])))
+		if name == LeftTurnTable:
+			parts = [(table, None) for table in self._LeftTurnDrivers(years)]
+		else:
+			parts = ((partition.table, rows) for partition, rows in self._Partitions(name, tree, years))
+		for table, rows in parts:
+			if rows is not None and len(rows) <= SmallFilter:
+				columns = [table.column(field) for field in needed]
+				for i in rows:
+					row = dict((field, column[int(i)].as_py()) for field, column in zip(needed, columns))
+					if Evaluate(tree, row) is True:
+						yield tuple(row[field] for field in fields)
+				continue
+			if rows is not None:
+				table = table.select(needed).take(rows)
+			for batch in _Filter(table, tree).select(list(fields)).to_batches():
+				for row in zip(*[batch.column(i).to_pylist() for i in range(batch.num_columns)]):
+					yield row
+
+	def _Partitions(self, name, tree, years):
+
+		# (partition, row numbers) of the partitions the where clause tree can match; the row numbers are
+		# those of the index lookup the tree allows, None to scan the whole partition
+		info = Tables[name]
+		lookup = _IndexLookup(tree, info["index_fields"])
+		date_years = _DateYears(tree, info.get("date_field"))
+		for year in self.Years(name, years):
+			if date_years is not None and not (date_years[0] <= year <= date_years[1]):
+				continue
+			partition = self.Partition(name, year)
+			if not lookup:
+				yield partition, None
+				continue
+			rows = partition.Rows(lookup[0], lookup[1])
+			if len(rows):
+				yield partition, rows
+
+	def _LeftTurnDrivers(self, years):
+
+		# Like the source table (the 2013 drivers), only the latest year unless the years are given
+		import pyarrow as pa
+		stored = self.Years("parties", years)
+		for year in (stored if years is not None else stored[-1:]):
+			parties = self.Partition("parties", year).table
+			drivers = _Filter(parties, DriversUorLTurn)
+			collisions = self.Partition("collisions", year)
+			int_of_case = dict(zip(collisions.table.column("CASE_ID").to_pylist(), collisions.table.column("IntID").to_pylist()))
+			int_ids = [int_of_case.get(case_id) for case_id in drivers.column("Parties_CASE_ID").to_pylist()]
+			yield pa.table(OrderedDict([
+				("Parties_CASE_ID", drivers.column("Parties_CASE_ID")),
+				("Parties_DIR_OF_TRAVEL", drivers.column("Parties_DIR_OF_TRAVEL")),
+				("SWITRS2009_to_2013_IntID", pa.array(int_ids, type=collisions.table.schema.field("IntID").type)),
+			]))
+
+	def Collisions(self, fields=None, start=None, end=None, int_ids=None, seg_ids=None, severity=None):
+
+		# Collisions from start to end (dates, inclusive), at any of int_ids / seg_ids, with any of the
+		# COLLISION_SEVERITY codes in severity; all fields if fields is None
+		conditions = []
+		if start is not None:
+			conditions.append(("cmp", ">=", "COLLISION_DATE", _DateTime(start)))
+		if end is not None:
+			conditions.append(("cmp", "<", "COLLISION_DATE", _DateTime(end) + datetime.timedelta(days=1)))
+		if int_ids is not None:
+			conditions.append(("in", "IntID", list(int_ids)))
+		if seg_ids is not None:
+			conditions.append(("in", "SegID", list(seg_ids)))
+		if severity is not None:
+			conditions.append(("in", "COLLISION_SEVERITY", list(severity)))
+		return self._Concat("collisions", fields, _And(conditions))
+
+	def Parties(self, fields=None, case_ids=None, years=None):
+
+		# Parties of the collisions in case_ids, and / or in the (first, last) years
+		tree = ("in", "Parties_CASE_ID", list(case_ids)) if case_ids is not None else None
+		return self._Concat("parties", fields, tree, years)
+
+	def _Concat(self, name, fields, tree, years=None):
+		import pyarrow as pa
+		fields = list(fields) if fields is not None else self.ListFields(name)
+		tables = list(self.Select(name, fields, tree, years))
+		if not tables:
+			return pa.table(OrderedDict((field, pa.array([], type=self.Schema(name).field(field).type)) for field in fields))
+		return pa.concat_tables(tables)
+
+	def Schema(self, name):
+		import pyarrow as pa
+		return pa.schema([(field, _ArrowType(type_name)) for field, type_name in self.manifest["tables"][name]["schema"]])
+
+	##### Ingest #####
+	def Ingest(self, collisions_table, parties_table, years=None):
+
+		# Reads the source tables (from da.env.workspace) and writes one partition per collision year,
+		# replacing the years already in the store. Returns {table: {year: rows}}
+		t0 = time.time()
+		collisions, years_of_rows = self._ReadSource("collisions", collisions_table, years)
+		year_of_case = dict(zip(collisions.column(Tables["collisions"]["key"]).to_pylist(), years_of_rows))
+		written = OrderedDict([("collisions", self._WritePartitions("collisions", collisions_table, collisions, years_of_rows))])
+		print("Ingested %d collisions from %s in %.1f s" % (collisions.num_rows, collisions_table, time.time() - t0))
+
+		# Parties go to the year of their collision; those of collisions that were not read are skipped
+		t0 = time.time()
+		parties, _ = self._ReadSource("parties", parties_table)
+		party_years = [year_of_case.get(case_id) for case_id in parties.column(Tables["parties"]["key"]).to_pylist()]
+		skipped = sum(1 for year in party_years if year is None)
+		written["parties"] = self._WritePartitions("parties", parties_table, parties, party_years)
+		print("Ingested %d parties from %s in %.1f s (%d of other years or without a collision skipped)" % (
+			parties.num_rows - skipped, parties_table, time.time() - t0, skipped))
+		return written
+
+	def CopyTables(self, tables):
+
+		# Other tables of the source workspace (e.g. intersections), written next to the partitions as
+		# Parquet, so the store can be the only workspace of a script
+		for table in tables:
+			fields = [f for f in da.ListFields(table) if f.upper() not in SkipFields]
+			rows = list(da.SearchCursor(table, fields))
+			types = dict((field, da.ValueType([row[i] for row in rows])) for i, field in enumerate(fields))
+			da.WriteTable(os.path.join(self.path, table + ".parquet"), fields, rows, types)
+			print("Copied %s (%d rows)" % (table, len(rows)))
+
+	def _ReadSource(self, name, source, years=None):
+		import pyarrow as pa
+
+		fields = [f for f in da.ListFields(source) if f.upper() not in SkipFields]
+		stored = self.manifest["tables"].get(name)
+		if stored:
+			missing = [field for field, _ in stored["schema"] if field not in fields]
+			if missing:
+				raise da.DataAccessError("%s does not have the fields %s of the stored %s" % (source, ", ".join(missing), name))
+			fields = [field for field, _ in stored["schema"]]
+		for field in [Tables[name]["key"]] + Tables[name]["index_fields"]:
+			if field not in fields:
+				raise da.DataAccessError("%s has no %s field" % (source, field))
+
+		columns = [[] for field in fields]
+		row_years = []
+		date_position = fields.index(Tables[name]["date_field"]) if "date_field" in Tables[name] else None
+		for row in da.SearchCursor(source, fields):
+			year = _Year(row[date_position]) if date_position is not None else None
+			if years is not None and not (years[0] <= year <= years[1]):
+				continue
+			for column, value in zip(columns, row):
+				column.append(value)
+			row_years.append(year)
+
+		schema = self.Schema(name) if stored else None
+		arrays = [_Column(column, schema.field(field).type if schema else None) for field, column in zip(fields, columns)]
+		return pa.table(OrderedDict(zip(fields, arrays))), row_years
+
+	def _WritePartitions(self, name, source, table, row_years):
+
+		positions = OrderedDict()
+		for i, year in enumerate(row_years):
+			if year is not None:
+				positions.setdefault(year, []).append(i)
+
+		info = self.manifest["tables"].setdefault(name, OrderedDict([
+			("schema", [[field.name, _TypeName(field.type)] for field in table.schema]), ("sources", []), ("years", OrderedDict())]))
+		for year in sorted(positions):
+			folder = os.path.join(self.path, name, "year=%d" % year)
+			WritePartition(folder, table.take(np.asarray(positions[year], dtype=np.int64)), Tables[name]["index_fields"])
+			self._partitions.pop((name, year), None)
+			info["years"][str(year)] = len(positions[year])
+		info["years"] = OrderedDict(sorted(info["years"].items(), key=lambda item: int(item[0])))
+		if source not in info["sources"]:
+			info["sources"].append(source)
+		self._WriteManifest()
+		return OrderedDict((year, len(rows)) for year, rows in positions.items())
+
+	def _WriteManifest(self):
+		if not os.path.isdir(self.path):
+			os.makedirs(self.path)
+		path = os.path.join(self.path, ManifestFile)
+		with open(path + ".tmp", "w") as fout:
+			json.dump(self.manifest, fout, indent=2)
+			fout.write("\n")
+		_Replace(path + ".tmp", path)
+
+
+##### Partitions #####
+class Partition(object):
+
+	# One year of a table: the memory-mapped Arrow table and its indexes (also memory-mapped)
+	def __init__(self, folder, index_fields):
+		import pyarrow as pa
+		self.folder = folder
+		self.table = pa.ipc.open_file(pa.memory_map(os.path.join(folder, "data.arrow"))).read_all()
+		self.indexes = {}
+		for field in index_fields:
+			self.indexes[field] = tuple(np.load(os.path.join(folder, "%s.%s.npy" % (field, part)), mmap_mode="r")
+				for part in ("keys", "offsets", "rows"))
+
+	def Rows(self, field, values):
+
+		# Row numbers of the rows with any of the values, in table order & once each (like SQL, a value
+		# repeated in an IN list does not repeat its rows)
+		keys, offsets, rows = self.indexes[field]
+		found = []
+		for value in values:
+			key = _IndexKey(value, keys.dtype)
+			if key is None:
+				continue
+			i = int(np.searchsorted(keys, key))
+			if i < len(keys) and keys[i] == key:
+				found.append(rows[offsets[i]:offsets[i + 1]])
+		if not found:
+			return np.zeros(0, dtype=np.int64)
+		return np.unique(np.concatenate(found)) if len(found) > 1 else np.asarray(found[0])
+
+
+def WritePartition(folder, table, index_fields):
+
+	# Written to a new folder that then replaces the old one, so readers never see half a partition
+	import pyarrow as pa
+	tmp = folder + ".tmp"
+	if os.path.isdir(tmp):
+		shutil.rmtree(tmp)
+	os.makedirs(tmp)
+	with pa.OSFile(os.path.join(tmp, "data.arrow"), "wb") as sink:
+		with pa.ipc.new_file(sink, table.schema) as writer:
+			writer.write_table(table)
+	for field in index_fields:
+		for part, array in zip(("keys", "offsets", "rows"), BuildIndex(table.column(field).to_pylist())):
+			np.save(os.path.join(tmp, "%s.%s.npy" % (field, part)), array)
+	if os.path.isdir(folder):
+		shutil.rmtree(folder)
+	os.rename(tmp, folder)
+
+
+def BuildIndex(values):
+
+	# (sorted unique keys, offsets, row numbers): the rows of keys[i] are rows[offsets[i]:offsets[i + 1]],
+	# in table order. NULLs are not indexed; numbers are stored as int64, anything else as text
+	positions = np.asarray([i for i, value in enumerate(values) if value is not None], dtype=np.int64)
+	present = [values[i] for i in positions]
+	try:
+		keys = np.asarray([int(value) for value in present], dtype=np.int64)
+		if any(float(value) != key for value, key in zip(present, keys)):
+			raise ValueError
+	except (TypeError, ValueError):
+		keys = np.asarray([u"%s" % value for value in present], dtype=np.str_)
+	order = np.argsort(keys, kind="mergesort")
+	sorted_keys = keys[order]
+	unique_keys, starts = np.unique(sorted_keys, return_index=True)
+	return unique_keys, np.append(starts, len(sorted_keys)).astype(np.int64), positions[order]
+
+
+##### DataAccess Workspace #####
+class StoreWorkspace(da.FolderWorkspace):
+
+	# A collision store opened as a workspace (see OpenWorkspace in DataAccess.py); tables that are not
+	# in the store are read from the folder
+	def __init__(self, path):
+		da.FolderWorkspace.__init__(self, path)
+		self.store = CollisionStore(path)
+
+	def SearchCursor(self, table, fields, where_clause=None):
+		name = self.store.TableName(table)
+		if name is None:
+			return da.FolderWorkspace.SearchCursor(self, table, fields, where_clause)
+
+		store_fields = self.store.ListFields(name)
+		for field in fields:
+			if field not in store_fields:
+				raise da.DataAccessError("Cannot find field %s in %s" % (field, table))
+		tree = Parse(where_clause)
+		store, years = self.store, da.env.years
+
+		def rows():
+			return store.SelectRows(name, fields, tree, years)
+		return da.Cursor(fields, rows)
+
+	def UpdateCursor(self, table, fields, where_clause=None):
+		if self.store.TableName(table) is not None:
+			raise da.DataAccessError("%s is read-only in a collision store; ingest the year again to change it" % table)
+		return da.FolderWorkspace.UpdateCursor(self, table, fields, where_clause)
+
+	def ListFields(self, table):
+		name = self.store.TableName(table)
+		if name is None:
+			return da.FolderWorkspace.ListFields(self, table)
+		return self.store.ListFields(name)
+
+	def TableWriter(self, table, fields, types, index_fields):
+		if self.store.TableName(table) is not None:
+			raise da.DataAccessError("%s is a collision store table; use CollisionStore.py ingest" % table)
+		return da.FolderWorkspace.TableWriter(self, table, fields, types, index_fields)
+
+
+##### Helpers #####
+ArrowTypes = ["int64", "double", "string", "timestamp[s]", "timestamp[us]", "date32[day]", "bool"]
+
+
+def _TypeName(arrow_type):
+	name = str(arrow_type)
+	return name if name in ArrowTypes else "string"
+
+
+def _ArrowType(name):
+	import pyarrow as pa
+	return {"int64": pa.int64(), "double": pa.float64(), "string": pa.string(), "timestamp[s]": pa.timestamp("s"),
+		"timestamp[us]": pa.timestamp("us"), "date32[day]": pa.date32(), "bool": pa.bool_()}[name]
+
+
+def _Column(values, arrow_type=None):
+
+	# Arrow array of a source column: the stored type if there is one, else the type of the values (text
+	# if they are mixed)
+	import pyarrow as pa
+	if arrow_type is not None:
+		return pa.array(values, type=arrow_type)
+	try:
+		array = pa.array(values)
+	except (pa.ArrowInvalid, pa.ArrowTypeError):
+		return pa.array([None if value is None else u"%s" % value for value in values], type=pa.string())
+	if str(array.type) not in ArrowTypes:
+		if pa.types.is_integer(array.type):
+			return array.cast(pa.int64())
+		if pa.types.is_floating(array.type):
+			return array.cast(pa.float64())
+		if pa.types.is_null(array.type):
+			return array.cast(pa.string())
+		return pa.array([None if value is None else u"%s" % value for value in values], type=pa.string())
+	return array
+
+
+def _Year(value):
+	if value is None or value == "":
+		return NoYear
+	if hasattr(value, "year"):
+		return value.year
+	return ParseDate(str(value)).year
+
+
+def _DateTime(value):
+	if isinstance(value, datetime.datetime):
+		return value
+	if isinstance(value, datetime.date):
+		return datetime.datetime(value.year, value.month, value.day)
+	return ParseDate(str(value))
+
+
+def _IndexKey(value, dtype):
+	if value is None:
+		return None
+	if dtype.kind == "i":
+		try:
+			return int(float(value))
+		except (TypeError, ValueError):
+			return None
+	return u"%s" % value
+
+
+def _And(conditions):
+	tree = None
+	for condition in conditions:
+		tree = condition if tree is None else ("and", tree, condition)
+	return tree
+
+
+def _Conjuncts(tree):
+	if tree is None:
+		return []
+	if tree[0] == "and":
+		return _Conjuncts(tree[1]) + _Conjuncts(tree[2])
+	return [tree]
+
+
+def _IndexLookup(tree, index_fields):
+
+	# (field, values) of an indexed field that every matching row must have one of (an '=' or IN at the
+	# top level of the where clause), the one with the fewest values; None if there is none
+	lookups = []
+	for node in _Conjuncts(tree):
+		if node[0] == "cmp" and node[1] == "=" and node[2] in index_fields:
+			lookups.append((node[2], [node[3]]))
+		elif node[0] == "in" and node[1] in index_fields:
+			lookups.append((node[1], list(node[2])))
+	return min(lookups, key=lambda lookup: len(lookup[1])) if lookups else None
+
+
+def _DateYears(tree, date_field):
+
+	# (first, last) year the date conditions at the top level of the where clause allow, None for any
+	if date_field is None:
+		return None
+	first, last = None, None
+	for node in _Conjuncts(tree):
+		if node[0] == "cmp" and node[2] == date_field and hasattr(node[3], "year"):
+			if node[1] in (">", ">=", "="):
+				first = max(first or node[3].year, node[3].year)
+			if node[1] in ("<", "<=", "="):
+				last = min(last or node[3].year, node[3].year)
+		elif node[0] == "between" and node[1] == date_field and hasattr(node[2], "year") and hasattr(node[3], "year"):
+			first, last = max(first or node[2].year, node[2].year), min(last or node[3].year, node[3].year)
+	if first is None and last is None:
+		return None
+	return (first if first is not None else NoYear + 1, last if last is not None else 9999)
+
+
+def _Filter(table, tree):
+
+	# The literals are cast to the types of the table's fields, so the clauses the small lookups of
+	# SelectRows evaluate row by row (e.g. COLLISION_SEVERITY = '1') filter the same way here
+	if tree is None or table.num_rows == 0:
+		return table
+	return table.filter(ToArrowExpression(tree, table.schema))
+
+
+def _Replace(src, dst):
+	try:
+		os.replace(src, dst)
+	except AttributeError:
+		# Python 2: os.rename does not replace an existing file on Windows
+		if os.path.exists(dst):
+			os.remove(dst)
+		os.rename(src, dst)
+
+
+##### Command Line #####
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Build and inspect the year-partitioned collision & party store.")
+	commands = parser.add_subparsers(dest="command")
+	ingest = commands.add_parser("ingest", help="add (or replace) years of collisions & parties from a workspace")
+	ingest.add_argument("--store", required=True, help="folder of the store (created if needed)")
+	ingest.add_argument("--workspace", required=True, help="geodatabase, GeoPackage, SQLite file or folder holding the source tables")
+	ingest.add_argument("--collisions", default=Tables["collisions"]["source"], help="collision table, with COLLISION_DATE, IntID & SegID")
+	ingest.add_argument("--parties", default=Tables["parties"]["source"], help="party table, with Parties_CASE_ID")
+	ingest.add_argument("--years", default=None, help="only ingest these collision years, e.g. 2012-2016")
+	ingest.add_argument("--tables", default=None, help="comma-separated other tables to copy into the store folder (e.g. UnSigInt_Outside3miBuffer)")
+	info = commands.add_parser("info", help="list the tables & years in a store")
+	info.add_argument("--store", required=True)
+	args = parser.parse_args()
+
+	if args.command == "ingest":
+		da.env.workspace = args.workspace
+		store = CollisionStore(args.store)
+		store.Ingest(args.collisions, args.parties, da.ParseYears(args.years))
+		if args.tables:
+			store.CopyTables([t.strip() for t in args.tables.split(",") if t.strip()])
+	elif args.command == "info":
+		store = CollisionStore(args.store)
+		for name, table_info in store.manifest["tables"].items():
+			print("%s (from %s): %s" % (name, ", ".join(table_info["sources"]),
+				", ".join("%s: %d rows" % (year, rows) for year, rows in table_info["years"].items())))
+	else:
+		parser.print_help()
@@ -0,0 +1,123 @@
+#### Regression Check for the Collision Classifier #####
+
+#### Runs the row-by-row PartyFilter functions of SigWarrantSearch.py and ArcPy_RoadDietCalc.py and the
+#### array rules of CollisionClassifier.py on the same parties, and reports every collision where they
+#### disagree. Use it on a real party table, or on random parties that cover the NULL and edge cases:
+####     python CompareClassifier.py --workspace /data/WarrantSearch.gpkg
+####     python CompareClassifier.py --random 1000000
+#### Exits with status 1 if any collision is classified differently.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, os.pardir, "NewSignals"))
+sys.path.append(os.path.join(here, os.pardir, "SafetyBenefitEstimation"))
+
+import DataAccess as da
+from PartyIndex import PartyIndex
+from CollisionClassifier import SignalRule, RoadDietRule, Discarded
+import SigWarrantSearch
+import ArcPy_RoadDietCalc
+
+# Corridor directions to check the road diet rule with (as in segment_table.csv)
+CorridorDirections = ["E,W", "N,S", "N", "E", ""]
+
+
+##### Random Inputs #####
+def RandomParties(n_collisions, seed=2016):
+
+	# Party & collision rows with every code PartyFilter looks at, plus NULLs and unexpected values
+	rand = random.Random(seed)
+	directions = ["N", "S", "E", "W", "-", None]
+	movements = [chr(c) for c in range(ord("A"), ord("S"))] + ["-", None]
+	party_types = [1, 1, 1, 2, 3, 4, 5, None]
+	oaf_sections = [None, None, None, "22350", "22107", "21801", "A"]
+	alcohol = ["Y", None]
+	pcf = ['03','06','07','09','10','11','01','08','12', None]
+
+	party_rows, collision_rows = [], []
+	for case_id in rand.sample(range(1, n_collisions * 10), n_collisions):
+		for i in range(rand.choice([1, 1, 2, 2, 2, 3, 4])):
+			party_rows.append((case_id, rand.choice(directions), rand.choice(party_types), rand.choice(movements), rand.choice(oaf_sections)))
+		collision_rows.append((case_id, rand.choice(alcohol), rand.choice(pcf)))
+
+	# Some collisions have no parties at all
+	for i in range(n_collisions // 100):
+		collision_rows.append((-i - 1, None, "03"))
+
+	rand.shuffle(party_rows)
+	return party_rows, collision_rows
+
+
+##### Compare #####
+def CompareSignal(party_index):
+
+	t0 = time.time()
+	array_result = SignalRule(party_index)
+	array_time = time.time() - t0
+
+	t0 = time.time()
+	row_result = [SigWarrantSearch.PartyFilter(case_id, party_index) is True for case_id in party_index.case_ids.tolist()]
+	row_time = time.time() - t0
+
+	mismatches = [case_id for case_id, a, b in zip(party_index.case_ids.tolist(), array_result.tolist(), row_result) if a != b]
+	print("Signal rule: %d collisions, %d mismatches (arrays %.2f s, row by row %.2f s)" % (len(row_result), len(mismatches), array_time, row_time))
+	return mismatches
+
+
+def CompareRoadDiet(party_index, collision_rows, direction_text):
+
+	direction = direction_text.split(',')
+	case_ids = [row[0] for row in collision_rows]
+
+	t0 = time.time()
+	codes, speeding = RoadDietRule(party_index, direction, case_ids, [row[1] for row in collision_rows], [row[2] for row in collision_rows])
+	array_time = time.time() - t0
+
+	t0 = time.time()
+	row_result = [ArcPy_RoadDietCalc.PartyFilter(case_id, direction, alcohol, pcf, party_index) for case_id, alcohol, pcf in collision_rows]
+	row_time = time.time() - t0
+
+	mismatches = []
+	for case_id, code, speed, expected in zip(case_ids, codes.tolist(), speeding.tolist(), row_result):
+		actual = None if code == Discarded else [code, speed]
+		if actual != expected:
+			mismatches.append(case_id)
+	print("Road diet rule (%r): %d collisions, %d mismatches (arrays %.2f s, row by row %.2f s)" % (
+		direction_text, len(row_result), len(mismatches), array_time, row_time))
+	return mismatches
+
+
+##### Run the Check #####
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Check that the array classifier matches the row-by-row PartyFilter functions.")
+	parser.add_argument("--workspace", help="geodatabase, GeoPackage, SQLite file or folder holding the collision & party tables")
+	parser.add_argument("--parties", default="Collisions2009to2013PartiesJoin")
+	parser.add_argument("--collisions", default="SWITRS2009_to_2013")
+	parser.add_argument("--random", type=int, default=None, help="check this many random collisions instead of a workspace")
+	args = parser.parse_args()
+
+	if args.random:
+		party_rows, collision_rows = RandomParties(args.random)
+		party_index = PartyIndex.FromRows(party_rows)
+	elif args.workspace:
+		da.env.workspace = args.workspace
+		party_index = PartyIndex.Load(args.parties)
+		collision_rows = list(da.SearchCursor(args.collisions, ["CASE_ID", "ALCOHOL_INVOLVED", "PCF_VIOL_CATEGORY"]))
+	else:
+		parser.error("give a --workspace or a number of --random collisions")
+	print("Party index: " + party_index.Summary())
+
+	mismatches = CompareSignal(party_index)
+	for direction_text in CorridorDirections:
+		mismatches += CompareRoadDiet(party_index, collision_rows, direction_text)
+
+	if mismatches:
+		print("First mismatches (CASE_ID): " + ", ".join(str(case_id) for case_id in mismatches[:20]))
+		sys.exit(1)
+	print("All collisions match")
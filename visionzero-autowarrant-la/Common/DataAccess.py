@@ -0,0 +1,792 @@
+#### Data Access Layer #####
+
+#### A stand-in for the arcpy.da cursors used by the warrant scripts, so they can read the same
+#### tables from a file geodatabase (through arcpy) or, without ArcGIS, from SQLite, GeoPackage,
+#### CSV or Parquet files. Set env.workspace like you would with arcpy:
+####
+####     import DataAccess as da
+####     da.env.workspace = "/data/WarrantSearch.gpkg"
+####     for row in da.SearchCursor("SWITRS2009_to_2013", ["CASE_ID", "DISTANCE"], where_clause="IntID = 5"):
+####         ...
+####
+#### The workspace type comes from the path:
+####   *.gdb / *.sde / *.mdb       file geodatabase (needs arcpy)
+####   *.gpkg                      GeoPackage
+####   *.sqlite / *.sqlite3 / *.db SQLite
+####   a folder                    one file per table: <table>.parquet (file or partitioned folder) or <table>.csv
+####   a folder with store.json    a collision store (see CollisionStore.py), read for the years in env.years
+#### A table can also be given as the full path to a .csv or .parquet file.
+####
+#### Only the requested fields (plus those in the where clause) are read: the where clause is
+#### pushed down as SQL to SQLite / GeoPackage, as a row filter to Parquet, and evaluated while
+#### streaming for CSV (column types come from a .csvt file or the first rows). Besides the field
+#### names, the SHAPE@XY, SHAPE@X, SHAPE@Y and OID@ tokens are supported for point layers, and
+#### SHAPE@WKB for any GeoPackage geometry.
+####
+#### WriteTable creates (or replaces) a table from rows, e.g. for test data, and InsertCursor does the
+#### same one row at a time, so one pass can fill several tables; in a folder workspace the table is
+#### written as CSV (with a .csvt file) unless its name ends in .parquet.
+
+import csv
+import datetime
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import sys
+
+import WhereClause
+from WhereClause import Parse, Evaluate, ToSql, ToArrowExpression, QuoteName, Fields, ParseDate
+
+
+if sys.version_info[0] < 3:
+	long_type = long
+else:
+	long_type = int
+
+
+class DataAccessError(RuntimeError):
+	pass
+
+
+class _Env(object):
+	workspace = None
+	years = None    # (first, last) collision years read from a collision store, None for all
+
+env = _Env()
+
+ShapeTokens = ("SHAPE@XY", "SHAPE@X", "SHAPE@Y", "SHAPE@WKB")
+TableExtensions = (".csv", ".parquet")
+
+
+##### Open a Workspace #####
+_workspaces = {}
+
+def OpenWorkspace(path):
+
+	path = os.path.normpath(path)
+	if path in _workspaces:
+		return _workspaces[path]
+
+	ext = os.path.splitext(path)[1].lower()
+	if ext in (".gdb", ".sde", ".mdb"):
+		workspace = ArcpyWorkspace(path)
+	elif ext == ".gpkg":
+		workspace = GeoPackageWorkspace(path)
+	elif ext in (".sqlite", ".sqlite3", ".db"):
+		workspace = SqliteWorkspace(path)
+	elif IsCollisionStore(path):
+		from CollisionStore import StoreWorkspace
+		workspace = StoreWorkspace(path)
+	elif os.path.isdir(path):
+		workspace = FolderWorkspace(path)
+	else:
+		raise DataAccessError("Workspace %s does not exist or is not a supported type" % path)
+
+	_workspaces[path] = workspace
+	return workspace
+
+
+def IsCollisionStore(path):
+	return os.path.isfile(os.path.join(path, "store.json"))
+
+
+def ParseYears(text):
+
+	# "2012-2016" -> (2012, 2016), "2013" -> (2013, 2013), None -> None
+	if not text:
+		return None
+	first, _, last = str(text).partition("-")
+	return int(first), int(last or first)
+
+
+def ResetWorkspaces():
+
+	# Forget the open workspaces, e.g. in a new worker process that should not share its parent's connections
+	_workspaces.clear()
+
+
+def _Resolve(table):
+
+	# A path to a .csv/.parquet table is opened from its own folder; a relative one is taken from
+	# the workspace when that is a folder
+	if os.path.splitext(table)[1].lower() in TableExtensions:
+		if not os.path.isabs(table) and env.workspace is not None and os.path.isdir(env.workspace):
+			table = os.path.join(env.workspace, table)
+		folder, name = os.path.split(os.path.abspath(table))
+		return OpenWorkspace(folder), name
+	if env.workspace is None:
+		raise DataAccessError("No workspace set; set DataAccess.env.workspace first")
+	return OpenWorkspace(env.workspace), table
+
+
+##### arcpy-style Functions #####
+def SearchCursor(table, fields, where_clause=None):
+	workspace, name = _Resolve(table)
+	return workspace.SearchCursor(name, fields, where_clause)
+
+
+def UpdateCursor(table, fields, where_clause=None):
+	workspace, name = _Resolve(table)
+	return workspace.UpdateCursor(name, fields, where_clause)
+
+
+def ListFields(table):
+
+	# Returns the field names (arcpy.ListFields returns Field objects, use .name there)
+	workspace, name = _Resolve(table)
+	return workspace.ListFields(name)
+
+
+def WriteTable(table, fields, rows, field_types=None, index_fields=()):
+
+	# Creates (or replaces) a table from an iterable of rows; see InsertCursor
+	with InsertCursor(table, fields, field_types, index_fields) as cursor:
+		for row in rows:
+			cursor.insertRow(row)
+
+
+def ValueType(values):
+
+	# Field type for a column of Python values; NULLs do not count
+	values = [v for v in values if v is not None]
+	if values and all(isinstance(v, datetime.date) for v in values):
+		return "DateTime"
+	if values and all(isinstance(v, (int, long_type)) and not isinstance(v, bool) for v in values):
+		return "Integer"
+	if values and all(isinstance(v, (int, long_type, float)) and not isinstance(v, bool) for v in values):
+		return "Real"
+	return "String"
+
+
+##### Cursors #####
+class Cursor(object):
+
+	# Iterates the rows made by rows_factory; can be reset and used in a with block like arcpy's cursors
+	def __init__(self, fields, rows_factory):
+		self.fields = tuple(fields)
+		self._factory = rows_factory
+		self._rows = None
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		if self._rows is None:
+			self._rows = iter(self._factory())
+		return next(self._rows)
+
+	next = __next__
+
+	def reset(self):
+		self._rows = None
+
+	def close(self):
+		self._rows = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+
+class UpdateCursorBase(Cursor):
+
+	# rows_factory yields (key, row) pairs; the backend writes updated rows back by key
+	def __init__(self, fields, rows_factory):
+		Cursor.__init__(self, fields, rows_factory)
+		self._key = None
+		self._updates = []
+		self._closed = False
+
+	def __next__(self):
+		if self._rows is None:
+			self._rows = iter(self._factory())
+		self._key, row = next(self._rows)
+		return list(row)
+
+	next = __next__
+
+	def updateRow(self, row):
+		if len(row) != len(self.fields):
+			raise DataAccessError("Row has %d values for %d fields" % (len(row), len(self.fields)))
+		self._updates.append((self._key, list(row)))
+
+	def close(self):
+		if not self._closed:
+			self._closed = True
+			if self._updates:
+				self._Write(self._updates)
+		self._rows = None
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		# Nothing is written if the block failed
+		if exc_type is not None:
+			self._updates = []
+		self.close()
+
+	def __del__(self):
+		try:
+			self.close()
+		except Exception:
+			pass
+
+	def _Write(self, updates):
+		raise NotImplementedError
+
+
+class InsertCursor(object):
+
+	# Creates (or replaces) a table and appends rows to it, like arcpy.da.InsertCursor on a new table.
+	# field_types: {field: "Integer" / "Real" / "String" / "DateTime"}; fields without a type are guessed
+	# from the first rows, which are held back until then. index_fields are indexed where the backend
+	# supports it (SQLite, GeoPackage, arcpy). Rows reach the backend in batches, so several cursors can
+	# be open at once, e.g. one per output of a single pass over a table.
+	def __init__(self, table, fields, field_types=None, index_fields=(), batch_rows=10000):
+		self.workspace, self.name = _Resolve(table)
+		self.fields = list(fields)
+		self.field_types = dict(field_types or {})
+		self.index_fields = list(index_fields)
+		self.batch_rows = batch_rows
+		self.batch = []
+		self.writer = None
+		self.count = 0
+		if all(field in self.field_types for field in self.fields):
+			self._Open()
+
+	def _Open(self):
+		types = dict((field, ValueType([row[i] for row in self.batch])) for i, field in enumerate(self.fields))
+		types.update(self.field_types)
+		self.writer = self.workspace.TableWriter(self.name, self.fields, [types[field] for field in self.fields], self.index_fields)
+
+	def insertRow(self, row):
+		if len(row) != len(self.fields):
+			raise DataAccessError("Row has %d values for %d fields of %s" % (len(row), len(self.fields), self.name))
+		self.batch.append(tuple(row))
+		self.count += 1
+		if len(self.batch) >= (self.batch_rows if self.writer is not None else TypeSampleRows):
+			self._Flush()
+
+	def _Flush(self):
+		if self.writer is None:
+			self._Open()
+		if self.batch:
+			self.writer.WriteRows(self.batch)
+		self.batch = []
+
+	def close(self):
+		if self.batch is not None:
+			self._Flush()
+			self.writer.Close()
+			self.batch = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+
+
+##### File Geodatabase (arcpy) #####
+class ArcpyWorkspace(object):
+
+	def __init__(self, path):
+		self.path = path
+
+	def _Arcpy(self):
+		import arcpy
+		arcpy.env.workspace = self.path
+		return arcpy
+
+	def SearchCursor(self, table, fields, where_clause=None):
+		return self._Arcpy().da.SearchCursor(table, fields, where_clause=where_clause)
+
+	def UpdateCursor(self, table, fields, where_clause=None):
+		return self._Arcpy().da.UpdateCursor(table, fields, where_clause=where_clause)
+
+	def ListFields(self, table):
+		return [field.name for field in self._Arcpy().ListFields(table)]
+
+	def TableWriter(self, table, fields, types, index_fields):
+		return _ArcpyTableWriter(self._Arcpy(), self.path, table, fields, types, index_fields)
+
+
+class _ArcpyTableWriter(object):
+
+	def __init__(self, arcpy, path, table, fields, types, index_fields):
+		if arcpy.Exists(table):
+			arcpy.management.Delete(table)
+		arcpy.management.CreateTable(path, table)
+		field_types = {"Integer": "LONG", "Real": "DOUBLE", "String": "TEXT", "DateTime": "DATE", "Date": "DATE"}
+		for field, field_type in zip(fields, types):
+			arcpy.management.AddField(table, field, field_types[field_type])
+		self.arcpy, self.table, self.index_fields = arcpy, table, index_fields
+		self.cursor = arcpy.da.InsertCursor(table, fields)
+
+	def WriteRows(self, rows):
+		for row in rows:
+			self.cursor.insertRow(row)
+
+	def Close(self):
+		# The cursor holds a lock on the table until it is deleted
+		del self.cursor
+		for field in self.index_fields:
+			self.arcpy.management.AddIndex(self.table, [field], "%s_idx" % field)
+
+
+##### SQLite #####
+class SqliteWorkspace(object):
+
+	def __init__(self, path):
+		if not os.path.exists(path):
+			raise DataAccessError("Workspace %s does not exist" % path)
+		self.path = path
+		self.conn = sqlite3.connect(path)
+
+	def ListFields(self, table):
+		return [name for name, decl_type in self._Columns(table)]
+
+	def _Columns(self, table):
+		columns = [(row[1], (row[2] or "").upper()) for row in self.conn.execute("PRAGMA table_info(%s)" % QuoteName(table))]
+		if not columns:
+			raise DataAccessError("Table %s not found in %s" % (table, self.path))
+		return columns
+
+	def _Select(self, table, fields):
+
+		# Builds the select list and a decoder for each field
+		decl_types = dict(self._Columns(table))
+		columns, decoders = [], []
+		for field in fields:
+			if field == "OID@":
+				columns.append("rowid")
+				decoders.append(None)
+			elif field in ShapeTokens:
+				columns.append(QuoteName(self._GeometryColumn(table)))
+				decoders.append(_ShapeDecoder(field))
+			elif field in decl_types:
+				columns.append(QuoteName(field))
+				decl_type = decl_types[field]
+				decoders.append(_DecodeDate if ("DATE" in decl_type or "TIME" in decl_type) else None)
+			else:
+				raise DataAccessError("Cannot find field %s in %s" % (field, table))
+		return columns, decoders
+
+	def _GeometryColumn(self, table):
+		raise DataAccessError("Table %s has no geometry" % table)
+
+	def TableWriter(self, table, fields, types, index_fields):
+		return _SqliteTableWriter(self.conn, table, fields, types, index_fields)
+
+	def SearchCursor(self, table, fields, where_clause=None):
+
+		columns, decoders = self._Select(table, fields)
+		where_sql, params = ToSql(Parse(where_clause))
+		query = "SELECT %s FROM %s WHERE %s" % (", ".join(columns), QuoteName(table), where_sql)
+
+		def rows():
+			for row in self.conn.execute(query, params):
+				yield tuple(value if decode is None else decode(value) for value, decode in zip(row, decoders))
+		return Cursor(fields, rows)
+
+	def UpdateCursor(self, table, fields, where_clause=None):
+
+		for field in fields:
+			if field == "OID@" or field in ShapeTokens:
+				raise DataAccessError("Cannot update %s with this backend" % field)
+		columns, decoders = self._Select(table, fields)
+		where_sql, params = ToSql(Parse(where_clause))
+		query = "SELECT rowid, %s FROM %s WHERE %s" % (", ".join(columns), QuoteName(table), where_sql)
+		update = "UPDATE %s SET %s WHERE rowid = ?" % (QuoteName(table), ", ".join("%s = ?" % QuoteName(f) for f in fields))
+		conn = self.conn
+
+		def rows():
+			# Read the keys up front so the updates do not disturb the select
+			for row in conn.execute(query, params).fetchall():
+				yield row[0], tuple(value if decode is None else decode(value) for value, decode in zip(row[1:], decoders))
+
+		class _Cursor(UpdateCursorBase):
+			def _Write(self, updates):
+				with conn:
+					conn.executemany(update, [[_EncodeValue(v) for v in row] + [key] for key, row in updates])
+		return _Cursor(fields, rows)
+
+
+class _SqliteTableWriter(object):
+
+	# Dates are stored as ISO text in DATETIME columns, which the cursors decode again
+	def __init__(self, conn, table, fields, types, index_fields):
+		decl_types = {"Integer": "INTEGER", "Real": "REAL", "String": "TEXT", "DateTime": "DATETIME", "Date": "DATE"}
+		with conn:
+			conn.execute("DROP TABLE IF EXISTS %s" % QuoteName(table))
+			conn.execute("CREATE TABLE %s (%s)" % (QuoteName(table),
+				", ".join("%s %s" % (QuoteName(f), decl_types[t]) for f, t in zip(fields, types))))
+		self.conn, self.table, self.index_fields = conn, table, index_fields
+		self.insert = "INSERT INTO %s VALUES (%s)" % (QuoteName(table), ", ".join("?" * len(fields)))
+
+	def WriteRows(self, rows):
+		with self.conn:
+			self.conn.executemany(self.insert, [tuple(_EncodeValue(v) for v in row) for row in rows])
+
+	def Close(self):
+		with self.conn:
+			for field in self.index_fields:
+				self.conn.execute("CREATE INDEX %s ON %s (%s)" % (QuoteName("%s_%s_idx" % (self.table, field)),
+					QuoteName(self.table), QuoteName(field)))
+
+
+##### GeoPackage #####
+class GeoPackageWorkspace(SqliteWorkspace):
+
+	# A GeoPackage is a SQLite file; point geometries are decoded for the SHAPE@ tokens
+	def _GeometryColumn(self, table):
+		row = self.conn.execute("SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?", (table,)).fetchone()
+		if row is None:
+			raise DataAccessError("Table %s has no geometry" % table)
+		return row[0]
+
+
+def GeoPackageWkb(blob):
+
+	# GeoPackage binary header (magic, version, flags, srs_id, envelope) followed by WKB
+	if blob is None:
+		return None
+	blob = bytes(blob)
+	flags = bytearray(blob[3:4])[0]
+	envelope_size = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}[(flags >> 1) & 7]
+	if flags & 16:
+		return None
+	return blob[8 + envelope_size:]
+
+
+def GeoPackagePoint(blob):
+
+	wkb = GeoPackageWkb(blob)
+	if wkb is None:
+		return None
+	byte_order = "<" if bytearray(wkb[0:1])[0] == 1 else ">"
+	geom_type = struct.unpack(byte_order + "I", wkb[1:5])[0] % 1000
+	if geom_type != 1:
+		raise DataAccessError("SHAPE@XY is only supported for point geometries")
+	return struct.unpack(byte_order + "dd", wkb[5:21])
+
+
+def GeoPackagePointBlob(x, y, srs_id):
+
+	# Little-endian header with no envelope, followed by a WKB point
+	return b"GP" + struct.pack("<BBi", 0, 1, srs_id) + struct.pack("<BIdd", 1, 1, x, y)
+
+
+def _ShapeDecoder(token):
+	if token == "SHAPE@XY":
+		return GeoPackagePoint
+	if token == "SHAPE@WKB":
+		return GeoPackageWkb
+	index = 0 if token == "SHAPE@X" else 1
+	return lambda blob: None if blob is None else GeoPackagePoint(blob)[index]
+
+
+##### Folder of CSV / Parquet Tables #####
+class FolderWorkspace(object):
+
+	def __init__(self, path):
+		self.path = path
+
+	def _Table(self, table):
+
+		# Parquet first, since it is the faster format when both are there
+		name = os.path.splitext(table)[0] if os.path.splitext(table)[1].lower() in TableExtensions else table
+		parquet_path = os.path.join(self.path, name + ".parquet")
+		csv_path = os.path.join(self.path, name + ".csv")
+		if table.lower().endswith(".csv"):
+			parquet_path = None
+		if parquet_path and os.path.exists(parquet_path):
+			return _ParquetTable(parquet_path)
+		if os.path.exists(csv_path):
+			return _CsvTable(csv_path)
+		raise DataAccessError("Table %s not found in %s" % (table, self.path))
+
+	def SearchCursor(self, table, fields, where_clause=None):
+		return self._Table(table).SearchCursor(fields, where_clause)
+
+	def UpdateCursor(self, table, fields, where_clause=None):
+		return self._Table(table).UpdateCursor(fields, where_clause)
+
+	def ListFields(self, table):
+		return self._Table(table).ListFields()
+
+	def TableWriter(self, table, fields, types, index_fields):
+
+		# <table>.parquet if asked for, else <table>.csv; the other format's file is removed so it
+		# cannot shadow the new table
+		name, ext = os.path.splitext(table)
+		if ext.lower() not in TableExtensions:
+			name, ext = table, ".csv"
+		for other in TableExtensions:
+			other_path = os.path.join(self.path, name + other)
+			if other != ext.lower() and os.path.isfile(other_path):
+				os.remove(other_path)
+		if ext.lower() == ".parquet":
+			return _ParquetWriter(os.path.join(self.path, name + ".parquet"), fields, types)
+		return _CsvWriter(os.path.join(self.path, name + ".csv"), fields, types)
+
+
+def OpenCsv(path, mode="r"):
+
+	# csv wants binary files on Python 2 and newline='' text files on Python 3
+	if sys.version_info[0] < 3:
+		return open(path, mode + "b")
+	return open(path, mode, newline="")
+
+
+IntPattern = re.compile(r"^-?(0|[1-9]\d*)$")
+FloatPattern = re.compile(r"^-?(0|[1-9]\d*)?\.\d+([eE][-+]?\d+)?$|^-?(0|[1-9]\d*)([eE][-+]?\d+)?$")
+
+# Rows sampled to guess the column types of a CSV without a .csvt file
+TypeSampleRows = 1000
+
+def ColumnType(values):
+
+	# Guesses a column type from its text values. A column is only numeric if every value is,
+	# so codes like '03' / '10' stay strings. Empty values are NULL and do not count.
+	values = [v for v in values if v != ""]
+	if not values:
+		return "String"
+	if all(IntPattern.match(v) for v in values):
+		return "Integer"
+	if all(FloatPattern.match(v) for v in values):
+		return "Real"
+	if all(WhereClause.DatePattern.match(v) for v in values):
+		return "DateTime"
+	return "String"
+
+
+def ParseValue(text, column_type="String"):
+
+	if text == "":
+		return None
+	if column_type == "Integer":
+		return int(text)
+	if column_type == "Real":
+		return float(text)
+	if column_type in ("Date", "DateTime"):
+		return ParseDate(text)
+	return text
+
+
+def _EncodeValue(value):
+	if isinstance(value, datetime.datetime):
+		return value.strftime("%Y-%m-%d %H:%M:%S")
+	if isinstance(value, datetime.date):
+		return value.strftime("%Y-%m-%d")
+	return value
+
+
+def _FormatValue(value):
+	if value is None:
+		return ""
+	return str(_EncodeValue(value))
+
+
+def _DecodeDate(value):
+	if value and hasattr(value, "strip"):
+		return ParseDate(value)
+	return value
+
+
+class _CsvTable(object):
+
+	# Column types come from a GDAL-style .csvt file next to the CSV (one line of quoted types,
+	# e.g. "Integer","String","DateTime") or are guessed from the first rows of the file
+	def __init__(self, path):
+		self.path = path
+		self._types = None
+
+	def ColumnTypes(self):
+		if self._types is None:
+			with OpenCsv(self.path) as fin:
+				reader = csv.reader(fin)
+				header = next(reader)
+				csvt_path = os.path.splitext(self.path)[0] + ".csvt"
+				if os.path.exists(csvt_path):
+					with OpenCsv(csvt_path) as ftypes:
+						types = [t.strip().split("(")[0] for t in next(csv.reader(ftypes))]
+				else:
+					sample = [record for i, record in zip(range(TypeSampleRows), reader)]
+					types = [ColumnType([record[i] for record in sample if i < len(record)]) for i in range(len(header))]
+			self._types = dict(zip(header, types))
+		return self._types
+
+	def ListFields(self):
+		with OpenCsv(self.path) as fin:
+			return next(csv.reader(fin))
+
+	def _Positions(self, header, names):
+		positions = {}
+		for name in names:
+			if name == "OID@":
+				continue
+			if name not in header:
+				raise DataAccessError("Cannot find field %s in %s" % (name, self.path))
+			positions[name] = header.index(name)
+		return positions
+
+	def _Rows(self, fields, where_clause):
+
+		# Streams (row number, raw row, parsed values) for the rows matching the where clause;
+		# only the fields that are asked for or filtered on are parsed
+		tree = Parse(where_clause)
+		for field in fields:
+			if field in ShapeTokens:
+				raise DataAccessError("%s is not supported for CSV tables" % field)
+		with OpenCsv(self.path) as fin:
+			reader = csv.reader(fin)
+			header = next(reader)
+			positions = self._Positions(header, list(fields) + Fields(tree))
+			types = self.ColumnTypes()
+			for oid, record in enumerate(reader, 1):
+				values = dict((name, ParseValue(record[i], types[name])) for name, i in positions.items())
+				values["OID@"] = oid
+				if tree is None or Evaluate(tree, values) is True:
+					yield oid, record, tuple(values[f] for f in fields)
+
+	def SearchCursor(self, fields, where_clause=None):
+		return Cursor(fields, lambda: (row for oid, record, row in self._Rows(fields, where_clause)))
+
+	def UpdateCursor(self, fields, where_clause=None):
+
+		path = self.path
+		header = self.ListFields()
+		positions = self._Positions(header, fields)
+
+		class _Cursor(UpdateCursorBase):
+			def _Write(self, updates):
+				# Rewrite the file with the updated values, then swap it in
+				changed = dict(updates)
+				temp_path = path + ".tmp"
+				with OpenCsv(path) as fin:
+					with OpenCsv(temp_path, "w") as fout:
+						reader, writer = csv.reader(fin), csv.writer(fout, lineterminator="\n")
+						writer.writerow(next(reader))
+						for oid, record in enumerate(reader, 1):
+							if oid in changed:
+								for field, value in zip(fields, changed[oid]):
+									record[positions[field]] = _FormatValue(value)
+							writer.writerow(record)
+				shutil.move(temp_path, path)
+
+		return _Cursor(fields, lambda: ((oid, row) for oid, record, row in self._Rows(fields, where_clause)))
+
+
+class _CsvWriter(object):
+
+	def __init__(self, path, fields, types):
+		with OpenCsv(os.path.splitext(path)[0] + ".csvt", "w") as fout:
+			csv.writer(fout, quoting=csv.QUOTE_ALL, lineterminator="\n").writerow(types)
+		self.fout = OpenCsv(path, "w")
+		self.writer = csv.writer(self.fout, lineterminator="\n")
+		self.writer.writerow(fields)
+
+	def WriteRows(self, rows):
+		self.writer.writerows([_FormatValue(value) for value in row] for row in rows)
+
+	def Close(self):
+		self.fout.close()
+
+
+class _ParquetTable(object):
+
+	# A single .parquet file, or a folder of them (hive partitions like year=2013/ are read as fields)
+	def __init__(self, path):
+		self.path = path
+
+	def _Dataset(self):
+		import pyarrow.dataset as ds
+		return ds.dataset(self.path, format="parquet", partitioning="hive")
+
+	def ListFields(self):
+		return self._Dataset().schema.names
+
+	def SearchCursor(self, fields, where_clause=None):
+
+		for field in fields:
+			if field == "OID@" or field in ShapeTokens:
+				raise DataAccessError("%s is not supported for Parquet tables" % field)
+		dataset = self._Dataset()
+		for field in fields:
+			if field not in dataset.schema.names:
+				raise DataAccessError("Cannot find field %s in %s" % (field, self.path))
+		expression = ToArrowExpression(Parse(where_clause), dataset.schema)
+
+		def rows():
+			for batch in dataset.to_batches(columns=list(fields), filter=expression):
+				columns = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+				for row in zip(*columns):
+					yield row
+		return Cursor(fields, rows)
+
+	def UpdateCursor(self, fields, where_clause=None):
+
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+		if os.path.isdir(self.path):
+			raise DataAccessError("Cannot update a partitioned Parquet table")
+
+		path = self.path
+		table = pq.read_table(path)
+		tree = Parse(where_clause)
+		names = list(fields) + [f for f in Fields(tree) if f not in fields]
+		columns = dict((name, table.column(name).to_pylist()) for name in names)
+
+		def rows():
+			for i in range(table.num_rows):
+				values = dict((name, columns[name][i]) for name in names)
+				if tree is None or Evaluate(tree, values) is True:
+					yield i, tuple(values[f] for f in fields)
+
+		class _Cursor(UpdateCursorBase):
+			def _Write(self, updates):
+				new_table = table
+				for j, field in enumerate(fields):
+					values = list(columns[field])
+					for i, row in updates:
+						values[i] = row[j]
+					position = new_table.schema.get_field_index(field)
+					new_table = new_table.set_column(position, new_table.schema.field(position), pa.array(values, type=new_table.schema.field(position).type))
+				pq.write_table(new_table, path)
+
+		return _Cursor(fields, rows)
+
+
+class _ParquetWriter(object):
+
+	# Rows are written in row groups of row_group_rows, so they never all have to be in memory
+	def __init__(self, path, fields, types, row_group_rows=100000):
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+		arrow_types = {"Integer": pa.int64(), "Real": pa.float64(), "String": pa.string(), "DateTime": pa.timestamp("s"), "Date": pa.date32()}
+		self.pa = pa
+		self.schema = pa.schema([(field, arrow_types[field_type]) for field, field_type in zip(fields, types)])
+		self.writer = pq.ParquetWriter(path, self.schema)
+		self.row_group_rows = row_group_rows
+		self.pending = []
+
+	def WriteRows(self, rows):
+		self.pending.extend(rows)
+		if len(self.pending) >= self.row_group_rows:
+			self._WriteGroup()
+
+	def _WriteGroup(self):
+		if self.pending:
+			columns = [self.pa.array(list(column), type=self.schema.field(i).type) for i, column in enumerate(zip(*self.pending))]
+			self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+			self.pending = []
+
+	def Close(self):
+		try:
+			self._WriteGroup()
+		finally:
+			self.writer.close()
@@ -0,0 +1,142 @@
+#### Instrumentation #####
+
+#### Logging, stage timers and counters for the warrant & road diet scripts, in place of print tracing.
+####
+####     log = Logger("SigWarrantSearch")
+####     with Stage("load"):
+####         ...
+####     Count("collisions_scanned", n)
+####
+#### Messages go through the standard logging module: INFO by default, so the per-collision DEBUG
+#### messages cost next to nothing unless --log-level DEBUG is given. With --profile report.json the
+#### time spent in each stage, the counters and the peak memory are written as JSON at the end of the run.
+
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+	import resource
+except ImportError:
+	resource = None  # Windows
+
+LogFormat = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+##### Logging #####
+def Logger(name):
+	return logging.getLogger("visionzero." + name)
+
+
+class JsonFormatter(logging.Formatter):
+
+	# One JSON object per line, for log collectors
+	def format(self, record):
+		return json.dumps(OrderedDict([
+			("time", self.formatTime(record)),
+			("level", record.levelname),
+			("logger", record.name),
+			("message", record.getMessage()),
+		]))
+
+
+def SetupLogging(level="INFO", json_lines=False):
+	handler = logging.StreamHandler(sys.stderr if json_lines else sys.stdout)
+	handler.setFormatter(JsonFormatter() if json_lines else logging.Formatter(LogFormat))
+	root = logging.getLogger("visionzero")
+	root.handlers = [handler]
+	root.setLevel(getattr(logging, level.upper()))
+	root.propagate = False
+
+
+##### Timers & Counters #####
+class Profile(object):
+
+	def __init__(self):
+		self.Reset()
+
+	def Reset(self):
+		self.started = time.time()
+		self.stages = OrderedDict()    # name -> [seconds, calls]
+		self.counters = OrderedDict()  # name -> count
+
+	@contextmanager
+	def Stage(self, name):
+
+		# Time spent in the block is added to the stage, however many times it runs
+		t0 = time.time()
+		try:
+			yield
+		finally:
+			stage = self.stages.setdefault(name, [0.0, 0])
+			stage[0] += time.time() - t0
+			stage[1] += 1
+
+	def Count(self, name, n=1):
+		self.counters[name] = self.counters.get(name, 0) + n
+
+	def Merge(self, counters):
+
+		# Counters sent back from a worker process
+		for name, n in counters.items():
+			self.Count(name, n)
+
+	def Report(self, script=None):
+		return OrderedDict([
+			("script", script),
+			("started", time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started))),
+			("total_seconds", round(time.time() - self.started, 4)),
+			("peak_memory_mb", PeakMemoryMB()),
+			("stages", OrderedDict((name, OrderedDict([("seconds", round(seconds, 4)), ("calls", calls)]))
+				for name, (seconds, calls) in self.stages.items())),
+			("counters", self.counters),
+		])
+
+	def WriteReport(self, path, script=None):
+		with open(path, "w") as fout:
+			json.dump(self.Report(script), fout, indent=2)
+			fout.write("\n")
+
+
+def PeakMemoryMB():
+
+	# Peak resident memory of this process, in MB. On Linux VmHWM is used, since ru_maxrss carries over the
+	# parent's peak when a script is started from another Python process; None on Windows
+	try:
+		with open("/proc/self/status") as fin:
+			for line in fin:
+				if line.startswith("VmHWM:"):
+					return round(int(line.split()[1]) / 1024.0, 1)
+	except (IOError, OSError):
+		pass
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return round(peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0, 1)
+
+
+# One profile per process, shared by the scripts and the Common modules
+profile = Profile()
+Stage = profile.Stage
+Count = profile.Count
+
+
+##### Command Line #####
+def AddArguments(parser):
+	parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="DEBUG traces every intersection & collision")
+	parser.add_argument("--log-json", action="store_true", help="write log messages as JSON lines (to stderr)")
+	parser.add_argument("--profile", default=None, help="write the stage timings & counters of the run to this JSON file")
+
+
+def Configure(args):
+	SetupLogging(args.log_level, args.log_json)
+	profile.Reset()
+
+
+def Finish(args, script):
+	if args.profile:
+		profile.WriteReport(args.profile, script)
+		Logger(script).info("Wrote profile to %s", args.profile)
@@ -0,0 +1,240 @@
+#### Intersection Collisions #####
+
+#### The qualifying collisions of every intersection searched for the signal warrant, kept in a few
+#### flat arrays instead of a dictionary of {CASE_ID: date} per intersection. The collisions of all the
+#### intersections are packed one after the other (CSR layout): offsets[i]:offsets[i + 1] are the
+#### collisions of int_ids[i] in case_ids (int64) and dates (datetime64), in the order they were found,
+#### and ksi[i] is its bike/ped KSI count. The window evaluation (RollingWindow.py) reads the offsets
+#### & dates as they are, and only the qualifying intersections are turned back into Python rows for
+#### the CSV.
+####
+#### Run this file directly to compare the construction time and peak memory with the dictionaries:
+####     python IntersectionCollisions.py --workspace /data/WarrantSearch.gpkg --repeat 20
+
+import argparse
+import datetime
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import DataAccess as da
+
+# Dates are kept to the microsecond, so the rows written back are the same as the ones read
+DateType = "datetime64[us]"
+
+# Collisions collected as Python objects before they are packed into arrays
+BatchRows = 65536
+
+Epoch = datetime.datetime(1970, 1, 1)
+NaT = np.iinfo(np.int64).min
+
+
+class IntersectionCollisions(object):
+
+	def __init__(self, int_ids, offsets, case_ids, dates, ksi):
+		self.int_ids = int_ids           # list, in the order the intersections were searched
+		self.offsets = offsets           # int64, collisions of int_ids[i] are at offsets[i]:offsets[i + 1]
+		self.case_ids = case_ids         # int64
+		self.dates = dates               # datetime64[us], NaT for NULL
+		self.ksi = ksi                   # int32, bike/ped KSI collisions of each intersection
+
+	##### Build #####
+	@classmethod
+	def Concat(cls, parts):
+
+		# One set of intersections from several (e.g. the shards of a parallel search), in the order given
+		parts = list(parts)
+		if not parts:
+			return Builder().Build()
+		starts = np.cumsum([0] + [len(part.case_ids) for part in parts[:-1]])
+		return cls([int_id for part in parts for int_id in part.int_ids],
+			np.concatenate([[0]] + [part.offsets[1:] + start for part, start in zip(parts, starts)]).astype(np.int64),
+			np.concatenate([part.case_ids for part in parts]).astype(np.int64),
+			np.concatenate([part.dates for part in parts]).astype(DateType),
+			np.concatenate([part.ksi for part in parts]).astype(np.int32))
+
+	@classmethod
+	def FromDicts(cls, intersection_dict, intersection_dict2):
+
+		# From the {int_id: {CASE_ID: date}} and {int_id: bike/ped KSI} dictionaries of the original search
+		builder = Builder()
+		for int_id, collisions in intersection_dict.items():
+			builder.Add(int_id, list(collisions), list(collisions.values()), intersection_dict2[int_id])
+		return builder.Build()
+
+	##### Lookup #####
+	def Collisions(self, i, order=None):
+
+		# (CASE_ID, date) rows of the i-th intersection; order is an index into the packed arrays (e.g. the
+		# sort order of RollingWindow) to return them in
+		positions = np.arange(self.offsets[i], self.offsets[i + 1]) if order is None else order[self.offsets[i]:self.offsets[i + 1]]
+		return list(zip(self.case_ids[positions].tolist(), self.dates[positions].astype(object).tolist()))
+
+	def Date(self, position):
+		return self.dates[position].astype(object)
+
+	def Count(self, i):
+		return int(self.offsets[i + 1] - self.offsets[i])
+
+	def __len__(self):
+		return len(self.int_ids)
+
+	def ToDicts(self):
+
+		# The dictionaries of the original search, e.g. for comparing results
+		intersection_dict, intersection_dict2 = OrderedDict(), OrderedDict()
+		for i, int_id in enumerate(self.int_ids):
+			intersection_dict[int_id] = OrderedDict(self.Collisions(i))
+			intersection_dict2[int_id] = int(self.ksi[i])
+		return intersection_dict, intersection_dict2
+
+	##### Sizing #####
+	def MemoryUsage(self):
+		return sum(a.nbytes for a in (self.offsets, self.case_ids, self.dates, self.ksi))
+
+	def CollisionCount(self):
+		return int(self.offsets[-1])
+
+	def Summary(self):
+		return "%d collisions at %d intersections, %.1f MB" % (self.CollisionCount(), len(self), self.MemoryUsage() / 1e6)
+
+
+class Builder(object):
+
+	# Collects the collisions one intersection at a time; they are packed into arrays every BatchRows
+	# collisions, so no more than that are ever held as Python objects
+	def __init__(self):
+		self.int_ids = []
+		self.offsets = [0]
+		self.ksi = []
+		self.batches = []
+		self.case_ids = []
+		self.dates = []
+		self.packed = 0
+
+	def Add(self, int_id, case_ids, dates, ksi):
+		self.int_ids.append(int_id)
+		self.case_ids.extend(case_ids)
+		self.dates.extend(dates)
+		self.offsets.append(self.packed + len(self.case_ids))
+		self.ksi.append(ksi)
+		if len(self.case_ids) >= BatchRows:
+			self._Pack()
+
+	def Build(self):
+		self._Pack()
+		case_ids = np.concatenate([batch[0] for batch in self.batches]) if self.batches else np.zeros(0, dtype=np.int64)
+		dates = np.concatenate([batch[1] for batch in self.batches]) if self.batches else np.zeros(0, dtype=DateType)
+		return IntersectionCollisions(self.int_ids, np.asarray(self.offsets, dtype=np.int64), case_ids, dates, np.asarray(self.ksi, dtype=np.int32))
+
+	def _Pack(self):
+		if self.case_ids:
+			dates = np.array([_Microseconds(date) for date in self.dates], dtype=np.int64).view(DateType)
+			self.batches.append((np.asarray(self.case_ids, dtype=np.int64), dates))
+			self.packed += len(self.case_ids)
+			self.case_ids, self.dates = [], []
+
+
+def _Microseconds(value):
+
+	# Microseconds since 1970 of a datetime; much quicker than letting numpy convert each datetime object
+	if isinstance(value, datetime.datetime) and value.tzinfo is None:
+		delta = value - Epoch
+		return delta.days * 86400000000 + delta.seconds * 1000000 + delta.microseconds
+	if value is None:
+		return NaT
+	return int(np.datetime64(value, "us").astype(np.int64))
+
+
+##### Report #####
+def _ReadRows(table, repeat):
+
+	# (IntID, CASE_ID, date, bike/ped KSI) rows grouped by intersection, like the per-intersection queries;
+	# each repeat is a copy with new IDs, to stand in for a larger (e.g. statewide) table
+	fields = ["IntID", "CASE_ID", "COLLISION_DATE", "PEDESTRIAN_ACCIDENT", "BICYCLE_ACCIDENT", "COLLISION_SEVERITY"]
+	rows = [(int(r[0]), int(r[1]), r[2], (r[3] == 'Y' or r[4] == 'Y') and r[5] in (1, 2))
+		for r in da.SearchCursor(table, fields, where_clause="IntID IS NOT NULL AND DISTANCE <= 100 AND ALCOHOL_INVOLVED IS NULL")]
+	rows.sort(key=lambda r: r[0])
+	int_step = max([r[0] for r in rows] or [0]) + 1
+	case_step = max([r[1] for r in rows] or [0]) + 1
+	for copy in range(repeat):
+		for int_id, case_id, date, ksi in rows:
+			yield int_id + copy * int_step, case_id + copy * case_step, date, ksi
+
+
+def _Groups(rows):
+	group, current = [], None
+	for row in rows:
+		if row[0] != current and group:
+			yield current, group
+			group = []
+		current = row[0]
+		group.append(row)
+	if group:
+		yield current, group
+
+
+def _BuildDicts(groups):
+
+	# The original search: an ordered {CASE_ID: date} per intersection & the KSI counts, then the flat
+	# lists CountByYear made from them for the window
+	intersection_dict, intersection_dict2 = OrderedDict(), OrderedDict()
+	for int_id, group in groups:
+		intersection_dict[int_id] = OrderedDict((case_id, date) for i, case_id, date, ksi in group)
+		intersection_dict2[int_id] = sum(1 for row in group if row[3])
+	col_ids, col_dates, offsets = [], [], [0]
+	for int_id in intersection_dict:
+		for col_id, col_date in intersection_dict[int_id].items():
+			col_ids.append(col_id)
+			col_dates.append(col_date)
+		offsets.append(len(col_ids))
+	return intersection_dict, intersection_dict2, col_ids, col_dates, offsets
+
+
+def _BuildArrays(groups):
+	builder = Builder()
+	for int_id, group in groups:
+		builder.Add(int_id, [row[1] for row in group], [row[2] for row in group], sum(1 for row in group if row[3]))
+	return builder.Build()
+
+
+def _Measure(build, groups):
+
+	# Construction time, then the peak of the traced allocations in a second build (Python 3; tracing
+	# slows the build down). The groups are made beforehand, so only the storage itself is counted
+	t0 = time.time()
+	build(groups)
+	elapsed = time.time() - t0
+	try:
+		import tracemalloc
+	except ImportError:
+		return elapsed, None
+	tracemalloc.start()
+	result = build(groups)
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del result
+	return elapsed, peak
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Compare the construction time and peak memory of the packed intersection collisions with the dictionaries of the original search.")
+	parser.add_argument("--workspace", required=True, help="geodatabase, GeoPackage, SQLite file or folder holding the collision table")
+	parser.add_argument("--table", default="SWITRS2009_to_2013")
+	parser.add_argument("--repeat", type=int, default=1, help="copies of the collisions (with new IDs), to stand in for a larger table")
+	args = parser.parse_args()
+	da.env.workspace = args.workspace
+
+	t0 = time.time()
+	groups = list(_Groups(_ReadRows(args.table, args.repeat)))
+	print("Read %d collisions at %d intersections in %.2f s" % (sum(len(g) for i, g in groups), len(groups), time.time() - t0))
+
+	results = []
+	for name, build in (("dictionaries", _BuildDicts), ("arrays", _BuildArrays)):
+		elapsed, peak = _Measure(build, groups)
+		results.append((name, elapsed, peak))
+		print("%-12s built in %.2f s, peak %s" % (name, elapsed, "%.1f MB" % (peak / 1e6) if peak is not None else "n/a (needs Python 3)"))
+	if results[0][2] and results[1][2]:
+		print("arrays: %.1fx the speed, %.1fx less memory" % (results[0][1] / max(results[1][1], 1e-9), results[0][2] / float(results[1][2])))
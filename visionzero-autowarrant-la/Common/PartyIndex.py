@@ -0,0 +1,165 @@
+#### Party Index #####
+
+#### Loads the party table once and keeps it in memory keyed by CASE_ID, so PartyFilter can look up
+#### the parties of a collision without a new SearchCursor (and where clause) for every collision.
+####
+#### The parties are stored as columns: a sorted array of CASE_IDs, an offsets array pointing into the
+#### packed party columns (DIR_OF_TRAVEL, PARTY_TYPE, MOVE_PRE_ACC, OAF_VIOL_SECTION), and the
+#### parties of each collision stay in the order they were read from the table.
+####
+#### Run this file directly to report the memory footprint and lookup latency for a party table:
+####     python PartyIndex.py --workspace /data/WarrantSearch.gpkg --table Collisions2009to2013PartiesJoin
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+import DataAccess as da
+
+# Fields read from the party table, in the order the rows are returned by Parties()
+Fields = ["Parties_CASE_ID", "Parties_DIR_OF_TRAVEL", "Parties_PARTY_TYPE", "Parties_MOVE_PRE_ACC", "Parties_OAF_VIOL_SECTION"]
+
+# Stored in place of NULL, and for OAF violation sections that are not numbers
+NullCode = -1
+OtherCode = -2
+
+
+class PartyIndex(object):
+
+	def __init__(self, case_ids, offsets, direction, party_type, movement, oaf_section):
+		self.case_ids = case_ids         # int64, sorted & unique
+		self.offsets = offsets           # int64, parties of case_ids[i] are at offsets[i]:offsets[i + 1]
+		self.direction = direction       # S1, b'' for NULL
+		self.party_type = party_type     # int8, -1 for NULL
+		self.movement = movement         # S1, b'' for NULL
+		self.oaf_section = oaf_section   # int32, -1 for NULL, -2 if not a number
+
+	##### Build #####
+	@classmethod
+	def Load(cls, parties_table, fields=Fields, where_clause=None):
+
+		# One pass over the party table, through the data access layer
+		return cls.FromRows(da.SearchCursor(parties_table, fields, where_clause=where_clause))
+
+	@classmethod
+	def FromRows(cls, party_rows):
+
+		case_ids, directions, party_types, movements, oaf_sections = [], [], [], [], []
+		for case_id, direction, party_type, movement, oaf in party_rows:
+			case_ids.append(int(case_id))
+			directions.append(_Code(direction))
+			party_types.append(NullCode if party_type is None else int(party_type))
+			movements.append(_Code(movement))
+			oaf_sections.append(_Section(oaf))
+
+		# Group the parties by CASE_ID; the stable sort keeps each collision's parties in table order
+		case_ids = np.asarray(case_ids, dtype=np.int64)
+		order = np.argsort(case_ids, kind="mergesort")
+		sorted_ids = case_ids[order]
+		unique_ids, starts = np.unique(sorted_ids, return_index=True)
+		offsets = np.append(starts, len(sorted_ids)).astype(np.int64)
+
+		return cls(unique_ids, offsets,
+			np.asarray(directions, dtype="S1")[order],
+			np.asarray(party_types, dtype=np.int8)[order],
+			np.asarray(movements, dtype="S1")[order],
+			np.asarray(oaf_sections, dtype=np.int32)[order])
+
+	##### Lookup #####
+	def Slice(self, case_id):
+
+		# Start & end of the collision's parties in the packed columns, (0, 0) if it has none
+		i = np.searchsorted(self.case_ids, int(case_id))
+		if i < len(self.case_ids) and self.case_ids[i] == int(case_id):
+			return int(self.offsets[i]), int(self.offsets[i + 1])
+		return 0, 0
+
+	def Parties(self, case_id):
+
+		# Party rows laid out like Fields: (CASE_ID, DIR_OF_TRAVEL, PARTY_TYPE, MOVE_PRE_ACC, OAF_VIOL_SECTION)
+		start, end = self.Slice(case_id)
+		if start == end:
+			return []
+		return list(zip([case_id] * (end - start),
+			[_Decode(d) for d in self.direction[start:end].tolist()],
+			[None if t == NullCode else t for t in self.party_type[start:end].tolist()],
+			[_Decode(m) for m in self.movement[start:end].tolist()],
+			[None if s == NullCode else s for s in self.oaf_section[start:end].tolist()]))
+
+	def __len__(self):
+		return len(self.case_ids)
+
+	##### Sizing #####
+	def MemoryUsage(self):
+		return sum(array.nbytes for array in (self.case_ids, self.offsets, self.direction, self.party_type, self.movement, self.oaf_section))
+
+	def PartyCount(self):
+		return int(self.offsets[-1])
+
+	def TimeLookups(self, n=10000, seed=0):
+
+		# Mean and 99th percentile lookup time (microseconds) for random CASE_IDs
+		rand = random.Random(seed)
+		sample = [int(self.case_ids[rand.randrange(len(self.case_ids))]) for i in range(n)] if len(self.case_ids) else []
+		times = []
+		for case_id in sample:
+			t0 = time.time()
+			self.Parties(case_id)
+			times.append((time.time() - t0) * 1e6)
+		times.sort()
+		if not times:
+			return 0.0, 0.0
+		return sum(times) / len(times), times[min(len(times) - 1, int(len(times) * 0.99))]
+
+	def Summary(self):
+		return "%d parties in %d collisions, %.1f MB (%.1f bytes per party)" % (
+			self.PartyCount(), len(self), self.MemoryUsage() / 1e6, self.MemoryUsage() / float(max(self.PartyCount(), 1)))
+
+
+##### Helpers #####
+def _Code(value):
+	if value is None:
+		return b""
+	return str(value).encode("ascii")[:1]
+
+
+def _Decode(value):
+	if value == b"":
+		return None
+	return value.decode("ascii")
+
+
+def _Section(value):
+
+	# OAF_VIOL_SECTION is a text field; PartyFilter only ever compares it to 22350
+	if value is None:
+		return NullCode
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		return OtherCode
+
+
+##### Report #####
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Report the memory footprint and lookup latency of the party index.")
+	parser.add_argument("--workspace", required=True, help="geodatabase, GeoPackage, SQLite file or folder holding the party table")
+	parser.add_argument("--table", default="Collisions2009to2013PartiesJoin")
+	parser.add_argument("--lookups", type=int, default=10000, help="number of random lookups to time")
+	parser.add_argument("--scale-to", type=int, default=None, help="also estimate the memory for this many parties (e.g. the statewide table)")
+	args = parser.parse_args()
+	da.env.workspace = args.workspace
+
+	t0 = time.time()
+	index = PartyIndex.Load(args.table)
+	print("Loaded %s in %.2f s" % (index.Summary(), time.time() - t0))
+
+	mean_us, p99_us = index.TimeLookups(args.lookups)
+	print("Lookup latency over %d random CASE_IDs: mean %.1f us, p99 %.1f us" % (args.lookups, mean_us, p99_us))
+
+	if args.scale_to:
+		per_party = index.MemoryUsage() / float(max(index.PartyCount(), 1))
+		print("Estimated size for %d parties: %.1f MB" % (args.scale_to, per_party * args.scale_to / 1e6))
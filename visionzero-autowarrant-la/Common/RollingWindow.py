@@ -0,0 +1,71 @@
+#### Rolling Window Warrant Evaluator #####
+
+#### Counts, for every collision, how many collisions at the same location fall in the window that
+#### starts on its date (e.g. the 12 months used by the CA MUTCD signal warrant: 5 or more correctable
+#### collisions within 12 months). All locations are evaluated together with NumPy: the collisions are
+#### sorted once by (location, date) and the window ends are found with a binary search, so the whole
+#### run is O(n log n) instead of rescanning each location's collisions for every collision.
+####
+#### Collisions are passed in CSR form: the collisions of location i are at offsets[i]:offsets[i + 1]
+#### of the dates array.
+
+from collections import namedtuple
+
+import numpy as np
+
+# Defaults for the signal warrant
+WindowDays = 365
+Threshold = 5
+
+WindowResult = namedtuple("WindowResult", [
+	"order",         # index into the input arrays, sorting each location's collisions by date
+	"counts",        # collisions in the window starting at each (sorted) collision
+	"max_count",     # largest window count per location (0 if it has no collisions)
+	"latest_start",  # index into the sorted arrays of the latest window start meeting the threshold, or -1
+	"qualifies",     # max_count >= threshold per location
+])
+
+
+##### Evaluate #####
+def EvaluateWindows(offsets, dates, window_days=WindowDays, threshold=Threshold):
+
+	# The window is inclusive at both ends, [date, date + window_days], like the original loop
+	offsets = np.asarray(offsets, dtype=np.int64)
+	seconds = np.asarray(dates, dtype="datetime64[s]").astype(np.int64)
+	n_groups = len(offsets) - 1
+	sizes = np.diff(offsets)
+	groups = np.repeat(np.arange(n_groups, dtype=np.int64), sizes)
+
+	# Stable sort by (location, date), so ties keep their input order
+	order = np.lexsort((seconds, groups))
+	window = np.int64(window_days) * 86400
+
+	if len(seconds):
+		# One sorted key for all locations: each location gets its own band, wider than any window
+		low = seconds.min()
+		span = seconds.max() - low + window + 1
+		keys = groups * span + (seconds[order] - low)
+
+		# Collisions in [date, date + window]: ties on the start date count too
+		window_end = np.searchsorted(keys, keys + window, side="right")
+		window_begin = np.searchsorted(keys, keys, side="left")
+		counts = window_end - window_begin
+	else:
+		counts = np.zeros(0, dtype=np.int64)
+
+	max_count = GroupMax(counts, offsets, empty=0)
+	positions = np.where(counts >= threshold, np.arange(len(counts)), -1)
+	latest_start = GroupMax(positions, offsets, empty=-1)
+
+	return WindowResult(order, counts, max_count, latest_start, max_count >= threshold)
+
+
+def GroupMax(values, offsets, empty):
+
+	# Maximum of values over each CSR group; reduceat needs the empty groups skipped
+	offsets = np.asarray(offsets, dtype=np.int64)
+	result = np.full(len(offsets) - 1, empty, dtype=np.int64)
+	nonempty = np.flatnonzero(np.diff(offsets) > 0)
+	if len(nonempty):
+		result[nonempty] = np.maximum.reduceat(np.asarray(values, dtype=np.int64), offsets[:-1][nonempty])
+	return result
@@ -0,0 +1,267 @@
+#### Collision Snapping Index #####
+
+#### Assigns each collision its nearest intersection (IntID & DISTANCE) and nearest centerline segment
+#### (SegID & SEG_DISTANCE), the fields the warrant & road diet queries filter on, without ArcGIS.
+####
+#### The index is built once from the cleaned BOE intersection points and the centerline segments:
+#### a KD-tree over the intersections, and one over the midpoints of the segments' line pieces, with
+#### pieces longer than MaxPieceLength split up. A point's nearest piece is always among the pieces
+#### whose midpoint is within (distance to the nearest piece + half the longest piece), so the distance
+#### to each segment is exact. Collisions are snapped in batches, all points of a batch at once:
+####
+####     python SnapIndex.py --workspace /data/boe.gpkg --intersections StreetIntersections_clean --int-xy-fields X,Y
+####         --segments Centerline --collisions geom_lapd_collisions_xl --id-field dr_no --xy-fields coord_x,coord_y
+####         --output lapd_collisions_snapped
+####
+#### Distances are in the units of the coordinates (feet for NAD83 California V), so the collisions,
+#### intersections and segments must use the same projection. DISTANCE & SEG_DISTANCE are rounded to
+#### whole units, like the SWITRS DISTANCE field. Collisions without a location (NULL, or (0, 0) as
+#### the LAPD import stores them) get NULLs.
+
+import argparse
+import struct
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import DataAccess as da
+import Instrument
+from Instrument import Stage, Count
+
+# Line pieces longer than this are split before indexing; shorter pieces mean fewer candidates per point
+MaxPieceLength = 200.0
+
+# Nearest piece midpoints checked per point before falling back to a radius search
+Candidates = 8
+
+OutputFields = ["IntID", "DISTANCE", "SegID", "SEG_DISTANCE"]
+
+log = Instrument.Logger("SnapIndex")
+
+
+class SnapIndex(object):
+
+	def __init__(self, int_ids, int_xy, seg_ids, seg_lines, max_piece_length=MaxPieceLength):
+
+		# int_xy: (n, 2) intersection locations; seg_lines: a list of (m, 2) vertex arrays per
+		# segment (a multi-part segment can be given more than once with the same ID)
+		self.int_ids = np.asarray(int_ids)
+		self.int_tree = cKDTree(np.asarray(int_xy, dtype=np.float64).reshape(-1, 2))
+		self.seg_ids = np.asarray(seg_ids)
+		self.a, self.b, self.piece_seg = _Pieces(seg_lines, max_piece_length)
+		self.half_length = np.sqrt(((self.b - self.a) ** 2).sum(axis=1)).max() / 2.0 if len(self.a) else 0.0
+		self.piece_tree = cKDTree((self.a + self.b) / 2.0)
+
+	@classmethod
+	def Load(cls, intersections, segments, int_id_field="ASSETID", seg_id_field="ASSETID", int_xy_fields=None, seg_wkb_field=None):
+
+		# Intersections are read from their point geometry (or int_xy_fields), segments from their
+		# line geometry as WKB (SHAPE@WKB, or a WKB field such as the geometry column of GeoParquet)
+		int_ids, int_xy = [], []
+		for row in da.SearchCursor(intersections, [int_id_field] + (list(int_xy_fields) if int_xy_fields else ["SHAPE@XY"])):
+			xy = row[1:] if int_xy_fields else row[1]
+			if xy is not None and None not in xy:
+				int_ids.append(row[0])
+				int_xy.append(xy)
+
+		seg_ids, seg_lines = [], []
+		for seg_id, wkb in da.SearchCursor(segments, [seg_id_field, seg_wkb_field or "SHAPE@WKB"]):
+			for line in WkbLines(wkb):
+				if len(line) >= 2:
+					seg_ids.append(seg_id)
+					seg_lines.append(line)
+		log.info("Read %d intersections and %d segment parts", len(int_ids), len(seg_ids))
+		return cls(int_ids, int_xy, seg_ids, seg_lines)
+
+	def Summary(self):
+		return "%d intersections, %d segment parts in %d pieces" % (len(self.int_ids), len(self.seg_ids), len(self.a))
+
+	##### Snap #####
+	def NearestIntersections(self, xy):
+
+		# Positions into int_ids & distances, for an (n, 2) array of points
+		distances, positions = self.int_tree.query(xy)
+		return positions, distances
+
+	def NearestSegments(self, xy):
+
+		# Positions into seg_ids & exact distances, for an (n, 2) array of points
+		k = min(Candidates, len(self.a))
+		mid_distances, pieces = self.piece_tree.query(xy, k=k)
+		mid_distances, pieces = mid_distances.reshape(len(xy), k), pieces.reshape(len(xy), k)
+		distances = _PieceDistances(xy[:, None, :], self.a[pieces], self.b[pieces])
+		best = distances.argmin(axis=1)
+		rows = np.arange(len(xy))
+		nearest, nearest_distances = pieces[rows, best], distances[rows, best]
+
+		# Points where a piece outside the k candidates could still be nearer
+		unsure = np.flatnonzero(mid_distances[:, -1] - self.half_length < nearest_distances) if k < len(self.a) else []
+		for i in unsure:
+			candidates = np.asarray(self.piece_tree.query_ball_point(xy[i], nearest_distances[i] + self.half_length), dtype=np.int64)
+			candidate_distances = _PieceDistances(xy[i], self.a[candidates], self.b[candidates])
+			j = candidate_distances.argmin()
+			nearest[i], nearest_distances[i] = candidates[j], candidate_distances[j]
+		Count("snap_radius_searches", len(unsure))
+		return self.piece_seg[nearest], nearest_distances
+
+	def Snap(self, x, y, max_distance=None):
+
+		# Rows of (IntID, DISTANCE, SegID, SEG_DISTANCE) for arrays of x & y; None where the point has
+		# no location or the nearest feature is farther than max_distance
+		x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+		located = np.isfinite(x) & np.isfinite(y) & ~((x == 0) & (y == 0))
+		xy = np.column_stack([x[located], y[located]])
+		columns = [[None] * len(x) for field in OutputFields]
+		if not len(xy):
+			return list(zip(*columns))
+
+		located = np.flatnonzero(located).tolist()
+		results = []
+		if len(self.int_ids):
+			results.append((0, self.int_ids) + self.NearestIntersections(xy))
+		if len(self.a):
+			results.append((2, self.seg_ids) + self.NearestSegments(xy))
+		for column, ids, positions, distances in results:
+			kept = distances <= max_distance if max_distance is not None else np.ones(len(distances), dtype=bool)
+			id_values, distance_values = ids[positions].tolist(), np.rint(distances).astype(np.int64).tolist()
+			for i, keep, id_value, distance in zip(located, kept.tolist(), id_values, distance_values):
+				if keep:
+					columns[column][i], columns[column + 1][i] = id_value, distance
+		return list(zip(*columns))
+
+
+##### Geometry #####
+def _Pieces(seg_lines, max_piece_length):
+
+	# Start & end of every line piece and the segment it belongs to; long pieces are split evenly
+	if not seg_lines:
+		return np.zeros((0, 2)), np.zeros((0, 2)), np.zeros(0, dtype=np.int64)
+	vertices = np.concatenate([np.asarray(line, dtype=np.float64)[:, :2] for line in seg_lines])
+	owners = np.repeat(np.arange(len(seg_lines)), [len(line) for line in seg_lines])
+	within = owners[:-1] == owners[1:]
+	a, b, owners = vertices[:-1][within], vertices[1:][within], owners[:-1][within]
+
+	splits = np.maximum(np.ceil(np.sqrt(((b - a) ** 2).sum(axis=1)) / max_piece_length), 1).astype(np.int64)
+	first = np.repeat(np.cumsum(splits) - splits, splits)
+	steps = (np.arange(splits.sum()) - first) / np.repeat(splits, splits).astype(np.float64)
+	step = 1.0 / np.repeat(splits, splits)
+	a, b = np.repeat(a, splits, axis=0), np.repeat(b, splits, axis=0)
+	return a + (b - a) * steps[:, None], a + (b - a) * (steps + step)[:, None], np.repeat(owners, splits)
+
+
+def _PieceDistances(p, a, b):
+
+	# Distance from points p to the pieces a-b (broadcast over the leading dimensions)
+	ab = b - a
+	length_sq = (ab ** 2).sum(axis=-1)
+	t = np.where(length_sq > 0, ((p - a) * ab).sum(axis=-1) / np.where(length_sq > 0, length_sq, 1), 0)
+	closest = a + ab * np.clip(t, 0, 1)[..., None]
+	return np.sqrt(((p - closest) ** 2).sum(axis=-1))
+
+
+def WkbLines(wkb):
+
+	# The lines of a (Multi)LineString WKB geometry as (m, 2) arrays; ISO and EWKB Z/M variants are read,
+	# other geometry types give no lines
+	if wkb is None:
+		return []
+	lines = []
+	_ReadWkb(bytes(wkb), 0, lines)
+	return lines
+
+
+def _ReadWkb(wkb, offset, lines):
+
+	# Returns the offset after the geometry
+	byte_order = "<" if bytearray(wkb[offset:offset + 1])[0] == 1 else ">"
+	geom_type = struct.unpack(byte_order + "I", wkb[offset + 1:offset + 5])[0]
+	offset += 5
+	dims = 2 + (1 if geom_type & 0x80000000 else 0) + (1 if geom_type & 0x40000000 else 0)
+	if geom_type & 0x20000000:
+		offset += 4  # EWKB SRID
+	geom_type &= 0x0FFFFFFF
+	dims += {0: 0, 1: 1, 2: 1, 3: 2}[geom_type // 1000]
+	geom_type %= 1000
+
+	if geom_type == 2:
+		n = struct.unpack(byte_order + "I", wkb[offset:offset + 4])[0]
+		coords = np.frombuffer(wkb, dtype=np.dtype(np.float64).newbyteorder(byte_order), count=n * dims, offset=offset + 4)
+		lines.append(coords.reshape(n, dims)[:, :2].astype(np.float64))
+		return offset + 4 + 8 * n * dims
+	if geom_type in (5, 7):
+		n = struct.unpack(byte_order + "I", wkb[offset:offset + 4])[0]
+		offset += 4
+		for i in range(n):
+			offset = _ReadWkb(wkb, offset, lines)
+		return offset
+	raise da.DataAccessError("Cannot read lines from WKB geometry type %d" % geom_type)
+
+
+##### Snap a Collision Table #####
+def SnapCollisions(index, collision_table, out_table, id_field="CASE_ID", xy_fields=("POINT_X", "POINT_Y"), max_distance=None, batch_rows=100000):
+
+	# Writes id_field plus the snapped fields for every collision; returns the number of collisions
+	count = 0
+	with da.InsertCursor(out_table, [id_field] + OutputFields, {"IntID": _IdType(index.int_ids), "DISTANCE": "Integer",
+			"SegID": _IdType(index.seg_ids), "SEG_DISTANCE": "Integer"}) as cursor:
+		batch = []
+		for row in _Chain(da.SearchCursor(collision_table, [id_field] + list(xy_fields)), [None]):
+			if row is not None:
+				batch.append(row)
+			if batch and (row is None or len(batch) >= batch_rows):
+				with Stage("snap"):
+					x = [_Coordinate(r[1]) for r in batch]
+					y = [_Coordinate(r[2]) for r in batch]
+					snapped = index.Snap(x, y, max_distance)
+				with Stage("write"):
+					for r, values in zip(batch, snapped):
+						cursor.insertRow((r[0],) + tuple(values))
+				count += len(batch)
+				Count("collisions_snapped", len(batch))
+				log.info("Snapped %d collisions", count)
+				batch = []
+	return count
+
+
+def _IdType(ids):
+	return "Integer" if ids.dtype.kind in "iu" else "Real" if ids.dtype.kind == "f" else "String"
+
+
+def _Coordinate(value):
+	return np.nan if value is None else value
+
+
+def _Chain(first, rest):
+	for row in first:
+		yield row
+	for row in rest:
+		yield row
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Snap collisions to their nearest intersection and centerline segment.")
+	parser.add_argument("--workspace", required=True, help="geodatabase, GeoPackage, SQLite file or folder holding the tables")
+	parser.add_argument("--intersections", default="StreetIntersections_clean", help="intersection points (e.g. from IntersectionDedup.py)")
+	parser.add_argument("--int-id-field", default="ASSETID")
+	parser.add_argument("--int-xy-fields", default=None, help="X,Y fields of the intersections, if they are not read from the geometry")
+	parser.add_argument("--segments", default="Centerline", help="centerline segments (line geometry)")
+	parser.add_argument("--seg-id-field", default="ASSETID")
+	parser.add_argument("--seg-wkb-field", default=None, help="WKB field of the segments, if they are not read from the geometry")
+	parser.add_argument("--collisions", default="SWITRS2009_to_2013")
+	parser.add_argument("--id-field", default="CASE_ID", help="collision ID copied to the output")
+	parser.add_argument("--xy-fields", default="POINT_X,POINT_Y", help="X,Y fields of the collisions")
+	parser.add_argument("--max-distance", type=float, default=None, help="leave the IntID/SegID NULL beyond this distance")
+	parser.add_argument("--output", default="CollisionSnap", help="output table (written to the workspace)")
+	Instrument.AddArguments(parser)
+	args = parser.parse_args()
+	Instrument.Configure(args)
+
+	da.env.workspace = args.workspace
+	with Stage("build"):
+		index = SnapIndex.Load(args.intersections, args.segments, args.int_id_field, args.seg_id_field,
+			args.int_xy_fields.split(",") if args.int_xy_fields else None, args.seg_wkb_field)
+	log.info("Index: %s", index.Summary())
+	n = SnapCollisions(index, args.collisions, args.output, args.id_field, args.xy_fields.split(","), args.max_distance)
+	log.info("Wrote %d collisions to %s", n, args.output)
+	Instrument.Finish(args, "SnapIndex")
@@ -0,0 +1,240 @@
+#### Synthetic SWITRS Data #####
+
+#### Generates random tables shaped like the SWITRS extracts and network tables the warrant and road
+#### diet scripts read, so they can be run and timed without the city's geodatabase:
+####   SWITRS2009_to_2013                collisions, with the nearest IntID / SegID and DISTANCE
+####   Collisions2009to2013PartiesJoin   parties of each collision
+####   UnSigInt_Outside3miBuffer         unsignalized intersections (signal warrant)
+####   SigIntwithin3miBuffer             signalized intersections with the LTurn_ count fields
+####   Parties2013DriversUorLTurn        2013 drivers making a left or U-turn, joined to the IntID
+####   segment_table.csv, int_table.csv  road diet corridors (next to the workspace)
+####
+#### Scale 1 is roughly the City of Los Angeles for 2009-2013; the code distributions are rough
+#### shares from the SWITRS tables, not exact. The same seed and scale always give the same tables:
+#### rows are drawn in blocks, each from its own seeded generator, so the collisions and their parties
+#### can be streamed into separate tables without holding either in memory.
+####
+####     python SyntheticSWITRS.py --workspace /tmp/synthetic.sqlite --scale 0.1
+
+import argparse
+import csv
+import datetime
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+import DataAccess as da
+
+# Size of the city at scale 1
+CityScale = {
+	"collisions": 125000,          # 2009-2013 injury collisions
+	"signalized": 4500,
+	"unsignalized": 30000,
+	"segments": 60000,
+	"corridors": 200,
+}
+Years = (2009, 2013)
+BlockRows = 10000
+
+# (code, share) for the coded fields
+DirOfTravel = [("N", 0.23), ("S", 0.23), ("E", 0.23), ("W", 0.23), ("-", 0.08)]
+MovePreAcc = [("B", 0.44), ("A", 0.12), ("E", 0.10), ("D", 0.05), ("H", 0.04), ("O", 0.04), ("J", 0.03), ("L", 0.03),
+	("R", 0.03), ("G", 0.02), ("C", 0.02), ("F", 0.01), ("K", 0.01), ("M", 0.01), ("N", 0.01), ("P", 0.01), ("Q", 0.01)]
+PartyType = [(1, 0.85), (2, 0.07), (4, 0.05), (3, 0.02), (5, 0.01)]
+PcfViolCategory = [("03", 0.25), ("09", 0.15), ("08", 0.12), ("12", 0.08), ("10", 0.06), ("01", 0.05), ("11", 0.04),
+	("05", 0.03), ("06", 0.02), ("07", 0.01), ("18", 0.05), ("00", 0.14)]
+CollisionSeverity = [(1, 0.005), (2, 0.03), (3, 0.20), (4, 0.765)]
+TypeOfCollision = [("A", 0.03), ("B", 0.12), ("C", 0.30), ("D", 0.30), ("E", 0.05), ("F", 0.01), ("G", 0.12), ("H", 0.07)]
+OafViolSection = [(None, 0.90), ("22350", 0.05), ("21453", 0.02), ("21801", 0.02), ("22107", 0.01)]
+PartiesPerCollision = [(1, 0.25), (2, 0.60), (3, 0.12), (4, 0.03)]
+AlcoholShare = 0.07
+AtIntersectionShare = 0.55     # DISTANCE = 0
+SignalizedWeight = 5           # signalized intersections see more collisions
+
+CollisionFields = ["CASE_ID","COLLISION_DATE","PARTY_COUNT","DISTANCE","ALCOHOL_INVOLVED","IntID","PEDESTRIAN_ACCIDENT",
+	"BICYCLE_ACCIDENT","COLLISION_SEVERITY","SegID","PCF_VIOL_CATEGORY","TYPE_OF_COLLISION"]
+CollisionTypes = {"CASE_ID": "Integer", "COLLISION_DATE": "DateTime", "PARTY_COUNT": "Integer", "DISTANCE": "Real",
+	"ALCOHOL_INVOLVED": "String", "IntID": "Integer", "PEDESTRIAN_ACCIDENT": "String", "BICYCLE_ACCIDENT": "String",
+	"COLLISION_SEVERITY": "Integer", "SegID": "Integer", "PCF_VIOL_CATEGORY": "String", "TYPE_OF_COLLISION": "String"}
+PartyFields = ["Parties_CASE_ID","Parties_DIR_OF_TRAVEL","Parties_PARTY_TYPE","Parties_MOVE_PRE_ACC","Parties_OAF_VIOL_SECTION"]
+PartyTypes = {"Parties_CASE_ID": "Integer", "Parties_DIR_OF_TRAVEL": "String", "Parties_PARTY_TYPE": "Integer",
+	"Parties_MOVE_PRE_ACC": "String", "Parties_OAF_VIOL_SECTION": "String"}
+LTurnFields = ["Parties_CASE_ID","Parties_DIR_OF_TRAVEL","SWITRS2009_to_2013_IntID"]
+LTurnTypes = {"Parties_CASE_ID": "Integer", "Parties_DIR_OF_TRAVEL": "String", "SWITRS2009_to_2013_IntID": "Integer"}
+CountFields = ["LTurn_N","LTurn_S","LTurn_E","LTurn_W","LTurn_None"]
+
+FirstCaseId = 4000000
+FirstIntId = 100000
+FirstSegId = 1
+
+
+class SyntheticSWITRS(object):
+
+	def __init__(self, scale=1.0, seed=2016):
+		self.scale = scale
+		self.seed = seed
+		self.sizes = dict((name, max(1, int(round(n * scale)))) for name, n in CityScale.items())
+
+		# Intersections: the signalized ones first, then the unsignalized ones
+		self.signalized = np.arange(FirstIntId, FirstIntId + self.sizes["signalized"], dtype=np.int64)
+		self.unsignalized = np.arange(self.signalized[-1] + 1, self.signalized[-1] + 1 + self.sizes["unsignalized"], dtype=np.int64)
+		self.int_ids = np.concatenate([self.signalized, self.unsignalized])
+		weights = np.concatenate([np.full(len(self.signalized), SignalizedWeight, dtype=float), np.ones(len(self.unsignalized))])
+
+		# A few intersections see many more collisions than the rest
+		rand = np.random.RandomState([seed, 0])
+		weights *= rand.pareto(2.0, len(weights)) + 0.2
+		self.int_weights = weights / weights.sum()
+
+	def _Random(self, block):
+		return np.random.RandomState([self.seed, block + 1])
+
+	##### Collisions & Parties #####
+	def Blocks(self):
+
+		# (collision columns, party columns) for each block of collisions, always the same for a seed
+		n = self.sizes["collisions"]
+		start = datetime.datetime(Years[0], 1, 1)
+		span_seconds = int((datetime.datetime(Years[1] + 1, 1, 1) - start).total_seconds())
+		for block, first in enumerate(range(0, n, BlockRows)):
+			rand = self._Random(block)
+			size = min(BlockRows, n - first)
+
+			case_ids = np.arange(FirstCaseId + first, FirstCaseId + first + size, dtype=np.int64)
+			n_parties = _Draw(rand, PartiesPerCollision, size)
+			dates = [start + datetime.timedelta(seconds=int(s)) for s in rand.randint(0, span_seconds, size)]
+			int_ids = rand.choice(self.int_ids, size, p=self.int_weights)
+			seg_ids = rand.randint(FirstSegId, FirstSegId + self.sizes["segments"], size)
+			distance = np.where(rand.random_sample(size) < AtIntersectionShare, 0.0, np.round(rand.exponential(120.0, size), 1))
+			alcohol = np.where(rand.random_sample(size) < AlcoholShare, "Y", "")
+
+			# Parties, in collision order
+			party_case = np.repeat(case_ids, n_parties)
+			n_total = len(party_case)
+			party_type = _Draw(rand, PartyType, n_total)
+			party_dir = _Draw(rand, DirOfTravel, n_total)
+			party_move = _Draw(rand, MovePreAcc, n_total)
+			party_oaf = _Draw(rand, OafViolSection, n_total)
+
+			# Pedestrian / bicycle collisions are those with a pedestrian / bicyclist party
+			offsets = np.append(0, np.cumsum(n_parties))
+			has_ped = np.add.reduceat((party_type == 2).astype(np.int64), offsets[:-1]) > 0
+			has_bike = np.add.reduceat((party_type == 4).astype(np.int64), offsets[:-1]) > 0
+			collision_type = np.where(has_ped, "G", _Draw(rand, TypeOfCollision, size))
+
+			collisions = [case_ids.tolist(), dates, n_parties.tolist(), distance.tolist(), _Nullable(alcohol), int_ids.tolist(),
+				_Nullable(np.where(has_ped, "Y", "")), _Nullable(np.where(has_bike, "Y", "")),
+				_Draw(rand, CollisionSeverity, size).tolist(), seg_ids.tolist(), _Draw(rand, PcfViolCategory, size).tolist(),
+				collision_type.tolist()]
+			parties = [party_case.tolist(), party_dir.tolist(), party_type.tolist(), party_move.tolist(), list(party_oaf)]
+			yield collisions, parties
+
+	def Collisions(self):
+		for collisions, parties in self.Blocks():
+			for row in zip(*collisions):
+				yield row
+
+	def Parties(self):
+		for collisions, parties in self.Blocks():
+			for row in zip(*parties):
+				yield row
+
+	def LeftTurnParties(self):
+
+		# Drivers making a left (E) or U-turn (F) in 2013, with the IntID of their collision
+		for collisions, parties in self.Blocks():
+			int_of_case = dict(zip(collisions[0], collisions[5]))
+			year_of_case = dict(zip(collisions[0], [d.year for d in collisions[1]]))
+			for case_id, direction, party_type, movement, oaf in zip(*parties):
+				if party_type == 1 and movement in ("E", "F") and year_of_case[case_id] == Years[1]:
+					yield case_id, direction, int_of_case[case_id]
+
+	##### Corridors #####
+	def Corridors(self):
+
+		# (segment rows, intersection rows): each corridor is a run of consecutive segments with one
+		# direction pair, and the intersections along it
+		rand = np.random.RandomState([self.seed, 999999])
+		segment_rows, int_rows = [], []
+		for corridor_id in range(1, self.sizes["corridors"] + 1):
+			length = int(rand.randint(10, 41))
+			first = int(rand.randint(FirstSegId, max(FirstSegId + 1, FirstSegId + self.sizes["segments"] - length)))
+			direction = "E,W" if rand.random_sample() < 0.5 else "N,S"
+			for seg_id in range(first, first + length):
+				segment_rows.append((corridor_id, seg_id, direction))
+			for int_id in rand.choice(self.int_ids, length + 1, replace=False):
+				int_rows.append((corridor_id, int(int_id)))
+		return segment_rows, int_rows
+
+	##### Write #####
+	def Write(self, workspace, table_format="sqlite"):
+
+		# Writes every table to the workspace (a .sqlite file, or a folder of csv / parquet tables),
+		# and the two corridor CSVs next to it. Returns the paths of the corridor CSVs.
+		if table_format == "sqlite":
+			if os.path.exists(workspace):
+				os.remove(workspace)
+			if not os.path.isdir(os.path.dirname(os.path.abspath(workspace))):
+				os.makedirs(os.path.dirname(os.path.abspath(workspace)))
+			sqlite3.connect(workspace).close()
+		else:
+			if not os.path.isdir(workspace):
+				os.makedirs(workspace)
+		da.ResetWorkspaces()
+		da.env.workspace = workspace
+
+		# Parquet tables are named by their full path, as a bare name in a folder workspace is written as CSV
+		def Table(name):
+			return os.path.join(workspace, name + ".parquet") if table_format == "parquet" else name
+
+		da.WriteTable(Table("SWITRS2009_to_2013"), CollisionFields, self.Collisions(), CollisionTypes, index_fields=["IntID", "SegID"])
+		da.WriteTable(Table("Collisions2009to2013PartiesJoin"), PartyFields, self.Parties(), PartyTypes, index_fields=["Parties_CASE_ID"])
+		da.WriteTable(Table("UnSigInt_Outside3miBuffer"), ["ASSETID"], ((int(i),) for i in self.unsignalized), {"ASSETID": "Integer"})
+		da.WriteTable(Table("SigIntwithin3miBuffer"), ["ASSETID"] + CountFields, ((int(i), 0, 0, 0, 0, 0) for i in self.signalized),
+			dict((field, "Integer") for field in ["ASSETID"] + CountFields), index_fields=["ASSETID"])
+		da.WriteTable(Table("Parties2013DriversUorLTurn"), LTurnFields, self.LeftTurnParties(), LTurnTypes)
+
+		segment_rows, int_rows = self.Corridors()
+		folder = workspace if os.path.isdir(workspace) else os.path.dirname(os.path.abspath(workspace))
+		segment_csv = os.path.join(folder, "segment_table.csv")
+		int_csv = os.path.join(folder, "int_table.csv")
+		for path, rows in ((segment_csv, segment_rows), (int_csv, int_rows)):
+			with da.OpenCsv(path, "w") as fout:
+				csv.writer(fout, lineterminator="\n").writerows(rows)
+		return segment_csv, int_csv
+
+
+##### Helpers #####
+def _Draw(rand, distribution, size):
+
+	# Codes drawn with the given shares (which are normalized, so they need not add up to 1)
+	codes = [code for code, share in distribution]
+	shares = np.asarray([share for code, share in distribution], dtype=float)
+	picks = rand.choice(len(codes), size, p=shares / shares.sum())
+	if all(isinstance(code, int) for code in codes):
+		return np.asarray(codes, dtype=np.int64)[picks]
+	return [codes[i] for i in picks] if None in codes else np.asarray(codes)[picks]
+
+
+def _Nullable(values):
+	return [value if value else None for value in values.tolist()]
+
+
+##### Run the Generator #####
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Write synthetic SWITRS-shaped collision, party, intersection and corridor tables.")
+	parser.add_argument("--workspace", required=True, help="a .sqlite file, or a folder for csv / parquet tables")
+	parser.add_argument("--format", default=None, choices=["sqlite", "csv", "parquet"], help="default: sqlite for a .sqlite path, else csv")
+	parser.add_argument("--scale", type=float, default=1.0, help="1 is about the City of Los Angeles for 2009-2013")
+	parser.add_argument("--seed", type=int, default=2016)
+	args = parser.parse_args()
+
+	table_format = args.format or ("sqlite" if os.path.splitext(args.workspace)[1].lower() in (".sqlite", ".sqlite3", ".db") else "csv")
+	t0 = time.time()
+	generator = SyntheticSWITRS(args.scale, args.seed)
+	generator.Write(args.workspace, table_format)
+	print("Wrote %s in %.1f s: %s" % (args.workspace, time.time() - t0,
+		", ".join("%d %s" % (n, name) for name, n in sorted(generator.sizes.items()))))
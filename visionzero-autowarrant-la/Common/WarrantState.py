@@ -0,0 +1,174 @@
+#### Warrant State #####
+
+#### Keeps the results of the last warrant run in a SQLite file, so the next run only recomputes the
+#### intersections and corridors touched by collisions that were added, removed or changed since then
+#### (e.g. after the nightly LAPD import reloads the collision table).
+####
+#### Every collision is stored with a fingerprint of its fields (and its parties) under a scope, one
+#### per script. Diffing a new load against the stored snapshot by CASE_ID (or dr_no) gives the delta;
+#### each collision also carries a small payload (its intersection/segment IDs) so the caller can tell
+#### which locations the old and the new version of a changed collision belong to.
+
+import datetime
+import hashlib
+import json
+import sqlite3
+from collections import namedtuple, OrderedDict
+
+from IntersectionCollisions import Builder
+from WhereClause import ParseDate
+
+Delta = namedtuple("Delta", [
+	"added",         # {case_id: new payload}
+	"removed",       # {case_id: old payload}
+	"changed_old",   # {case_id: old payload}
+	"changed_new",   # {case_id: new payload}
+])
+
+# The intersection & corridor IDs have no type, so they are kept as given (an ASSETID can be text), and
+# are not the INTEGER rowid alias
+Schema = """
+CREATE TABLE IF NOT EXISTS snapshot (scope TEXT, case_id INTEGER, fingerprint TEXT, payload TEXT, PRIMARY KEY (scope, case_id));
+CREATE TABLE IF NOT EXISTS signal_collisions (int_id, case_id INTEGER, col_date TEXT);
+CREATE INDEX IF NOT EXISTS signal_collisions_int ON signal_collisions (int_id);
+CREATE TABLE IF NOT EXISTS signal_ksi (int_id PRIMARY KEY, ksi INTEGER);
+CREATE TABLE IF NOT EXISTS lturn_counts (int_id PRIMARY KEY, n INTEGER, s INTEGER, e INTEGER, w INTEGER, none INTEGER);
+CREATE TABLE IF NOT EXISTS corridor_stats (corridor_id PRIMARY KEY, stats TEXT);
+"""
+
+
+def Fingerprint(values):
+
+	# Short hash of the values' repr; any change to a tracked field or party changes it
+	return hashlib.sha1(repr(tuple(values)).encode("utf-8")).hexdigest()[:20]
+
+
+def DeltaSize(delta):
+	return len(delta.added) + len(delta.removed) + len(delta.changed_new)
+
+
+def Payloads(delta):
+
+	# Every old and new payload of the delta, to find the locations it touches
+	return list(delta.added.values()) + list(delta.removed.values()) + list(delta.changed_old.values()) + list(delta.changed_new.values())
+
+
+class WarrantState(object):
+
+	def __init__(self, path):
+		self.path = path
+		self.conn = sqlite3.connect(path)
+		self.conn.executescript(Schema)
+
+	def Commit(self):
+		self.conn.commit()
+
+	def Close(self):
+		self.conn.close()
+
+	##### Snapshot & Diff #####
+	def HasSnapshot(self, scope):
+		return self.conn.execute("SELECT 1 FROM snapshot WHERE scope = ? LIMIT 1", (scope,)).fetchone() is not None
+
+	def ClearSnapshot(self, scope):
+		self.conn.execute("DELETE FROM snapshot WHERE scope = ?", (scope,))
+
+	def Diff(self, scope, collisions):
+
+		# collisions: {case_id: (fingerprint, payload)} for the new load
+		added, removed, changed_old, changed_new = {}, {}, {}, {}
+		seen = set()
+		for case_id, fingerprint, payload in self.conn.execute("SELECT case_id, fingerprint, payload FROM snapshot WHERE scope = ?", (scope,)):
+			seen.add(case_id)
+			if case_id not in collisions:
+				removed[case_id] = json.loads(payload)
+			elif collisions[case_id][0] != fingerprint:
+				changed_old[case_id] = json.loads(payload)
+				changed_new[case_id] = collisions[case_id][1]
+		for case_id, (fingerprint, payload) in collisions.items():
+			if case_id not in seen:
+				added[case_id] = payload
+		return Delta(added, removed, changed_old, changed_new)
+
+	def ApplyDelta(self, scope, collisions, delta):
+
+		# Only the rows in the delta are written, so saving the snapshot is proportional to the change
+		gone = list(delta.removed) + list(delta.changed_new)
+		self.conn.executemany("DELETE FROM snapshot WHERE scope = ? AND case_id = ?", [(scope, case_id) for case_id in gone])
+		new = list(delta.added) + list(delta.changed_new)
+		self.conn.executemany("INSERT INTO snapshot VALUES (?, ?, ?, ?)",
+			[(scope, case_id, collisions[case_id][0], json.dumps(collisions[case_id][1])) for case_id in new])
+
+	##### Signal Warrant #####
+	def SignalIntersections(self):
+		return set(row[0] for row in self.conn.execute("SELECT int_id FROM signal_ksi"))
+
+	def ReplaceSignal(self, collisions, keep_int_ids=None):
+
+		# Replace the qualifying collisions & bike/ped KSI count of the recomputed intersections (an
+		# IntersectionCollisions); intersections no longer in keep_int_ids are dropped
+		int_ids = collisions.int_ids
+		self.conn.executemany("DELETE FROM signal_collisions WHERE int_id = ?", [(i,) for i in int_ids])
+		self.conn.executemany("INSERT OR REPLACE INTO signal_ksi VALUES (?, ?)", [(i, int(ksi)) for i, ksi in zip(int_ids, collisions.ksi.tolist())])
+		self.conn.executemany("INSERT INTO signal_collisions VALUES (?, ?, ?)",
+			[(i, col_id, _DateText(col_date)) for n, i in enumerate(int_ids) for col_id, col_date in collisions.Collisions(n)])
+		if keep_int_ids is not None:
+			dropped = [(i,) for i in self.SignalIntersections() - set(keep_int_ids)]
+			self.conn.executemany("DELETE FROM signal_collisions WHERE int_id = ?", dropped)
+			self.conn.executemany("DELETE FROM signal_ksi WHERE int_id = ?", dropped)
+
+	def LoadSignal(self, int_ids):
+
+		# Rebuilds the IntersectionCollisions of SigWarrantSearch, in the order of int_ids
+		collisions = {}
+		for int_id, col_id, col_date in self.conn.execute("SELECT int_id, case_id, col_date FROM signal_collisions ORDER BY rowid"):
+			collisions.setdefault(int_id, OrderedDict())[col_id] = _ParseDateText(col_date)
+		ksi = dict(self.conn.execute("SELECT int_id, ksi FROM signal_ksi"))
+		builder = Builder()
+		for int_id in int_ids:
+			int_collisions = collisions.pop(int_id, {})
+			builder.Add(int_id, list(int_collisions), list(int_collisions.values()), ksi.get(int_id, 0))
+		return builder.Build()
+
+	##### Left-Turn Counts #####
+	def LTurnCounts(self):
+		return dict((row[0], list(row[1:])) for row in self.conn.execute("SELECT int_id, n, s, e, w, none FROM lturn_counts"))
+
+	def ReplaceLTurnCounts(self, counts, replace_all=False):
+
+		# counts: {int_id: [n, s, e, w, none]}
+		if replace_all:
+			self.conn.execute("DELETE FROM lturn_counts")
+		self.conn.executemany("INSERT OR REPLACE INTO lturn_counts VALUES (?, ?, ?, ?, ?, ?)",
+			[[int_id] + list(values) for int_id, values in counts.items()])
+
+	##### Road Diet Corridors #####
+	def ReplaceCorridorStats(self, corridor_stats, keep_corridor_ids=None):
+
+		# corridor_stats: {corridor_id: counts}; corridors no longer in keep_corridor_ids are dropped
+		self.conn.executemany("INSERT OR REPLACE INTO corridor_stats VALUES (?, ?)",
+			[(corridor_id, json.dumps(list(stats))) for corridor_id, stats in corridor_stats.items()])
+		if keep_corridor_ids is not None:
+			keep = set(keep_corridor_ids)
+			self.conn.executemany("DELETE FROM corridor_stats WHERE corridor_id = ?",
+				[row for row in self.conn.execute("SELECT corridor_id FROM corridor_stats").fetchall() if row[0] not in keep])
+
+	def LoadCorridorStats(self, corridor_ids):
+
+		# {corridor_id: counts}, in the order of corridor_ids
+		stats = dict((row[0], json.loads(row[1])) for row in self.conn.execute("SELECT corridor_id, stats FROM corridor_stats"))
+		return OrderedDict((corridor_id, stats[corridor_id]) for corridor_id in corridor_ids if corridor_id in stats)
+
+
+def _DateText(value):
+	if isinstance(value, datetime.datetime):
+		return value.isoformat(" ")
+	if isinstance(value, datetime.date):
+		return value.isoformat()
+	return value
+
+
+def _ParseDateText(value):
+	if value and hasattr(value, "strip"):
+		return ParseDate(value)
+	return value
@@ -0,0 +1,416 @@
+#### Where Clause Parser #####
+
+#### Parses the small SQL dialect used in the arcpy where clauses of these scripts, e.g.
+####     IntID = 123 AND DISTANCE <= 100 AND ALCOHOL_INVOLVED IS NULL
+####     SegID IN (1, 2, 3) OR (IntID IN (4, 5) AND DISTANCE = 0)
+####     "TOOLTIP" LIKE '%FRWY%'
+#### into a tree of tuples, so each backend can push the predicate down in its own way:
+#### SQL for SQLite / GeoPackage, an Arrow expression for Parquet, or row-by-row for CSV.
+
+import datetime
+import re
+
+# Node types of the parsed tree
+#   ('and', left, right)      ('or', left, right)       ('not', node)
+#   ('cmp', op, field, value) ('null', field)           ('in', field, [values])
+#   ('like', field, pattern)  ('between', field, low, high)
+
+Keywords = set(["AND", "OR", "NOT", "IN", "IS", "NULL", "LIKE", "BETWEEN", "DATE", "TIMESTAMP"])
+Operators = ["<>", "!=", "<=", ">=", "=", "<", ">"]
+
+TokenPattern = re.compile(r"""
+	\s*(?:
+	(?P<number>-?\d+\.\d*|-?\.\d+|-?\d+)|
+	(?P<string>'(?:[^']|'')*')|
+	(?P<quoted>"[^"]+"|\[[^\]]+\])|
+	(?P<name>[A-Za-z_][A-Za-z0-9_.]*)|
+	(?P<op><>|!=|<=|>=|=|<|>)|
+	(?P<punct>[(),])
+	)""", re.VERBOSE)
+
+
+class WhereClauseError(ValueError):
+	pass
+
+
+##### Tokenize #####
+def Tokenize(where_clause):
+
+	tokens = []
+	pos = 0
+	text = where_clause.strip()
+	while pos < len(text):
+		match = TokenPattern.match(text, pos)
+		if match is None or match.end() == pos:
+			raise WhereClauseError("Cannot parse where clause at: %s" % text[pos:])
+		pos = match.end()
+		kind = match.lastgroup
+		value = match.group(kind)
+		if kind == "number":
+			value = float(value) if ("." in value) else int(value)
+		elif kind == "string":
+			value = value[1:-1].replace("''", "'")
+		elif kind == "quoted":
+			kind, value = "name", value[1:-1]
+		elif kind == "name" and value.upper() in Keywords:
+			kind, value = "keyword", value.upper()
+		tokens.append((kind, value))
+	return tokens
+
+
+##### Parse #####
+def Parse(where_clause):
+
+	# An empty where clause means every row
+	if where_clause is None or not where_clause.strip():
+		return None
+	parser = _Parser(Tokenize(where_clause))
+	tree = parser.Or()
+	if parser.pos != len(parser.tokens):
+		raise WhereClauseError("Unexpected %r in where clause" % (parser.tokens[parser.pos][1],))
+	return tree
+
+
+class _Parser(object):
+
+	def __init__(self, tokens):
+		self.tokens = tokens
+		self.pos = 0
+
+	def Peek(self):
+		if self.pos < len(self.tokens):
+			return self.tokens[self.pos]
+		return (None, None)
+
+	def Take(self, kind=None, value=None):
+		token = self.Peek()
+		if (kind is not None and token[0] != kind) or (value is not None and token[1] != value):
+			raise WhereClauseError("Expected %s but found %r" % (value or kind, token[1]))
+		self.pos += 1
+		return token[1]
+
+	def Accept(self, kind, value):
+		if self.Peek() == (kind, value):
+			self.pos += 1
+			return True
+		return False
+
+	def Or(self):
+		node = self.And()
+		while self.Accept("keyword", "OR"):
+			node = ("or", node, self.And())
+		return node
+
+	def And(self):
+		node = self.Not()
+		while self.Accept("keyword", "AND"):
+			node = ("and", node, self.Not())
+		return node
+
+	def Not(self):
+		if self.Accept("keyword", "NOT"):
+			return ("not", self.Not())
+		if self.Accept("punct", "("):
+			node = self.Or()
+			self.Take("punct", ")")
+			return node
+		return self.Predicate()
+
+	def Predicate(self):
+		field = self.Take("name")
+
+		if self.Accept("keyword", "IS"):
+			negate = self.Accept("keyword", "NOT")
+			self.Take("keyword", "NULL")
+			node = ("null", field)
+			return ("not", node) if negate else node
+
+		negate = self.Accept("keyword", "NOT")
+		if self.Accept("keyword", "IN"):
+			self.Take("punct", "(")
+			values = [self.Value()]
+			while self.Accept("punct", ","):
+				values.append(self.Value())
+			self.Take("punct", ")")
+			node = ("in", field, values)
+		elif self.Accept("keyword", "LIKE"):
+			node = ("like", field, self.Take("string"))
+		elif self.Accept("keyword", "BETWEEN"):
+			low = self.Value()
+			self.Take("keyword", "AND")
+			node = ("between", field, low, self.Value())
+		elif negate:
+			raise WhereClauseError("Expected IN, LIKE or BETWEEN after NOT")
+		else:
+			op = self.Take("op")
+			node = ("cmp", "<>" if op == "!=" else op, field, self.Value())
+		return ("not", node) if negate else node
+
+	def Value(self):
+		kind, value = self.Peek()
+		if kind == "keyword" and value in ("DATE", "TIMESTAMP"):
+			self.pos += 1
+			return ParseDate(self.Take("string"))
+		if kind in ("number", "string"):
+			self.pos += 1
+			return value
+		raise WhereClauseError("Expected a value but found %r" % (value,))
+
+
+##### Helpers #####
+DatePattern = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$")
+
+def ParseDate(text):
+
+	# Dates are written as 'YYYY-MM-DD' with an optional time
+	text = text.strip().replace("T", " ")
+	for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+		try:
+			return datetime.datetime.strptime(text, fmt)
+		except ValueError:
+			pass
+	raise WhereClauseError("Cannot parse date %r" % text)
+
+
+def Fields(tree):
+
+	# All the field names used by the where clause
+	if tree is None:
+		return []
+	if tree[0] in ("and", "or"):
+		fields = Fields(tree[1])
+		return fields + [f for f in Fields(tree[2]) if f not in fields]
+	if tree[0] == "not":
+		return Fields(tree[1])
+	if tree[0] == "cmp":
+		return [tree[2]]
+	return [tree[1]]
+
+
+##### Row-by-Row Evaluation #####
+def _Comparable(value, literal):
+
+	# CSV values are parsed on read, but keep '03' and 3 comparable with each other
+	if isinstance(literal, (int, float)) and not isinstance(value, (int, float)):
+		try:
+			return float(value), literal
+		except (TypeError, ValueError):
+			return value, str(literal)
+	if isinstance(value, (int, float)) and not isinstance(literal, (int, float)):
+		try:
+			return value, float(literal)
+		except (TypeError, ValueError):
+			return str(value), literal
+	if isinstance(value, datetime.datetime) and isinstance(literal, datetime.date) and not isinstance(literal, datetime.datetime):
+		literal = datetime.datetime(literal.year, literal.month, literal.day)
+	return value, literal
+
+
+def _LikePattern(pattern):
+
+	regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern)
+	return re.compile("^" + regex + "$", re.DOTALL)
+
+
+def Evaluate(tree, row):
+
+	# SQL three-valued logic: returns True, False or None (unknown) for a row dictionary
+	if tree is None:
+		return True
+	kind = tree[0]
+
+	if kind == "and":
+		left, right = Evaluate(tree[1], row), Evaluate(tree[2], row)
+		if left is False or right is False:
+			return False
+		return None if (left is None or right is None) else True
+	if kind == "or":
+		left, right = Evaluate(tree[1], row), Evaluate(tree[2], row)
+		if left is True or right is True:
+			return True
+		return None if (left is None or right is None) else False
+	if kind == "not":
+		result = Evaluate(tree[1], row)
+		return None if result is None else not result
+	if kind == "null":
+		return row[tree[1]] is None
+
+	value = row[tree[1] if kind != "cmp" else tree[2]]
+	if value is None:
+		return None
+
+	if kind == "cmp":
+		a, b = _Comparable(value, tree[3])
+		op = tree[1]
+		if op == "=":
+			return a == b
+		if op == "<>":
+			return a != b
+		if op == "<":
+			return a < b
+		if op == "<=":
+			return a <= b
+		if op == ">":
+			return a > b
+		return a >= b
+	if kind == "in":
+		return any(a == b for a, b in (_Comparable(value, literal) for literal in tree[2]))
+	if kind == "like":
+		return _LikePattern(tree[2]).match(str(value)) is not None
+	if kind == "between":
+		a, low = _Comparable(value, tree[2])
+		b, high = _Comparable(value, tree[3])
+		return low <= a and b <= high
+	raise WhereClauseError("Unknown node %r" % (kind,))
+
+
+##### SQL (SQLite / GeoPackage) #####
+def ToSql(tree):
+
+	# Returns (sql, params) with '?' placeholders, so values are never pasted into the SQL
+	if tree is None:
+		return "1", []
+	kind = tree[0]
+	if kind in ("and", "or"):
+		left, left_params = ToSql(tree[1])
+		right, right_params = ToSql(tree[2])
+		return "(%s %s %s)" % (left, kind.upper(), right), left_params + right_params
+	if kind == "not":
+		sql, params = ToSql(tree[1])
+		return "(NOT %s)" % sql, params
+	if kind == "null":
+		return "(%s IS NULL)" % QuoteName(tree[1]), []
+	if kind == "cmp":
+		return "(%s %s ?)" % (QuoteName(tree[2]), tree[1]), [_SqlValue(tree[3])]
+	if kind == "in":
+		return "(%s IN (%s))" % (QuoteName(tree[1]), ", ".join("?" * len(tree[2]))), [_SqlValue(v) for v in tree[2]]
+	if kind == "like":
+		return "(%s LIKE ?)" % QuoteName(tree[1]), [tree[2]]
+	if kind == "between":
+		return "(%s BETWEEN ? AND ?)" % QuoteName(tree[1]), [_SqlValue(tree[2]), _SqlValue(tree[3])]
+	raise WhereClauseError("Unknown node %r" % (kind,))
+
+
+def QuoteName(name):
+	return '"%s"' % name.replace('"', '""')
+
+
+def _SqlValue(value):
+
+	# SQLite stores dates as ISO text
+	if isinstance(value, datetime.datetime):
+		return value.strftime("%Y-%m-%d %H:%M:%S")
+	return value
+
+
+##### Arrow Expression (Parquet) #####
+
+# Text Evaluate would read as a number (after trimming spaces), like Python's float()
+NumberText = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+def ToArrowExpression(tree, schema=None):
+
+	# With the schema of the table, the literals are cast to the type of their field the way Evaluate
+	# compares them (e.g. CASE_ID = '1' on an integer field), as Arrow does not compare across types
+	if tree is None:
+		return None
+	import pyarrow as pa
+	import pyarrow.compute as pc
+
+	kind = tree[0]
+	if kind == "and":
+		return ToArrowExpression(tree[1], schema) & ToArrowExpression(tree[2], schema)
+	if kind == "or":
+		return ToArrowExpression(tree[1], schema) | ToArrowExpression(tree[2], schema)
+	if kind == "not":
+		return ~ToArrowExpression(tree[1], schema)
+	if kind == "null":
+		return pc.field(tree[1]).is_null()
+	if kind == "cmp":
+		op = tree[1]
+		if op == "=":
+			return _ArrowPredicate(tree[2], [tree[3]], schema, lambda field, values: field == values[0])
+		if op == "<>":
+			return _ArrowPredicate(tree[2], [tree[3]], schema, lambda field, values: field != values[0])
+		if op == "<":
+			return _ArrowPredicate(tree[2], [tree[3]], schema, lambda field, values: field < values[0])
+		if op == "<=":
+			return _ArrowPredicate(tree[2], [tree[3]], schema, lambda field, values: field <= values[0])
+		if op == ">":
+			return _ArrowPredicate(tree[2], [tree[3]], schema, lambda field, values: field > values[0])
+		return _ArrowPredicate(tree[2], [tree[3]], schema, lambda field, values: field >= values[0])
+	if kind == "in":
+		return _ArrowPredicate(tree[1], tree[2], schema, lambda field, values: field.isin(values))
+	if kind == "like":
+		field = pc.field(tree[1])
+		if _FieldType(schema, tree[1]) is not None and not _IsText(_FieldType(schema, tree[1])):
+			field = field.cast(pa.string())
+		return pc.match_like(field, tree[2])
+	if kind == "between":
+		return _ArrowPredicate(tree[1], [tree[2], tree[3]], schema, lambda field, values: (field >= values[0]) & (field <= values[1]))
+	raise WhereClauseError("Unknown node %r" % (kind,))
+
+
+def _ArrowPredicate(name, literals, schema, build):
+
+	# build(field, literals) with the literals in the type of the field, compared like Evaluate does:
+	#   number field   text written as a number is a number; if a literal is not, the field is read as text
+	#   text field     a number literal is compared with the text that is a number, and as text otherwise
+	#   date field     text literals are parsed as dates
+	import pyarrow as pa
+	import pyarrow.compute as pc
+	field = pc.field(name)
+	field_type = _FieldType(schema, name)
+	literals = list(literals)
+	if field_type is None:
+		return build(field, literals)
+	if pa.types.is_integer(field_type) or pa.types.is_floating(field_type):
+		numbers = [_Number(literal) for literal in literals]
+		if None in numbers:
+			return build(field.cast(pa.string()), [_Text(literal) for literal in literals])
+		return build(field, numbers)
+	if _IsText(field_type):
+		texts = [_Text(literal) for literal in literals]
+		if not all(isinstance(literal, (int, float)) for literal in literals):
+			return build(field, texts)
+		trimmed = pc.utf8_trim_whitespace(field)
+		numeric = pc.match_substring_regex(trimmed, NumberText)
+		number = pc.if_else(numeric, trimmed, pa.scalar(None, pa.string())).cast(pa.float64())
+		return pc.if_else(numeric, build(number, literals), build(field, texts))
+	if (pa.types.is_timestamp(field_type) or pa.types.is_date(field_type)) and not any(isinstance(literal, (int, float)) for literal in literals):
+		dates = [literal if isinstance(literal, datetime.date) else ParseDate(literal) for literal in literals]
+		dates = [datetime.datetime(d.year, d.month, d.day) if not isinstance(d, datetime.datetime) else d for d in dates]
+		if pa.types.is_date(field_type):
+			field = field.cast(pa.timestamp("us"))
+		return build(field, dates)
+	return build(field, literals)
+
+
+def _FieldType(schema, name):
+	if schema is None or schema.get_field_index(name) < 0:
+		return None
+	return schema.field(name).type
+
+
+def _IsText(field_type):
+	import pyarrow as pa
+	return pa.types.is_string(field_type) or pa.types.is_large_string(field_type)
+
+
+def _Number(literal):
+	if isinstance(literal, (int, float)):
+		return literal
+	for convert in (int, float):
+		try:
+			return convert(str(literal).strip())
+		except ValueError:
+			pass
+	return None
+
+
+def _Text(literal):
+	if isinstance(literal, datetime.datetime):
+		return _SqlValue(literal)
+	if isinstance(literal, (int, float)):
+		return str(literal)
+	return literal
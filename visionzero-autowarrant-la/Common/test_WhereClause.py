@@ -0,0 +1,146 @@
+#### Where Clause Tests #####
+
+#### The same where clauses, with literals of another type than their field, read from each backend:
+####     python -m pytest -q Common/test_WhereClause.py
+
+import datetime
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import DataAccess as da
+
+pytest.importorskip("pyarrow")
+
+Fields = ["CASE_ID", "IntID", "DISTANCE", "COLLISION_SEVERITY", "PCF_VIOL_CATEGORY", "COLLISION_DATE"]
+Types = dict(zip(Fields, ["Integer", "Integer", "Real", "Integer", "String", "DateTime"]))
+
+Rows = [(case_id, 100123 + case_id % 3, float(case_id * 40 % 250), case_id % 4 + 1, str(case_id % 12 + 1),
+	datetime.datetime(2012 + case_id % 3, case_id % 12 + 1, 1)) for case_id in range(1, 121)]
+
+MixedClauses = [
+	"CASE_ID = '1'",
+	"PCF_VIOL_CATEGORY = 3",
+	"COLLISION_SEVERITY = '1'",
+	"IntID = '100123' AND DISTANCE <= 100",
+	"IntID IN ('100124', '100125') AND COLLISION_SEVERITY = '2'",
+	"PCF_VIOL_CATEGORY IN (3, 10) OR CASE_ID BETWEEN '5' AND '9'",
+	"COLLISION_DATE >= '2013-06-01' AND DISTANCE > '50'",
+	"CASE_ID LIKE '1%'",
+]
+
+
+@pytest.fixture(scope="module")
+def workspaces(tmp_path_factory):
+
+	# The same table in SQLite, in a CSV folder & as Parquet
+	folder = str(tmp_path_factory.mktemp("backends"))
+	sqlite3.connect(os.path.join(folder, "collisions.sqlite")).close()
+	tables = []
+	for workspace, table in ((os.path.join(folder, "collisions.sqlite"), "SWITRS"), (folder, "SWITRS"), (folder, "SWITRS.parquet")):
+		da.env.workspace = workspace
+		da.WriteTable(table, Fields, Rows, Types)
+		tables.append((workspace, table))
+	yield tables
+	da.ResetWorkspaces()
+	da.env.workspace = None
+
+
+def _Read(workspace, table, where_clause):
+	da.env.workspace = workspace
+	return sorted(row[0] for row in da.SearchCursor(table, ["CASE_ID"], where_clause=where_clause))
+
+
+@pytest.mark.parametrize("where_clause", MixedClauses)
+def test_mixed_types_match_on_every_backend(workspaces, where_clause):
+	results = [_Read(workspace, table, where_clause) for workspace, table in workspaces]
+	assert results[0], "no rows match %s" % where_clause
+	assert results[1] == results[0]
+	assert results[2] == results[0]
+
+
+##### Collision Store #####
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+
+	# Synthetic collisions in SQLite, ingested into a collision store, and every collision as a row dictionary
+	from SyntheticSWITRS import SyntheticSWITRS, CollisionFields
+	from CollisionStore import CollisionStore
+	folder = str(tmp_path_factory.mktemp("store"))
+	source = os.path.join(folder, "switrs.sqlite")
+	SyntheticSWITRS(0.02, 2016).Write(source)
+	CollisionStore(os.path.join(folder, "store")).Ingest("SWITRS2009_to_2013", "Collisions2009to2013PartiesJoin")
+	rows = [dict(zip(CollisionFields, row)) for row in da.SearchCursor("SWITRS2009_to_2013", CollisionFields)]
+	yield os.path.join(folder, "store"), rows
+	da.ResetWorkspaces()
+	da.env.workspace = None
+
+
+def _StoreClauses(rows):
+
+	# One intersection with a few collisions (read row by row) & enough intersections for the Arrow filter
+	counts = {}
+	for row in rows:
+		counts[row["IntID"]] = counts.get(row["IntID"], 0) + 1
+	busiest = sorted(counts, key=lambda int_id: -counts[int_id])
+	few = ", ".join("'%d'" % int_id for int_id in busiest[:1])
+	many = ", ".join("'%d'" % int_id for int_id in busiest[:40])
+	return ["COLLISION_SEVERITY = '1'", "PCF_VIOL_CATEGORY = 3", "PCF_VIOL_CATEGORY IN (3, 10)",
+		"IntID IN (%s) AND COLLISION_SEVERITY = '2'" % few, "IntID IN (%s) AND COLLISION_SEVERITY = '2'" % many,
+		"IntID IN (%s) AND PCF_VIOL_CATEGORY = 3" % many, "IntID IN (%s) AND DISTANCE <= '100'" % few]
+
+
+def test_store_filters_like_evaluate(store, monkeypatch):
+	import CollisionStore
+	from WhereClause import Parse, Evaluate
+	path, rows = store
+	for where_clause in _StoreClauses(rows):
+		expected = sorted(row["CASE_ID"] for row in rows if Evaluate(Parse(where_clause), row) is True)
+		assert expected, "no rows match %s" % where_clause
+
+		# Index lookups read row by row (up to SmallFilter rows), with the Arrow filter, and either way
+		for small_filter in (CollisionStore.SmallFilter, 0, 1 << 30):
+			monkeypatch.setattr(CollisionStore, "SmallFilter", small_filter)
+			assert _Read(path, "SWITRS2009_to_2013", where_clause) == expected, "%s (SmallFilter %d)" % (where_clause, small_filter)
+
+
+def test_store_repeated_in_values(store):
+	from CollisionStore import CollisionStore
+	path, rows = store
+	int_id = rows[0]["IntID"]
+	expected = sorted(row["CASE_ID"] for row in rows if row["IntID"] == int_id)
+
+	# A value repeated in an IN list matches its rows once, like SQL
+	assert _Read(path, "SWITRS2009_to_2013", "IntID IN (%d, %d)" % (int_id, int_id)) == expected
+	table = CollisionStore(path).Collisions(["CASE_ID"], int_ids=[int_id, int_id, int_id])
+	assert sorted(table.column("CASE_ID").to_pylist()) == expected
+
+
+def test_store_left_turn_drivers_with_text_party_type(store, tmp_path):
+	from SyntheticSWITRS import SyntheticSWITRS
+	from CollisionStore import CollisionStore, LeftTurnTable
+	path, rows = store
+	expected = sorted(row[0] for row in _Rows(path, LeftTurnTable))
+	assert expected
+
+	# The same parties with PARTY_TYPE stored as text
+	source = str(tmp_path / "switrs.sqlite")
+	SyntheticSWITRS(0.02, 2016).Write(source)
+	connection = sqlite3.connect(source)
+	connection.execute("ALTER TABLE Collisions2009to2013PartiesJoin RENAME COLUMN Parties_PARTY_TYPE TO PARTY_TYPE_CODE")
+	connection.execute("ALTER TABLE Collisions2009to2013PartiesJoin ADD COLUMN Parties_PARTY_TYPE TEXT")
+	connection.execute("UPDATE Collisions2009to2013PartiesJoin SET Parties_PARTY_TYPE = CAST(PARTY_TYPE_CODE AS TEXT)")
+	connection.commit()
+	connection.close()
+	CollisionStore(str(tmp_path / "store")).Ingest("SWITRS2009_to_2013", "Collisions2009to2013PartiesJoin")
+	assert sorted(row[0] for row in _Rows(str(tmp_path / "store"), LeftTurnTable)) == expected
+	da.ResetWorkspaces()
+
+
+def _Rows(workspace, table):
+	da.env.workspace = workspace
+	return list(da.SearchCursor(table, ["Parties_CASE_ID", "SWITRS2009_to_2013_IntID"]))
@@ -0,0 +1,204 @@
+#### LAPD Collision Export #####
+
+#### Writes geom_lapd_collisions_xl to a shapefile, GeoPackage or newline-delimited GeoJSON file without
+#### building the whole FeatureCollection in the database like the LAPD Data Import notebook (one
+#### jsonb_agg row, fetched with fetchall). Rows are read from a server-side cursor a batch at a time and
+#### each batch is written before the next is fetched, so memory stays the same whatever the size of the
+#### table. The properties & their types are the notebook's out_schema.
+####
+####     python LapdExport.py --db "host=localhost dbname=vz user=vz" --output Z:/GIS/DataLibrary/LAPD_CrimeCollision/Tables/Raw_Collisions_fromDianeWeber/PostGIS_Shapefile_Output/shp/collisions.shp
+####     python LapdExport.py --db /tmp/lapd.sqlite --output /tmp/collisions.ndjson --load-synthetic 200000 --profile /tmp/export.json
+####
+#### The format follows the extension of --output (.shp, .gpkg, .ndjson / .geojsonl); shapefiles and
+#### GeoPackages are written with Fiona. --db takes the same connection string (or SQLite stand-in) as
+#### LapdLoader.py; --load-synthetic first bulk loads that many generated collisions, for benchmarks. The
+#### time spent fetching & writing is kept in the --profile report.
+
+import argparse
+import json
+import os
+import sys
+from collections import OrderedDict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "Common"))
+import Instrument
+from Instrument import Stage, Count
+from LapdLoader import Connect, CreateTarget, BulkLoad, CollisionValues, SyntheticRecords, lapd_table
+
+log = Instrument.Logger("LapdExport")
+
+##### Input #####
+batch_rows = 5000
+
+# Schema for Fiona output
+OutSchema = {
+    'geometry': 'Point',
+    'properties': OrderedDict([
+        ('rd', 'str'),
+        ('dr_no', 'str'),
+        ('score', 'int'),
+        ('crm_cd', 'int'),
+        ('mc_inv', 'str'),
+        ('status', 'str'),
+        ('coord_x', 'float'),
+        ('coord_y', 'float'),
+        ('matched', 'str'),
+        ('ped_inv', 'str'),
+        ('vic_age', 'str'),
+        ('vic_dob', 'str'),
+        ('vic_sex', 'str'),
+        ('bike_inv', 'str'),
+        ('coord_xy', 'str'),
+        ('date_occ', 'str'),
+        ('loc_tier', 'str'),
+        ('location', 'str'),
+        ('time_occ', 'str'),
+        ('narrative', 'str'),
+        ('day_of_week', 'str'),
+        ('hit_and_run', 'str'),
+        ('at_intersection', 'str'),
+        ('collision_severity', 'str')
+    ])
+}
+
+# Point coordinates of the geometry in each dialect; the plain SQLite stand-in stores the WKT of coord_xy
+PointSQL = {"postgres": "ST_X(geom), ST_Y(geom)", "spatialite": "X(geom), Y(geom)", "sqlite": "geom, NULL"}
+
+# Output drivers by extension (None: written without Fiona)
+Drivers = {".shp": "ESRI Shapefile", ".gpkg": "GPKG", ".ndjson": None, ".geojsonl": None, ".jsonl": None}
+
+
+##### Read #####
+def Srid(conn, dialect, table=lapd_table):
+
+    # Grab the SRID of the geometry column; the stand-in's is 4326 with SpatiaLite, else NAD83 California
+    # V in feet (EPSG:2229, the same as the ESRI:102645 of the import)
+    if dialect == "postgres":
+        cursor = conn.cursor()
+        cursor.execute("SELECT Find_SRID('public', %s, 'geom');", (table,))
+        return cursor.fetchone()[0]
+    return 4326 if dialect == "spatialite" else 2229
+
+
+def FeatureBatches(conn, dialect, table=lapd_table, batch_size=batch_rows):
+
+    # Lists of GeoJSON-like features, batch_size rows at a time from a server-side cursor
+    properties = list(OutSchema['properties'])
+    if dialect == "postgres":
+        cursor = conn.cursor(name="lapd_export")
+        cursor.itersize = batch_size
+    else:
+        cursor = conn.cursor()
+    cursor.execute("SELECT collision_pkey, %s, %s FROM %s ORDER BY collision_pkey" % (PointSQL[dialect], ", ".join(properties), table))
+
+    while True:
+        with Stage("fetch"):
+            rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        with Stage("features"):
+            batch = [Feature(row, properties, dialect) for row in rows]
+        yield batch
+    cursor.close()
+
+
+def Feature(row, properties, dialect):
+    x, y = PointXY(row[1]) if dialect == "sqlite" else row[1:3]
+    geometry = {'type': 'Point', 'coordinates': (x, y)} if x is not None and y is not None else None
+    values = OrderedDict((name, PropertyValue(value, OutSchema['properties'][name])) for name, value in zip(properties, row[3:]))
+    return {'type': 'Feature', 'id': row[0], 'geometry': geometry, 'properties': values}
+
+
+def PointXY(wkt):
+    if not wkt or not wkt.upper().startswith("POINT"):
+        return None, None
+    x, y = wkt[wkt.index("(") + 1:wkt.rindex(")")].split()
+    return float(x), float(y)
+
+
+def PropertyValue(value, field_type):
+
+    # Values as the schema's type; empty text is NULL for numbers, dates are written like to_jsonb does
+    if value is None or (value == "" and field_type != 'str'):
+        return None
+    if field_type == 'int':
+        return int(value)
+    if field_type == 'float':
+        return float(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value if isinstance(value, type(u"")) else u"%s" % value
+
+
+##### Write #####
+def WriteFeatures(batches, out_path, srid):
+
+    # Writes each batch as it arrives; returns the number of features
+    driver = Drivers.get(os.path.splitext(out_path)[1].lower(), False)
+    if driver is False:
+        raise ValueError("Unknown output format %s; use one of %s" % (out_path, ", ".join(sorted(Drivers))))
+
+    count = 0
+    if driver is None:
+        with open(out_path, "w") as fout:
+            for batch in batches:
+                with Stage("write"):
+                    fout.write("".join(json.dumps(feature) + "\n" for feature in batch))
+                count += len(batch)
+                Count("features", len(batch))
+        return count
+
+    import fiona
+    try:
+        from fiona.crs import CRS
+        crs = CRS.from_epsg(srid)
+    except ImportError:
+        # Fiona before 1.9 has no CRS class
+        from fiona.crs import from_epsg
+        crs = from_epsg(srid)
+    with fiona.open(out_path, 'w', crs=crs, driver=driver, schema=OutSchema) as c:
+        for batch in batches:
+            with Stage("write"):
+                c.writerecords(batch)
+            count += len(batch)
+            Count("features", len(batch))
+    return count
+
+
+##### Main Function #####
+def ExportCollisions(db, out_path, table=lapd_table, batch_size=batch_rows):
+
+    conn, dialect = Connect(db)
+    try:
+        srid = Srid(conn, dialect, table)
+        count = WriteFeatures(FeatureBatches(conn, dialect, table, batch_size), out_path, srid)
+    finally:
+        conn.close()
+    log.info("Wrote %d collisions from %s to %s (EPSG:%s)", count, table, out_path, srid)
+    return count
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Export the LAPD collision table to a shapefile, GeoPackage or newline-delimited GeoJSON, a batch at a time.")
+    parser.add_argument("--db", default=os.environ.get("LAPD_DB"), help="PostgreSQL connection string, or a .sqlite file for the local stand-in (default: $LAPD_DB)")
+    parser.add_argument("--table", default=lapd_table, help="collision table")
+    parser.add_argument("--output", required=True, help="output file: .shp, .gpkg, .ndjson or .geojsonl")
+    parser.add_argument("--batch-rows", type=int, default=batch_rows, help="rows fetched & written at a time")
+    parser.add_argument("--load-synthetic", type=int, default=None, help="first bulk load this many generated collisions into the table (for benchmarks)")
+    Instrument.AddArguments(parser)
+    args = parser.parse_args()
+    Instrument.Configure(args)
+
+    if not args.db:
+        parser.error("--db (or LAPD_DB) is required")
+
+    if args.load_synthetic:
+        with Stage("load"):
+            conn, dialect = Connect(args.db)
+            CreateTarget(conn, dialect, args.table)
+            BulkLoad(conn, dialect, (CollisionValues(r) for r in SyntheticRecords(args.load_synthetic)), args.table)
+            conn.close()
+    with Stage("export"):
+        ExportCollisions(args.db, args.output, args.table, args.batch_rows)
+    Instrument.Finish(args, "LapdExport")
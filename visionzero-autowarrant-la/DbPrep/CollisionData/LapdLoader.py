@@ -0,0 +1,331 @@
+#### LAPD Collision Bulk Loader #####
+
+#### Loads the LAPD collision workbook into geom_lapd_collisions_xl without the one INSERT per row of the
+#### LAPD Data Import notebook:
+####
+####   1. The read-only workbook rows go through CollisionRecords (LapdRecords.py) and are formatted as
+####      COPY text one at a time, so the workbook is never held in memory.
+####   2. The text is streamed with COPY into a temporary staging table with the columns of the target.
+####   3. In the same transaction the target is replaced (or, with --merge, only the DR numbers of the
+####      workbook are) by one INSERT ... SELECT from the staging table that builds all the geometries.
+####
+#### Readers see the old rows until the commit, and a failed load leaves the table as it was. A workbook
+#### without rows leaves it as it was too ("No Rows Found"), unless --merge is given.
+####
+####     python LapdLoader.py --db "host=localhost dbname=vz user=vz" --workbook Z:/GIS/DataLibrary/LAPD_CrimeCollision/Tables/Raw_Collisions_fromDianeWeber/
+####
+#### The connection string is read from --db or the LAPD_DB environment variable. A path to a .sqlite
+#### file loads into SQLite instead, as a local stand-in: the COPY text is parsed back & inserted, and the
+#### geometry is built with SpatiaLite when it can be loaded (otherwise geom holds the WKT of coord_xy).
+#### --synthetic N loads N generated collisions instead of a workbook, and --compare also times the
+#### per-row inserts of the notebook on the same rows, e.g.
+####
+####     python LapdLoader.py --db /tmp/lapd.sqlite --synthetic 50000 --compare
+
+import argparse
+import datetime
+import itertools
+import os
+import random
+import sqlite3
+import time
+from collections import namedtuple
+
+from LapdRecords import IterWorkbook, CollisionRecords
+
+try:
+    TextType = unicode
+except NameError:
+    TextType = str
+
+##### Input #####
+lapd_table = "geom_lapd_collisions_xl"
+staging_table = "lapd_collisions_staging"
+batch_rows = 10000
+
+# Target columns (except geom) and the record value of each; the types are the SQLite stand-in's
+Columns = [("dr_no", "TEXT"), ("status", "TEXT"), ("crm_cd", "INTEGER"), ("rd", "TEXT"), ("day_of_week", "TEXT"),
+           ("date_occ", "TEXT"), ("time_occ", "TEXT"), ("location", "TEXT"), ("collision_severity", "TEXT"),
+           ("ped_inv", "TEXT"), ("bike_inv", "TEXT"), ("mc_inv", "TEXT"), ("hit_and_run", "TEXT"),
+           ("at_intersection", "TEXT"), ("narrative", "TEXT"), ("vic_sex", "TEXT"), ("vic_age", "TEXT"),
+           ("vic_dob", "TEXT"), ("coord_x", "REAL"), ("coord_y", "REAL"), ("coord_xy", "TEXT"),
+           ("matched", "TEXT"), ("score", "INTEGER"), ("loc_tier", "TEXT")]
+ColumnNames = [name for name, _ in Columns]
+
+# Spreadsheet coords in NAD83 California V; the geometry is stored in WGS84
+GeomSQL = {"postgres": "ST_Transform(ST_GeomFromText(coord_xy, 102645), 4326)",
+           "spatialite": "Transform(GeomFromText(coord_xy, 102645), 4326)",
+           "sqlite": "coord_xy"}
+
+
+##### Records to Rows #####
+def CollisionValues(row):
+
+    # The values of one record in the order of Columns, formatted like the notebook's INSERT
+    # Assign collisons without a location to X,Y coordinates (0,0)
+    xy = row['XY']
+    coord_xy = 'POINT(0 0)' if xy == "" or xy is None else 'POINT(' + xy.replace(",", " ") + ')'
+    return (row['DR'], row['CASESTATUS'], row['CRIMECLASSCODES'], row['RD'], row['DOW'], row['BEGDATE'].date(),
+            str(row['BEGTIME']).zfill(4), row['STREETNAME1'], row['collision_severity'], row['ped_inv'],
+            row['bike_inv'], row['mc_inv'], row['hit_and_run'], row['intersection'], row['NARRATIVE'],
+            row['VICSEX'], row['VICAGE'], row['VICDOB'], row['X'], row['Y'], coord_xy, row['MATCHED'],
+            row['SCORE'], row['LOC_TIER'])
+
+
+##### COPY Text #####
+CopyEscapes = [("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r")]
+
+
+def CopyValue(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, (str, TextType)):
+        text = value
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    else:
+        return TextType(value)
+    if "\\" in text or "\t" in text or "\n" in text or "\r" in text:
+        for char, escape in CopyEscapes:
+            text = text.replace(char, escape)
+    return text
+
+
+def ParseCopyValue(text):
+    if "\\" not in text:
+        return text
+    if text == "\\N":
+        return None
+    out, i = [], 0
+    while i < len(text):
+        if text[i] == "\\" and i + 1 < len(text):
+            out.append({"t": "\t", "n": "\n", "r": "\r"}.get(text[i + 1], text[i + 1]))
+            i += 2
+        else:
+            out.append(text[i])
+            i += 1
+    return "".join(out)
+
+
+class CopyStream(object):
+
+    # File-like COPY text (tab separated, \N for NULL) of a row iterator, formatted as it is read;
+    # counts the rows read
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.pending = ""
+        self.count = 0
+
+    def readline(self, size=-1):
+        if self.pending:
+            line, self.pending = self.pending, ""
+            return line
+        for row in self.rows:
+            self.count += 1
+            return "\t".join(CopyValue(v) for v in row) + "\n"
+        return ""
+
+    def read(self, size=-1):
+        parts, length = [], 0
+        while size < 0 or length < size:
+            line = self.readline()
+            if not line:
+                break
+            parts.append(line)
+            length += len(line)
+        data = "".join(parts)
+        if size >= 0 and len(data) > size:
+            data, self.pending = data[:size], data[size:]
+        return data
+
+
+##### Database #####
+def Connect(db):
+
+    # (connection, dialect) for a PostgreSQL connection string or a SQLite file
+    if os.path.splitext(db)[1].lower() in (".sqlite", ".db", ".sqlite3"):
+        conn = sqlite3.connect(db, isolation_level=None)
+        try:
+            conn.enable_load_extension(True)
+            conn.load_extension("mod_spatialite")
+            return conn, "spatialite"
+        except (AttributeError, sqlite3.OperationalError):
+            return conn, "sqlite"
+    import psycopg2
+    return psycopg2.connect(db), "postgres"
+
+
+def CreateTarget(conn, dialect, table=lapd_table):
+
+    # The stand-in's target table; the PostgreSQL table already exists
+    if dialect != "postgres":
+        conn.execute("CREATE TABLE IF NOT EXISTS %s (collision_pkey INTEGER PRIMARY KEY, %s, geom)" %
+                     (table, ", ".join("%s %s" % column for column in Columns)))
+
+
+##### Bulk Load #####
+def BulkLoad(conn, dialect, rows, table=lapd_table, merge=False):
+
+    # COPY into staging, then replace (or merge by dr_no) the target in one transaction; returns the
+    # number of rows loaded
+    columns = ", ".join(ColumnNames)
+    stream = CopyStream(rows)
+    cursor = conn.cursor()
+    Begin(cursor, dialect)
+    try:
+        if dialect == "postgres":
+            cursor.execute("CREATE TEMP TABLE %s ON COMMIT DROP AS SELECT %s FROM %s WITH NO DATA" % (staging_table, columns, table))
+            cursor.copy_expert("COPY %s (%s) FROM STDIN" % (staging_table, columns), stream, size=2 ** 16)
+        else:
+            cursor.execute("CREATE TEMP TABLE %s AS SELECT %s FROM %s WHERE 0" % (staging_table, columns, table))
+            SqliteCopy(cursor, staging_table, stream)
+
+        # Like the notebook, an empty (or unreadable) workbook does not empty the table
+        if stream.count == 0 and not merge:
+            End(conn, cursor, dialect, "ROLLBACK")
+            print("No Rows Found")
+            return 0
+
+        if merge:
+            cursor.execute("DELETE FROM %s WHERE dr_no IN (SELECT dr_no FROM %s)" % (table, staging_table))
+        else:
+            cursor.execute("DELETE FROM %s" % table)
+        cursor.execute("INSERT INTO %s (%s, geom) SELECT %s, %s FROM %s" % (table, columns, columns, GeomSQL[dialect], staging_table))
+        if dialect != "postgres":
+            cursor.execute("DROP TABLE temp.%s" % staging_table)
+    except Exception:
+        End(conn, cursor, dialect, "ROLLBACK")
+        raise
+    End(conn, cursor, dialect, "COMMIT")
+    return stream.count
+
+
+def Begin(cursor, dialect):
+    # psycopg2 opens the transaction itself; the stand-in connects in autocommit mode
+    if dialect != "postgres":
+        cursor.execute("BEGIN")
+
+
+def End(conn, cursor, dialect, command):
+    if dialect == "postgres":
+        conn.commit() if command == "COMMIT" else conn.rollback()
+    else:
+        cursor.execute(command)
+
+
+def SqliteCopy(cursor, table, stream):
+
+    # The stand-in for COPY FROM STDIN: parses the COPY text of the stream & inserts it in batches
+    insert = "INSERT INTO %s VALUES (%s)" % (table, ", ".join("?" * len(Columns)))
+    while True:
+        batch = []
+        for line in iter(stream.readline, ""):
+            batch.append([ParseCopyValue(v) for v in line[:-1].split("\t")])
+            if len(batch) >= batch_rows:
+                break
+        if not batch:
+            return
+        cursor.executemany(insert, batch)
+
+
+##### Per-row Load (the notebook's) #####
+def RowLoad(conn, dialect, rows, table=lapd_table):
+
+    # DELETE, then one INSERT per row, building each geometry as it is inserted
+    cursor = conn.cursor()
+    marker = "%s" if dialect == "postgres" else "?"
+    geom = GeomSQL[dialect].replace("coord_xy", marker)
+    insert = "INSERT INTO %s (%s, geom) VALUES (%s, %s)" % (table, ", ".join(ColumnNames), ", ".join([marker] * len(Columns)), geom)
+    xy_column = ColumnNames.index("coord_xy")
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        print("No Rows Found")
+        return 0
+    rows = itertools.chain([first], rows)
+    Begin(cursor, dialect)
+    cursor.execute("DELETE FROM %s" % table)
+    count = 0
+    for row in rows:
+        values = list(row)
+        if dialect != "postgres":
+            values = [v.isoformat() if isinstance(v, datetime.date) else v for v in values]
+        cursor.execute(insert, values + [values[xy_column]])
+        count += 1
+    End(conn, cursor, dialect, "COMMIT")
+    return count
+
+
+##### Synthetic Records #####
+Cell = namedtuple("Cell", "value")
+SyntheticHeader = ["DR", "CASESTATUS", "CRIMECLASSCODES", "RD", "DOW", "BEGDATE", "BEGTIME", "STREETNAME1", "MOCODES",
+                   "NARRATIVE", "VICSEX", "VICAGE", "VICDOB", "X", "Y", "XY", "MATCHED", "SCORE", "LOC_TIER"]
+
+
+def SyntheticRecords(n, seed=0):
+
+    # n workbook-like records (with MO codes, tabs & line breaks in the narratives, collisions without a
+    # location), through CollisionRecords like the workbook rows
+    rng = random.Random(seed)
+    start = datetime.datetime(2017, 1, 1)
+
+    def Row(i):
+        date = start + datetime.timedelta(days=rng.randrange(365))
+        x, y = round(rng.uniform(6.4e6, 6.6e6), 2), round(rng.uniform(1.75e6, 1.95e6), 2)
+        located = rng.random() > 0.05
+        codes = " ".join(str(c) for c in rng.sample([3003, 3008, 3009, 3024, 3025, 3026, 3027, 3028, 3029, 3036, 3037, 3101], 3))
+        return [Cell(v) for v in (
+            "17%07d" % i, rng.choice(["IC", "AO", "AA"]), 997, "%04d" % rng.randrange(100, 2200),
+            date.strftime("%A"), date, rng.randrange(2400), "%d MAIN ST\t& 1ST" % rng.randrange(100, 9999), codes,
+            "VEH 1 TRAVELING N\nVEH 2 TURNING \\ LEFT" if i % 7 == 0 else "VEH 1 REAR ENDED VEH 2",
+            rng.choice(["M", "F", None]), str(rng.randrange(16, 90)), None,
+            x if located else None, y if located else None, "%s,%s" % (x, y) if located else "",
+            "Y" if located else "N", rng.randrange(80, 101), "1")]
+
+    return CollisionRecords((Row(i) for i in range(n)), SyntheticHeader)
+
+
+##### Main Function #####
+def LoadCollisions(db, records, table=lapd_table, merge=False, compare=False):
+
+    # records: function returning the workbook records; with compare, the records are first loaded with
+    # the per-row inserts of the notebook, to report the speed of both
+    conn, dialect = Connect(db)
+    CreateTarget(conn, dialect, table)
+
+    if compare:
+        t0 = time.time()
+        n = RowLoad(conn, dialect, (CollisionValues(r) for r in records()), table)
+        row_time = time.time() - t0
+        print("Per-row inserts: %d rows into %s (%s) in %.2f s, %.0f rows/s" % (n, table, dialect, row_time, n / max(row_time, 1e-9)))
+
+    t0 = time.time()
+    n = BulkLoad(conn, dialect, (CollisionValues(r) for r in records()), table, merge)
+    bulk_time = time.time() - t0
+    print("Bulk load: %d rows into %s (%s) in %.2f s, %.0f rows/s" % (n, table, dialect, bulk_time, n / max(bulk_time, 1e-9)))
+    if compare:
+        print("Bulk load speed: %.1fx the per-row inserts" % (row_time / max(bulk_time, 1e-9)))
+
+    conn.close()
+    return n
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Bulk load the LAPD collision workbook into geom_lapd_collisions_xl.")
+    parser.add_argument("--db", default=os.environ.get("LAPD_DB"), help="PostgreSQL connection string, or a .sqlite file for the local stand-in (default: $LAPD_DB)")
+    parser.add_argument("--workbook", default=None, help="LAPD collision workbook (.xlsx, or a folder holding one)")
+    parser.add_argument("--synthetic", type=int, default=None, help="load this many generated collisions instead of a workbook")
+    parser.add_argument("--table", default=lapd_table, help="target table")
+    parser.add_argument("--merge", action="store_true", help="only replace the rows with the DR numbers of the workbook, instead of the whole table")
+    parser.add_argument("--compare", action="store_true", help="first load the rows with one INSERT per row and report the speed of both")
+    args = parser.parse_args()
+
+    if not args.db:
+        parser.error("--db (or LAPD_DB) is required")
+    if not args.workbook and not args.synthetic:
+        parser.error("one of --workbook or --synthetic is required")
+
+    records = (lambda: IterWorkbook(args.workbook)) if args.workbook else (lambda: SyntheticRecords(args.synthetic))
+    LoadCollisions(args.db, records, args.table, args.merge, args.compare)
@@ -0,0 +1,107 @@
+#### LAPD Collision Records #####
+
+#### Reads the LAPD collision workbook into one dictionary per collision, with the MO codes parsed into
+#### the severity and involvement fields. The LAPD Data Import notebook imports CollisionDict from here,
+#### and other scripts (e.g. StreetGeocoder.py, LapdLoader.py) read the workbook with it too, without the
+#### database & ArcGIS Online steps of the notebook.
+
+import glob
+import os
+
+##### Read the Workbook #####
+def ReadWorkbook(path):
+    return list(IterWorkbook(path))
+
+
+def IterWorkbook(path):
+
+    # The records of the workbook one at a time, as the read-only sheet is read
+    # path: an .xlsx file, or a folder holding one (like the import notebook, the first one is read)
+    import openpyxl
+    if os.path.isdir(path):
+        result = sorted(glob.glob(os.path.join(path, '*.xlsx')))
+        if not result:
+            raise IOError("No .xlsx workbook in %s" % path)
+        path = result[0]
+
+    lapd_wb = openpyxl.load_workbook(path, read_only=True)
+    lapd_ws = lapd_wb.active
+    rows = lapd_ws.rows
+    first_row = [cell.value for cell in next(rows)]
+    return CollisionRecords(rows, first_row)
+
+
+##### Create a dictionary using the first row of the sheet as the keys and row values as value pairs
+def CollisionDict(rows, first_row):
+    return list(CollisionRecords(rows, first_row))
+
+
+def CollisionRecords(rows, first_row):
+
+    for row in rows:
+        record = {}
+        # Create a dictionary based on the attributes in the first row
+        for key, cell in zip(first_row, row):
+
+            # For MO Codes, we want to parse out important info
+            if key == 'MOCODES':
+                clean_codes = CleanMOCodes(cell.value)
+                for attr, val in clean_codes.items():
+                    record[attr] = val
+                record[key] = cell.value
+
+            else:
+                record[key] = cell.value
+
+        yield record
+
+
+##### Sort and Parse MO Codes
+def CleanMOCodes(list_of_codes):
+
+    # Dictionary keys that we will add later
+    dict = {}
+    flds = ['collision_severity', 'ped_inv', 'bike_inv', 'mc_inv','hit_and_run', 'intersection']
+    for fld in flds:
+        dict[fld] = ''
+
+    # Convert str to int (a collision without MO codes keeps the empty values)
+    mo_codes_str = str(list_of_codes or '').split()
+    mo_codes = sorted(list(map(int, mo_codes_str)), key=int)
+
+    # Codes for ped/bike/mc/hit&run/collision severity
+    ped_inv_codes = [3003]
+    bike_inv_codes = [3008, 3016, 3017, 3018]
+    mc_inv_codes = [3009, 3013, 3014, 3015]
+    hit_and_run_codes = [3029, 3030]
+
+    # Check collision severity
+    if 3027 in mo_codes:
+        dict['collision_severity'] = 1
+    elif 3024 in mo_codes:
+        dict['collision_severity'] = 2
+    elif 3025 in mo_codes:
+        dict['collision_severity'] = 3
+    elif 3026 in mo_codes:
+        dict['collision_severity'] = 4
+    elif 3028 in mo_codes:
+        dict['collision_severity'] = 0
+
+    # Check for bike/ped/mc involved & hit and runs
+    if len([i for i in mo_codes if i in ped_inv_codes]) > 0:
+        dict['ped_inv'] = 'Y'
+    if len([i for i in mo_codes if i in bike_inv_codes]) > 0:
+        dict['bike_inv'] = 'Y'
+    if len([i for i in mo_codes if i in mc_inv_codes]) > 0:
+        dict['mc_inv'] = 'Y'
+    if len([i for i in mo_codes if i in hit_and_run_codes]) > 0:
+        dict['hit_and_run'] = 'Y'
+
+    # Check for intersection-related collisions
+    if 3036 in mo_codes:
+        dict['intersection'] = 'Y'
+    elif 3037 in mo_codes:
+        dict['intersection'] = 'N'
+
+    # Return dictionary
+    return dict
@@ -0,0 +1,301 @@
+#### LAPD Street-Name Geocoder #####
+
+#### LAPD collisions without coordinates are imported at POINT(0 0), so they never reach an intersection
+#### in the warrant searches. This matches the street names of each collision (STREETNAME1 & the cross
+#### street, or one location like "MAIN ST / 1ST ST") to the street pairs of the cleaned BOE intersections
+#### (FROM_ST & TO_ST, see CenterlineCleaning/IntersectionDedup.py) and assigns the intersection ID & X/Y:
+####
+####   1. Both sides are normalized the same way (upper case, standard suffixes & ordinals, no leading
+####      direction) and written as "STREET A & STREET B", with the streets in alphabetical order.
+####   2. Pairs found as-is in the intersection dictionary are exact matches (score 1).
+####   3. The rest are matched with the tf-idf trigrams of string-matching-at-scale/string_match.py. The
+####      dictionary is vectorized once; a collision is only compared with the intersections of which one
+####      street starts with the same word as its first street (then, if the score is too low, its second
+####      street), instead of with the whole city.
+####
+####     python StreetGeocoder.py --workbook /data/lapd/collisions.xlsx --workspace /data/boe.gpkg --output lapd_geocoded
+####     python StreetGeocoder.py --workspace /data/lapd.sqlite --collisions lapd_collisions --street-fields location --id-field dr_no --intersections-workspace /data/boe.gpkg
+####
+#### Writes one row per collision (ID, normalized street pair, matched pair, intersection ID, X, Y, score and
+#### match type) and prints the match rate and the distribution of the scores.
+
+import argparse
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "Common"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir, "string-matching-at-scale"))
+import DataAccess as da
+from DataAccess import env
+from string_match import TargetIndex
+
+##### Input #####
+env.workspace = "Z:/GIS/DataLibrary/Transportation/BOE_Centerline_Intersections150930/boe_output.gdb"
+boe_int_clean = "StreetIntersections_clean"
+lapd_geocoded = "lapd_geocoded"
+min_score = 0.8  # lowest tf-idf score that is assigned an intersection
+
+# Separators between the two streets of a one-field location
+PairSeparator = re.compile(r"\s*(?:/|&|@|\bAND\b|\bAT\b)\s*")
+
+# Words replaced when they are the last word of a street name
+Suffixes = {"STREET": "ST", "STR": "ST", "AVENUE": "AV", "AVE": "AV", "BOULEVARD": "BL", "BLVD": "BL",
+            "DRIVE": "DR", "PLACE": "PL", "ROAD": "RD", "LANE": "LN", "COURT": "CT", "TERRACE": "TR",
+            "TER": "TR", "WAY": "WY", "PARKWAY": "PY", "PKWY": "PY", "HIGHWAY": "HY", "HWY": "HY",
+            "CIRCLE": "CIR", "FREEWAY": "FWY", "FRWY": "FWY"}
+
+# Words replaced anywhere in a street name
+Words = {"FIRST": "1ST", "SECOND": "2ND", "THIRD": "3RD", "FOURTH": "4TH", "FIFTH": "5TH", "SIXTH": "6TH",
+         "SEVENTH": "7TH", "EIGHTH": "8TH", "NINTH": "9TH", "TENTH": "10TH", "SAINT": "ST", "MOUNT": "MT"}
+
+# Leading directions, dropped when more words follow ("W 6TH ST" -> "6TH ST", but "WEST BL" is kept)
+Directions = ["N", "S", "E", "W", "NORTH", "SOUTH", "EAST", "WEST"]
+
+# Score bins of the report, highest first
+ScoreBins = [1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.0]
+
+
+##### Normalize #####
+def NormalizeStreet(name):
+
+    # Upper case, punctuation removed, standard words & suffix, no leading direction or house number
+    words = re.sub(r"[^A-Z0-9 ]", " ", str(name or "").upper()).split()
+    if len(words) > 1 and words[0].isdigit():
+        words = words[1:]
+    if len(words) > 2 and words[0] in Directions:
+        words = words[1:]
+    words = [Words.get(w, w) for w in words]
+    if len(words) > 1:
+        words[-1] = Suffixes.get(words[-1], words[-1])
+    return " ".join(words)
+
+
+def StreetPair(street, cross_street=None):
+
+    # The two normalized streets in alphabetical order, or None if there are not two different streets;
+    # without a cross street, the location is split on "/", "&", "AND", "AT"
+    if not cross_street:
+        parts = [p for p in PairSeparator.split(str(street or "").upper()) if p.strip()]
+        if len(parts) != 2:
+            return None
+        street, cross_street = parts
+    streets = sorted([NormalizeStreet(street), NormalizeStreet(cross_street)])
+    if not streets[0] or streets[0] == streets[1]:
+        return None
+    return tuple(streets)
+
+
+def PairText(pair):
+    return "%s & %s" % pair
+
+
+def BlockKey(street):
+    return street.split()[0]
+
+
+##### Intersection Dictionary #####
+class IntersectionDictionary(object):
+
+    # Unique normalized street pairs of the intersections, their IDs & locations, the tf-idf index of the
+    # pair texts and the pairs of each block (leading word of either street)
+
+    def __init__(self, rows):
+
+        # rows: (intersection ID, FROM_ST, TO_ST, X, Y)
+        self.pairs, self.ids, self.xy, self.count = [], [], [], []
+        positions = {}
+        for int_id, from_st, to_st, x, y in rows:
+            pair = StreetPair(from_st, to_st)
+            if pair is None:
+                continue
+            if pair in positions:
+                self.count[positions[pair]] += 1
+                continue
+            positions[pair] = len(self.pairs)
+            self.pairs.append(pair)
+            self.ids.append(int_id)
+            self.xy.append((x, y))
+            self.count.append(1)
+        self.positions = positions
+
+        self.blocks = {}
+        for i, pair in enumerate(self.pairs):
+            for key in set(BlockKey(street) for street in pair):
+                self.blocks.setdefault(key, []).append(i)
+        self.index = TargetIndex.build([PairText(pair) for pair in self.pairs])
+        self.block_index = {}
+
+    def BlockIndex(self, key):
+        # tf-idf index of one block's pairs, built the first time the block is used
+        if key not in self.block_index:
+            self.block_index[key] = self.index.subset(self.blocks[key])
+        return self.block_index[key]
+
+    @classmethod
+    def Read(cls, table, id_field="ASSETID", xy_fields=("X", "Y")):
+        t0 = time.time()
+        dictionary = cls(da.SearchCursor(table, [id_field, "FROM_ST", "TO_ST"] + list(xy_fields)))
+        print("Read %d intersection street pairs (%d blocks) in %.1f s" % (len(dictionary.pairs), len(dictionary.blocks), time.time() - t0))
+        return dictionary
+
+
+##### Match #####
+def MatchBlocked(dictionary, pairs, todo, street, scores, matches):
+
+    # Fuzzy match of the pairs at the positions todo, blocked by the leading word of pair[street]; keeps
+    # the better of this and any earlier candidate in scores & matches
+    blocks = {}
+    for i in todo:
+        blocks.setdefault(BlockKey(pairs[i][street]), []).append(i)
+    vectors = dictionary.index.vectorize([PairText(pairs[i]) for i in todo])
+    rows = dict((i, row) for row, i in enumerate(todo))
+
+    for key, block in blocks.items():
+        if key not in dictionary.blocks:
+            continue
+        target_idx = dictionary.blocks[key]
+        best = dictionary.BlockIndex(key).match_vectors(vectors[[rows[i] for i in block]], ntop=1).tocoo()
+        for row, col, score in zip(best.row, best.col, best.data):
+            i = block[row]
+            if score > scores[i]:
+                scores[i], matches[i] = score, target_idx[col]
+
+
+def GeocodePairs(dictionary, pairs, threshold=min_score):
+
+    # Best dictionary position, score & match type of each pair (None for no pair)
+    n = len(pairs)
+    scores = np.zeros(n)
+    matches = np.full(n, -1, dtype=np.int64)
+    types = ["no_pair" if pair is None else "" for pair in pairs]
+
+    todo = []
+    for i, pair in enumerate(pairs):
+        if pair is None:
+            continue
+        position = dictionary.positions.get(pair)
+        if position is not None:
+            scores[i], matches[i], types[i] = 1.0, position, "exact"
+        else:
+            todo.append(i)
+
+    # Block on the first street, then retry the pairs still under the threshold on the second street
+    for street in (0, 1):
+        if todo:
+            MatchBlocked(dictionary, pairs, todo, street, scores, matches)
+            todo = [i for i in todo if scores[i] < threshold]
+
+    for i, pair in enumerate(pairs):
+        if pair is not None and types[i] != "exact":
+            types[i] = "fuzzy" if scores[i] >= threshold else "unmatched"
+    return scores, matches, types
+
+
+##### Report #####
+def Report(scores, types):
+
+    n = len(types)
+    counts = OrderedDict((t, types.count(t)) for t in ("exact", "fuzzy", "unmatched", "no_pair"))
+    matched = counts["exact"] + counts["fuzzy"]
+    print("Geocoded %d of %d collisions (%.1f%%): %s" % (matched, n, 100.0 * matched / max(n, 1),
+        ", ".join("%d %s" % (c, t) for t, c in counts.items())))
+
+    # Best score of every collision with a street pair, exact matches included
+    paired = np.array([s for s, t in zip(scores, types) if t != "no_pair"])
+    print("Score distribution (%d collisions with a street pair):" % len(paired))
+    upper = None
+    for low in ScoreBins:
+        if upper is None:
+            inbin = paired >= low
+            label = "%.1f" % low
+        else:
+            inbin = (paired >= low) & (paired < upper)
+            label = "%.1f-%.1f" % (low, upper)
+        print("  %-8s %7d  %5.1f%%" % (label, inbin.sum(), 100.0 * inbin.sum() / max(len(paired), 1)))
+        upper = low
+    return counts
+
+
+##### Read Collisions #####
+def ReadCollisions(workbook=None, table=None, id_field="DR", street_fields=("STREETNAME1", "STREETNAME2"), xy_fields=None):
+
+    # (ID, location text, street pair) of each collision; with xy_fields, only collisions at (0, 0) or
+    # without coordinates are returned
+    fields = [id_field] + list(street_fields) + list(xy_fields or [])
+    if workbook:
+        from LapdRecords import ReadWorkbook
+        rows = ([record.get(f) for f in fields] for record in ReadWorkbook(workbook))
+    else:
+        rows = da.SearchCursor(table, fields)
+
+    collisions = []
+    for row in rows:
+        streets = row[1:1 + len(street_fields)]
+        if xy_fields:
+            x, y = row[-2:]
+            if x and y:
+                continue
+        location = " / ".join(str(s) for s in streets if s)
+        collisions.append((row[0], location, StreetPair(*streets[:2])))
+    return collisions
+
+
+##### Main Function #####
+def GeocodeCollisions(collisions, dictionary, out_table, threshold=min_score):
+
+    # collisions: (ID, location text, street pair) rows of ReadCollisions; dictionary: IntersectionDictionary
+    t0 = time.time()
+    pairs = [pair for _, _, pair in collisions]
+    scores, matches, types = GeocodePairs(dictionary, pairs, threshold)
+    print("Matched %d collisions in %.1f s" % (len(collisions), time.time() - t0))
+
+    fields = ["COLLISION_ID", "LOCATION", "STREET_PAIR", "MATCHED_PAIR", "INT_ID", "X", "Y", "SCORE", "MATCH", "N_INT"]
+    field_types = dict(COLLISION_ID="String", LOCATION="String", STREET_PAIR="String", MATCHED_PAIR="String", INT_ID="String",
+                       X="Real", Y="Real", SCORE="Real", MATCH="String", N_INT="Integer")
+    with da.InsertCursor(out_table, fields, field_types) as cursor:
+        for (collision_id, location, pair), score, match, match_type in zip(collisions, scores, matches, types):
+            # The best candidate is written for unmatched pairs too, but without an intersection
+            candidate = PairText(dictionary.pairs[match]) if match >= 0 else None
+            if match_type in ("exact", "fuzzy"):
+                x, y = dictionary.xy[match]
+                cursor.insertRow([str(collision_id), location, PairText(pair), candidate, str(dictionary.ids[match]),
+                                  x, y, round(float(score), 3), match_type, dictionary.count[match]])
+            else:
+                cursor.insertRow([str(collision_id), location, PairText(pair) if pair else None, candidate, None,
+                                  None, None, round(float(score), 3), match_type, 0])
+
+    counts = Report(scores, types)
+    print("Wrote %s in %.1f s" % (out_table, time.time() - t0))
+    return counts
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Assign LAPD collisions to BOE intersections by their street names.")
+    parser.add_argument("--workspace", default=env.workspace, help="workspace of the collision table & the output")
+    parser.add_argument("--workbook", default=None, help="LAPD collision workbook (.xlsx, or a folder holding one) to read instead of a collision table")
+    parser.add_argument("--collisions", default=None, help="collision table in the workspace")
+    parser.add_argument("--id-field", default="DR", help="collision ID field")
+    parser.add_argument("--street-fields", default="STREETNAME1,STREETNAME2", help="street & cross street fields, or one location field to split")
+    parser.add_argument("--missing-xy", default=None, help="X,Y fields; only collisions at (0, 0) or without coordinates are geocoded")
+    parser.add_argument("--intersections-workspace", default=None, help="workspace of the intersections, if not the same")
+    parser.add_argument("--intersections", default=boe_int_clean, help="cleaned intersections with FROM_ST, TO_ST, ID & X/Y fields")
+    parser.add_argument("--int-id-field", default="ASSETID", help="intersection ID field")
+    parser.add_argument("--output", default=lapd_geocoded, help="table for the geocoded collisions (written to the workspace)")
+    parser.add_argument("--min-score", type=float, default=min_score, help="lowest tf-idf score that is assigned an intersection")
+    args = parser.parse_args()
+
+    if not args.workbook and not args.collisions:
+        parser.error("one of --workbook or --collisions is required")
+
+    env.workspace = args.intersections_workspace or args.workspace
+    dictionary = IntersectionDictionary.Read(args.intersections, args.int_id_field)
+    env.workspace = args.workspace
+    collisions = ReadCollisions(args.workbook, args.collisions, args.id_field, args.street_fields.split(","),
+                                args.missing_xy.split(",") if args.missing_xy else None)
+    GeocodeCollisions(collisions, dictionary, args.output, args.min_score)
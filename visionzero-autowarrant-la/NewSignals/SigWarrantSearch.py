@@ -5,80 +5,318 @@
 
 ##### Setup Workspace #####
 
-import operator
-import arcpy
+import argparse
+import multiprocessing
+import os
+import sys
+import time
 import csv
-from arcpy import env
+from collections import defaultdict
 
-# Inputs
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+import DataAccess as da
+from DataAccess import env
+from PartyIndex import PartyIndex
+from RollingWindow import EvaluateWindows, WindowDays, Threshold
+from WarrantState import WarrantState, Fingerprint, Payloads
+from CollisionClassifier import SignalCases, SignalRule, Lookup, ExcludedMovements
+from IntersectionCollisions import IntersectionCollisions, Builder
+import Instrument
+from Instrument import Stage, Count
+
+# Inputs (the workspace can be a file geodatabase, or a GeoPackage / SQLite / folder of CSV or Parquet tables, see DataAccess.py)
 env.workspace = "Z:/VisionZero/GIS/Projects/CitywideWarrantSearch_May2016/WarrantSearch.gdb"
 UnSigInt = "UnSigInt_Outside3miBuffer"
 Collisions = "SWITRS2009_to_2013"
 Parties = "Collisions2009to2013PartiesJoin"
 
+# Collisions further than this from the intersection (in feet) are not counted
+MaxDistance = 100
+
+# Collision fields read for each intersection
+collision_fields = ["CASE_ID","COLLISION_DATE","PARTY_COUNT","DISTANCE","ALCOHOL_INVOLVED","IntID","PEDESTRIAN_ACCIDENT","BICYCLE_ACCIDENT","COLLISION_SEVERITY"]
+
 # Output
 outpath = "Z:/VisionZero/GIS/Projects/CitywideWarrantSearch_May2016/potential_signals.csv"
 
+log = Instrument.Logger("SigWarrantSearch")
+
 ##### Main Function #####
-def SignalWarrantSearch(intersection_fc):
+def SignalWarrantSearch(intersection_fc, window_days=WindowDays, threshold=Threshold, workers=1, shards=None, state_path=None,
+	max_distance=MaxDistance, excluded=ExcludedMovements):
 
-	# TESTING
-	ct = 0
+	# Load the party table once, instead of querying it for every collision
+	with Stage("load"):
+		party_index = PartyIndex.Load(Parties)
+		log.info("Loaded party index: %s", party_index.Summary())
 
-	# This dictionary stores all the qualifying collisions for each intersection
-	intersection_dict = {}
-	intersection_dict2 = {} 
+		# Query List of Unsignalized Intersections
+		int_fields = ["ASSETID"]
+		int_ids = [intersection[0] for intersection in da.SearchCursor(intersection_fc, int_fields)]
+		log.info("Read %d intersections", len(int_ids))
 
-	# Query List of Unsignalized Intersections
-	int_fields = ["ASSETID"]
-	int_rows = arcpy.da.SearchCursor(intersection_fc, int_fields)
-	for intersection in int_rows:
+	# Apply the party criteria to all collisions at once (same rules as PartyFilter)
+	with Stage("classify"):
+		signal_cases = SignalCases(party_index, excluded)
+		Count("parties_classified", party_index.PartyCount())
 
-		# TESTING
-		int_id = intersection[0]
-		ct += 1
-		if ct % 10 == 0:
-			print ct
-		#if ct == 200:
-		#	break
+	# All the qualifying collisions and the bike/ped KSI count of each intersection, packed into arrays (see Common/IntersectionCollisions.py)
+	with Stage("filter"):
+		if state_path:
+			collisions = IncrementalSearch(int_ids, party_index, signal_cases, state_path)
+		elif workers > 1:
+			collisions = ParallelSearch(int_ids, signal_cases, workers, shards, max_distance)
+		else:
+			collisions = SearchIntersections(int_ids, signal_cases, max_distance, progress=True)
+	Count("collisions_qualifying", collisions.CollisionCount())
+	log.info("Kept %s", collisions.Summary())
+
+	# Count, Sort, and Write the qualifying intersections to a csv
+	CountByYear(collisions, window_days, threshold)
 
-		# Add AssetID to the intersection dictionary
-		intersection_dict[int_id] = {}
 
-		# This is the ct for bike/ped ksi
-		bike_ped_ksi = 0
+##### Collision & Party Filter for a List of Intersections #####
+def SearchIntersections(int_ids, signal_cases, max_distance=MaxDistance, progress=False):
+
+	# Ordered, so the output is the same however the intersections are split up
+	builder = Builder()
+
+	for ct, int_id in enumerate(int_ids, 1):
+		if progress and ct % 1000 == 0:
+			log.info("Searched %d of %d intersections", ct, len(int_ids))
 
 		# Query Collisions Attached to Intersection, Query Parties for each Collision
-		collision_fields = ["CASE_ID","COLLISION_DATE","PARTY_COUNT","DISTANCE","ALCOHOL_INVOLVED","IntID","PEDESTRIAN_ACCIDENT","BICYCLE_ACCIDENT","COLLISION_SEVERITY"]
-		collision_query =  """ IntID = %d AND DISTANCE <= 100 AND ALCOHOL_INVOLVED IS NULL """ % (int_id)
-		collision_rows =  arcpy.da.SearchCursor(Collisions, collision_fields, where_clause=collision_query)
-		
-		# If the party criteria is met, add to the dictionary of intersections
-		for collision in collision_rows:
-			col_id = int(collision[0])
-			if PartyFilter(col_id) is True: 
-				intersection_dict[int_id][col_id] = collision[1]
-
-			ped_inv = collision[6]
-			bik_inv = collision[7]
-			col_sev = collision[8]
-			if (ped_inv == 'Y' or bik_inv == 'Y') and (col_sev == 1 or col_sev == 2):
-				bike_ped_ksi += 1
-
-		# Add bike/ped KSI collision count to the second intersection database
-		intersection_dict2[int_id] = bike_ped_ksi
+		collision_query =  """ IntID = %d AND DISTANCE <= %d AND ALCOHOL_INVOLVED IS NULL """ % (int_id, max_distance)
+		collision_rows =  da.SearchCursor(Collisions, collision_fields, where_clause=collision_query)
+		case_ids, dates, bike_ped_ksi = FilterCollisions(collision_rows, signal_cases)
+		builder.Add(int_id, case_ids, dates, bike_ped_ksi)
+		log.debug("Intersection %s: %d qualifying collisions", int_id, len(case_ids))
 
-	# Count, Sort, and Write the qualifying intersections to a csv
-	CountByYear(intersection_dict, intersection_dict2)
+	Count("intersections_searched", len(int_ids))
+	return builder.Build()
+
+
+##### Filter the Collisions of One Intersection #####
+def FilterCollisions(collision_rows, signal_cases):
+
+	# Returns the CASE_IDs & dates of the collisions that meet the party criteria, and the count of
+	# bike/ped KSI collisions. A CASE_ID read twice keeps its first place and its last date
+	case_ids, dates, positions = [], [], {}
+
+	# This is the ct for bike/ped ksi
+	bike_ped_ksi = 0
+	ct = 0
+
+	# If the party criteria is met, add to the dictionary of qualifying collisions
+	for collision in collision_rows:
+		col_id = int(collision[0])
+		if col_id in signal_cases:
+			if col_id in positions:
+				dates[positions[col_id]] = collision[1]
+			else:
+				positions[col_id] = len(case_ids)
+				case_ids.append(col_id)
+				dates.append(collision[1])
+
+		ped_inv = collision[6]
+		bik_inv = collision[7]
+		col_sev = collision[8]
+		if (ped_inv == 'Y' or bik_inv == 'Y') and (col_sev == 1 or col_sev == 2):
+			bike_ped_ksi += 1
+		ct += 1
+
+	Count("collisions_scanned", ct)
+	return case_ids, dates, bike_ped_ksi
+
+
+##### Incremental Search #####
+
+#### Instead of querying every intersection, the collision table is scanned once and compared with the
+#### snapshot kept in the state file (see Common/WarrantState.py). Only the intersections touched by
+#### added, removed or changed collisions (or new to the intersection list) are filtered again; the
+#### rest come from the state file. The first run with a new state file computes everything.
+
+def IncrementalSearch(int_ids, party_index, signal_cases, state_path):
+
+	state = WarrantState(state_path)
+
+	# Scan the collision table once; fingerprint each collision together with its parties
+	rows_by_int = defaultdict(list)
+	collisions = {}
+	for collision in da.SearchCursor(Collisions, collision_fields):
+		case_id = int(collision[0])
+		collisions[case_id] = (Fingerprint(tuple(collision) + tuple(party_index.Parties(case_id))), [collision[5]])
+		rows_by_int[collision[5]].append(collision)
+	Count("party_lookups", len(collisions))
+
+	# Intersections touched by the delta, plus any that were not searched before
+	delta = state.Diff("signal", collisions)
+	touched = set(payload[0] for payload in Payloads(delta))
+	known = state.SignalIntersections()
+	recompute = [int_id for int_id in int_ids if int_id in touched or int_id not in known]
+	log.info("%d collisions added, %d removed, %d changed; recomputing %d of %d intersections",
+		len(delta.added), len(delta.removed), len(delta.changed_new), len(recompute), len(int_ids))
+
+	# Same criteria as the collision query: DISTANCE <= 100 AND ALCOHOL_INVOLVED IS NULL (the default criteria)
+	builder = Builder()
+	for int_id in recompute:
+		collision_rows = [c for c in rows_by_int.get(int_id, []) if c[3] is not None and c[3] <= MaxDistance and c[4] is None]
+		builder.Add(int_id, *FilterCollisions(collision_rows, signal_cases))
+	Count("intersections_searched", len(recompute))
+
+	state.ReplaceSignal(builder.Build(), keep_int_ids=int_ids)
+	state.ApplyDelta("signal", collisions, delta)
+	state.Commit()
+
+	int_collisions = state.LoadSignal(int_ids)
+	state.Close()
+	return int_collisions
+
+
+##### Parallel Search #####
+
+#### The intersections are split into contiguous shards that are searched by a pool of processes.
+#### Each shard's results are merged back in the original intersection order, so the CSV is
+#### byte-identical to a serial run.
+
+_worker_signal_cases = None
+
+def _InitWorker(workspace, years, signal_cases):
+
+	# Each process opens its own workspace connection and keeps the qualifying CASE_IDs
+	global _worker_signal_cases
+	da.ResetWorkspaces()
+	env.workspace = workspace
+	env.years = years
+	_worker_signal_cases = signal_cases
+
+
+def _SearchShard(shard):
+
+	# The counters of each shard are sent back and added to the main process's profile
+	shard_no, int_ids, max_distance = shard
+	Instrument.profile.Reset()
+	t0 = time.time()
+	collisions = SearchIntersections(int_ids, _worker_signal_cases, max_distance)
+	return shard_no, collisions, time.time() - t0, Instrument.profile.counters
+
+
+def ParallelSearch(int_ids, signal_cases, workers, shards=None, max_distance=MaxDistance):
+
+	# Contiguous shards, a few per worker so a slow shard does not hold up the rest
+	shards = shards or workers * 4
+	size = max(1, -(-len(int_ids) // shards))
+	shard_list = [(i, int_ids[start:start + size], max_distance) for i, start in enumerate(range(0, len(int_ids), size))]
+
+	parts = []
+	pool = multiprocessing.Pool(workers, initializer=_InitWorker, initargs=(env.workspace, env.years, signal_cases))
+	try:
+		# imap returns the shards in order, whatever order they finish in; each comes back as a few arrays
+		for shard_no, shard_collisions, elapsed, counters in pool.imap(_SearchShard, shard_list):
+			parts.append(shard_collisions)
+			Instrument.profile.Merge(counters)
+			log.info("Shard %d of %d: %d intersections, %d qualifying collisions in %.2f s",
+				shard_no + 1, len(shard_list), len(shard_collisions), shard_collisions.CollisionCount(), elapsed)
+	finally:
+		pool.close()
+		pool.join()
+
+	return IntersectionCollisions.Concat(parts)
+
+
+##### Parameter Sweep #####
+
+#### Evaluates a grid of warrant criteria (distances, window lengths, thresholds & excluded movement
+#### lists) in one job: the party index and the collisions are read once, the party rule runs once per
+#### movement list, and the windows are counted once per distance, movement list & window length for
+#### all the thresholds. Writes a matrix with a column per configuration (1 where the intersection
+#### qualifies) and a row per intersection that qualifies under any of them.
+
+def SweepSearch(intersection_fc, distances, window_days_list, thresholds, movement_lists, out_path):
+
+	with Stage("load"):
+		party_index = PartyIndex.Load(Parties)
+		log.info("Loaded party index: %s", party_index.Summary())
+		int_ids = [intersection[0] for intersection in da.SearchCursor(intersection_fc, ["ASSETID"])]
+		int_positions = dict((int(int_id), i) for i, int_id in enumerate(int_ids))
+
+		# One scan of the collision table, out to the largest distance of the grid
+		collision_query = """ DISTANCE <= %d AND ALCOHOL_INVOLVED IS NULL """ % max(distances)
+		case_ids, dates, distance, locations = [], [], [], []
+		for collision in da.SearchCursor(Collisions, ["CASE_ID","COLLISION_DATE","DISTANCE","IntID"], where_clause=collision_query):
+			if collision[3] is None or int(collision[3]) not in int_positions:
+				continue
+			case_ids.append(int(collision[0]))
+			dates.append(collision[1])
+			distance.append(collision[2])
+			locations.append(int_positions[int(collision[3])])
+		Count("collisions_scanned", len(case_ids))
+		log.info("Read %d intersections and %d collisions within %d", len(int_ids), len(case_ids), max(distances))
+
+	# The collisions of each intersection are contiguous in this order, in the order they were read
+	case_ids = np.asarray(case_ids, dtype=np.int64)
+	dates = np.asarray(dates, dtype="datetime64[s]")
+	distance = np.asarray(distance, dtype=float)
+	locations = np.asarray(locations, dtype=np.int64)
+	by_location = np.argsort(locations, kind="mergesort")
+
+	with Stage("classify"):
+		positions, found = Lookup(party_index, case_ids)
+		meets = []
+		for excluded in movement_lists:
+			rule = SignalRule(party_index, excluded)
+			meets.append(found & rule[positions] if len(rule) else np.zeros(len(case_ids), dtype=bool))
+			Count("parties_classified", party_index.PartyCount())
+
+	labels, columns = [], []
+	with Stage("window"):
+		for excluded, meets_rule in zip(movement_lists, meets):
+			for max_distance in distances:
+				selected = by_location[(meets_rule & (distance <= max_distance))[by_location]]
+				selected, selected_dates = FirstCases(selected, locations, case_ids, dates)
+				offsets = np.searchsorted(locations[selected], np.arange(len(int_ids) + 1))
+				for window_days in window_days_list:
+					result = EvaluateWindows(offsets, selected_dates, window_days, min(thresholds))
+					for threshold in thresholds:
+						labels.append("DIST%d_DAYS%d_MIN%d_EXCL%s" % (max_distance, window_days, threshold, "".join(excluded)))
+						columns.append(result.max_count >= threshold)
+						log.info("%s: %d of %d intersections qualify", labels[-1], int(columns[-1].sum()), len(int_ids))
+
+	with Stage("write"), da.OpenCsv(out_path, 'w') as fout:
+		writer = csv.writer(fout, lineterminator='\n')
+		writer.writerow(["ASSETID"] + labels)
+		matrix = np.column_stack(columns) if columns else np.zeros((len(int_ids), 0), dtype=bool)
+		for i in np.flatnonzero(matrix.any(axis=1)):
+			writer.writerow([int_ids[i]] + matrix[i].astype(int).tolist())
+	Count("configurations", len(labels))
+	Count("intersections_qualifying", int(matrix.any(axis=1).sum()))
+
+
+def FirstCases(selected, locations, case_ids, dates):
+
+	# The rows of selected (grouped by intersection, in the order read) with each CASE_ID once per
+	# intersection, and their dates: like FilterCollisions, a CASE_ID read twice (e.g. joined to more
+	# than one party) keeps its first place and its last date
+	order = np.lexsort((np.arange(len(selected)), case_ids[selected], locations[selected]))
+	rows = selected[order]
+	new = np.ones(len(rows), dtype=bool)
+	new[1:] = (locations[rows[1:]] != locations[rows[:-1]]) | (case_ids[rows[1:]] != case_ids[rows[:-1]])
+	starts = np.flatnonzero(new)
+	first, last = order[starts], order[np.append(starts[1:], len(order)) - 1]
+	keep = np.argsort(first)
+	return selected[first[keep]], dates[selected[last[keep]]]
 
 
 ##### Check Party Criteria Function #####
-def PartyFilter(case_id):
+
+#### Row-by-row version of the party criteria; the search uses CollisionClassifier.SignalCases, which
+#### applies the same rules to all collisions at once (checked against this by Common/CompareClassifier.py)
+def PartyFilter(case_id, party_index):
 	
-	# Query the Party Table
-	party_fields = ["Parties_CASE_ID","Parties_DIR_OF_TRAVEL","Parties_MOVE_PRE_ACC"]
-	party_query =  """ Parties_CASE_ID = '%s' """ % (str(case_id))
-	party_rows = arcpy.da.SearchCursor(Parties, party_fields,where_clause=party_query) 
+	# Look up the parties in the party index (rows are CASE_ID, DIR_OF_TRAVEL, PARTY_TYPE, MOVE_PRE_ACC, OAF_VIOL_SECTION)
+	party_rows = party_index.Parties(case_id)
 	filtered_party_list = []
 
 	# Filter out Movement Preceding Collision
@@ -88,7 +326,7 @@ def PartyFilter(case_id):
 	# N: Crossed Into Opposing Lane, O: Parked, P: Merging, Q: Traveling Wrong Way, R: Other
 
 	for party in party_rows:
-		if party[2] not in excluded_movements:
+		if party[3] not in excluded_movements:
 			filtered_party_list.append(party[1])
 
 	# If at least 2 parties remaining, check for conflicting directions
@@ -101,57 +339,70 @@ def PartyFilter(case_id):
 				return True
 
 ##### Count, Sort, Write #####
-def CountByYear(intersection_dictionary, intersection_dictionary2):
-	with open(outpath, 'wb') as fout:
+def CountByYear(collisions, window_days=WindowDays, threshold=Threshold):
+
+	# The collisions of all intersections are already packed into arrays (CSR offsets per intersection)
+	intersections = collisions.int_ids
+
+	# Count the collisions in the 1-year period after each collision, for all intersections at once
+	with Stage("window"):
+		result = EvaluateWindows(collisions.offsets, collisions.dates, window_days, threshold)
+	Count("intersections_qualifying", int(result.qualifies.sum()))
+	log.info("%d of %d intersections qualify", int(result.qualifies.sum()), len(intersections))
+
+	with Stage("write"), da.OpenCsv(outpath, 'w') as fout:
 		writer = csv.writer(fout, lineterminator='\n')
-		
-		# First check: does the intersection even have 5 collisions total?
-		for intersection in intersection_dictionary:
-			if len(intersection_dictionary[intersection]) >= 5:
-				print ">5"
-
-				# Second step: sort collisions by date for that intersection
-				sorted_intersection = sorted(intersection_dictionary[intersection].items(), key=operator.itemgetter(1)) 
-				all_dates = []
-				lenslist = [] # this is a list of lengths
-
-				# Loop through the sorted collision dates and count how many collisions were in a 1-year time-period after each collision
-				for collision in sorted_intersection:
-					initial_date = collision[1]
-					all_dates.append(initial_date)
-					one_year_later = initial_date + datetime.timedelta(days=(365))
-					
-					# count how many within the 1-year period
-					col_ct = 0
-					for collision2 in sorted_intersection:
-						if initial_date <= collision2[1] <= one_year_later:
-							col_ct += 1
-					
-					# append the count of collisions to my list of lengths
-					lenslist.append(col_ct)
-
-				# get the largest value for max_ct
-				max_ct = max(lenslist)
-				
-				# if it qualifies, find the latest period
-				print "intersection"
-				if max_ct >= 5:
-
-					greater_than_five =[]
-					for length in lenslist:
-						if length >= 5:
-							greater_than_five.append(lenslist.index(length))
-					latest_qualifying_period_index = max(greater_than_five)
-					latest_qualifying_period_startdate = all_dates[latest_qualifying_period_index]	
-
-					print "second" + str(intersection)
-					print sorted_intersection
-					print "The max count is " + str(max_ct)
-					print "The max index is " + str(lenslist.index(max_ct))
-					writer.writerow([intersection] + [all_dates[latest_qualifying_period_index]] + [intersection_dictionary2[intersection]] + sorted_intersection)
+
+		# If it qualifies, write the latest qualifying period and the collisions sorted by date
+		for i in np.flatnonzero(result.qualifies):
+			sorted_intersection = collisions.Collisions(i, result.order)
+			latest_qualifying_period_startdate = collisions.Date(result.order[result.latest_start[i]])
+
+			log.debug("Intersection %s qualifies, max count %d", intersections[i], result.max_count[i])
+			writer.writerow([intersections[i]] + [latest_qualifying_period_startdate] + [int(collisions.ksi[i])] + sorted_intersection)
 
 ##### Run the Script #####
 if __name__ == '__main__':
 
- 	# Main Function
-	SignalWarrantSearch(UnSigInt)
+	parser = argparse.ArgumentParser(description="Search unsignalized intersections for the collision signal warrant.")
+	parser.add_argument("--workspace", default=env.workspace, help="geodatabase, GeoPackage, SQLite file or folder holding the input tables")
+	parser.add_argument("--output", default=outpath, help="CSV file for the qualifying intersections")
+	parser.add_argument("--window-days", default=str(WindowDays), help="length of the collision window in days (with --sweep, a comma-separated list)")
+	parser.add_argument("--threshold", default=str(Threshold), help="collisions needed within one window (with --sweep, a comma-separated list)")
+	parser.add_argument("--distance", default=str(MaxDistance), help="largest DISTANCE of a collision from the intersection (with --sweep, a comma-separated list)")
+	parser.add_argument("--excluded-movements", action="append", default=None, help="comma-separated MOVE_PRE_ACC codes of the parties left out of the direction check (default %s); with --sweep, repeat for each list" % ",".join(ExcludedMovements))
+	parser.add_argument("--sweep", action="store_true", help="evaluate every combination of the --distance, --window-days, --threshold & --excluded-movements values in one pass, and write the matrix of qualifying intersections to --output")
+	parser.add_argument("--workers", type=int, default=1, help="number of processes searching the intersections")
+	parser.add_argument("--shards", type=int, default=None, help="number of intersection shards (default 4 per worker)")
+	parser.add_argument("--state", default=None, help="state file for incremental runs; only intersections touched by changed collisions are recomputed")
+	parser.add_argument("--years", default=None, help="first-last collision years to read, e.g. 2012-2016 (collision store workspaces only, see Common/CollisionStore.py)")
+	Instrument.AddArguments(parser)
+	args = parser.parse_args()
+	env.workspace = args.workspace
+	env.years = da.ParseYears(args.years)
+	if env.years and not da.IsCollisionStore(env.workspace):
+		parser.error("--years needs a collision store workspace (see Common/CollisionStore.py)")
+	outpath = args.output
+	Instrument.Configure(args)
+
+	# Criteria: one value each, or the grid of a sweep
+	try:
+		window_days_list = [int(value) for value in args.window_days.split(",")]
+		thresholds = [int(value) for value in args.threshold.split(",")]
+		distances = [int(value) for value in args.distance.split(",")]
+	except ValueError:
+		parser.error("--window-days, --threshold & --distance take whole numbers")
+	movement_lists = [[code.strip() for code in value.split(",") if code.strip()] for value in args.excluded_movements or [",".join(ExcludedMovements)]]
+	if args.sweep:
+		if args.state:
+			parser.error("--sweep cannot be combined with --state")
+		SweepSearch(UnSigInt, distances, window_days_list, thresholds, movement_lists, outpath)
+	else:
+		if max(len(window_days_list), len(thresholds), len(distances), len(movement_lists)) > 1:
+			parser.error("several --window-days, --threshold, --distance or --excluded-movements values need --sweep")
+		if args.state and (distances[0] != MaxDistance or movement_lists[0] != ExcludedMovements):
+			parser.error("--state keeps the results of the default --distance & --excluded-movements only")
+
+	 	# Main Function
+		SignalWarrantSearch(UnSigInt, window_days_list[0], thresholds[0], args.workers, args.shards, args.state, distances[0], movement_lists[0])
+	Instrument.Finish(args, "SigWarrantSearch")
@@ -0,0 +1,327 @@
+#### Prioritizing Intersections by Collision History #####
+
+#### Ranks intersections by the weighted severity of their collisions over a date window, like the R
+#### sessions of IntRankbyKSI_nb.Rmd and ProtectedLeft/20180112Prioritization (5-year KSI counts).
+#### Any number of scenarios can be ranked in one run: a scenario is a date window and a weight for
+#### each collision severity (e.g. KSI only, or 3 for KSI and 1 for other injuries).
+####
+#### The collision table is read once into arrays (intersection row, date, severity). Each window is
+#### then one bincount of the collisions by intersection & severity, each weighting of that window a
+#### product of the count matrix with its weights, and the top K intersections of each scenario are
+#### taken with a heap, so the whole citywide set is ranked for dozens of scenarios in a few seconds.
+#### The phasing attributes of the LT Crash Analysis table are joined to the ranked intersections.
+####
+####     python KsiRanking.py --workspace /data/WarrantSearch.gpkg --window 2012-2016 --weights KSI --top 50
+####     python KsiRanking.py --workspace /data/switrs_store --window 2010-2014,2011-2015,2012-2016 --weights KSI,INJ --weights KSI3=1:3,2:3,3:1,4:1
+
+import argparse
+import csv
+import datetime
+import heapq
+import os
+import sys
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+import DataAccess as da
+from DataAccess import env
+import Instrument
+from Instrument import Stage, Count
+
+# Inputs (the workspace can be a file geodatabase, or a GeoPackage / SQLite / folder of CSV or Parquet tables, see DataAccess.py)
+env.workspace = "Z:/VisionZero/GIS/Projects/CitywideWarrantSearch_May2016/WarrantSearch.gdb"
+Collisions = "SWITRS2009_to_2013"
+PhasingTable = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "ProtectedLeft", "20180112Prioritization", "Vision Zero Signals - LT Crash Analysis.csv")
+
+# Collision fields read once for all scenarios
+collision_fields = ["IntID","COLLISION_DATE","COLLISION_SEVERITY","DISTANCE","ALCOHOL_INVOLVED"]
+
+# SWITRS COLLISION_SEVERITY: 1 fatal, 2 severe injury, 3 other visible injury, 4 complaint of pain, 0 property damage only
+Severities = [0, 1, 2, 3, 4]
+KsiSeverities = [1, 2]
+InjurySeverities = [1, 2, 3, 4]
+
+# Named weightings for --weights
+Weightings = OrderedDict([
+	("KSI", {1: 1, 2: 1}),
+	("INJ", {1: 1, 2: 1, 3: 1, 4: 1}),
+	("ALL", {0: 1, 1: 1, 2: 1, 3: 1, 4: 1}),
+])
+
+# Years in the default window, ending with the latest year of collisions
+DefaultYears = 5
+
+# Intersections kept per scenario
+TopK = 100
+
+# Phasing attributes joined from the LT Crash Analysis table, keyed by its Int column
+PhasingKey = "Int"
+PhasingFields = ["Primary Street", "X-Street", "Phasing Type", "Phasing Direction(s)"]
+
+# Output
+outpath = "Z:/VisionZero/GIS/Projects/CitywideWarrantSearch_May2016/intersection_ranking.csv"
+out_fields = ["Scenario", "Rank", "IntID", "Score", "KSI", "Injury", "Collisions"] + PhasingFields
+
+log = Instrument.Logger("KsiRanking")
+
+# A date window [start, end) and the weight of each severity
+Scenario = namedtuple("Scenario", ["name", "start", "end", "weights"])
+
+# The collisions read for ranking; row indexes int_ids, day is a datetime64[D] array
+CollisionArrays = namedtuple("CollisionArrays", ["int_ids", "row", "day", "severity"])
+
+
+##### Scenarios #####
+def ParseWindow(text):
+
+	# "2012-2016" or "2013" -> whole years, "2012-01-01:2016-12-31" -> those dates (both inclusive).
+	# Returns (label, start, end) with end exclusive
+	if ":" in text:
+		first, last = text.split(":", 1)
+		start = datetime.datetime.strptime(first.strip(), "%Y-%m-%d").date()
+		end = datetime.datetime.strptime(last.strip(), "%Y-%m-%d").date() + datetime.timedelta(days=1)
+		return "%s_%s" % (start.strftime("%Y%m%d"), (end - datetime.timedelta(days=1)).strftime("%Y%m%d")), start, end
+	first, last = da.ParseYears(text)
+	return ("%d" % first if first == last else "%d_%d" % (first, last)), datetime.date(first, 1, 1), datetime.date(last + 1, 1, 1)
+
+
+def ParseWeights(text):
+
+	# "KSI" -> the named weighting, "1:3,2:3,3:1,4:1" -> weight per severity, "NAME=1:3,2:3" -> named.
+	# Returns (label, {severity: weight})
+	name, _, spec = text.partition("=") if "=" in text else ("", "", text)
+	if spec.upper() in Weightings:
+		return (name or spec.upper()), dict(Weightings[spec.upper()])
+	weights = {}
+	for item in spec.split(","):
+		severity, _, weight = item.partition(":")
+		if int(severity) not in Severities or not weight:
+			raise ValueError("Bad weight %r; use SEVERITY:WEIGHT with a severity of %s, or one of %s" % (item, Severities, ", ".join(Weightings)))
+		weights[int(severity)] = float(weight)
+	return (name or "W" + "_".join("%dx%g" % (s, weights[s]) for s in sorted(weights))), weights
+
+
+def ScenarioGrid(windows, weightings):
+
+	# One scenario per (window, weighting), named like 2012_2016_KSI
+	return [Scenario("%s_%s" % (window_label, weights_label), start, end, weights)
+		for window_label, start, end in windows for weights_label, weights in weightings]
+
+
+def DefaultWindow(collisions, years=DefaultYears, read_years=None):
+
+	# The latest years of collision history, e.g. 2012-2016 for collisions up to 2016. With the years
+	# read from a collision store (env.years), it starts no earlier than the first of them, so that
+	# --years 2012-2013 ranks (and labels) 2012_2013
+	if not len(collisions.day):
+		raise ValueError("No collisions to rank")
+	last = collisions.day.max().astype(object).year
+	first = last - years + 1
+	if read_years is not None:
+		first = max(first, read_years[0])
+	return ParseWindow("%d-%d" % (first, last))
+
+
+##### Read #####
+def LoadCollisions(collision_table, int_ids=None, max_distance=None, exclude_alcohol=False, start=None, end=None):
+
+	# Reads the collisions once. With int_ids, only those intersections are ranked (in that order);
+	# otherwise every intersection with a collision. start & end (dates) limit the read, for
+	# collision stores this skips the years outside all the windows
+	clauses = []
+	if start is not None:
+		clauses.append("COLLISION_DATE >= date '%s'" % start.isoformat())
+	if end is not None:
+		clauses.append("COLLISION_DATE < date '%s'" % end.isoformat())
+	where_clause = " AND ".join(clauses) or None
+
+	fixed = int_ids is not None
+	int_ids = list(int_ids) if fixed else []
+	int_index = dict((int_id, row) for row, int_id in enumerate(int_ids))
+	rows, dates, severities = [], [], []
+	skipped = 0
+	for int_id, date, severity, distance, alcohol in da.SearchCursor(collision_table, collision_fields, where_clause=where_clause):
+		if int_id is None or date is None or (max_distance is not None and (distance or 0) > max_distance) or (exclude_alcohol and alcohol == "Y"):
+			skipped += 1
+			continue
+		row = int_index.get(int_id)
+		if row is None:
+			# Collisions at intersections outside the given set are skipped
+			if fixed:
+				skipped += 1
+				continue
+			row = int_index[int_id] = len(int_ids)
+			int_ids.append(int_id)
+		rows.append(row)
+		dates.append(date)
+		severities.append(severity if severity is not None else -1)
+
+	Count("collisions_read", len(rows) + skipped)
+	Count("collisions_skipped", skipped)
+	return CollisionArrays(int_ids, np.asarray(rows, dtype=np.int64), np.asarray(dates, dtype="datetime64[D]"), np.asarray(severities, dtype=np.int64))
+
+
+def ReadPhasing(path=PhasingTable):
+
+	# {Int: {field: value}} from the LT Crash Analysis table; IDs written as numbers are keyed as numbers,
+	# so they match the IntIDs of the collision table
+	with da.OpenCsv(path) as fin:
+		return OrderedDict((_Key(row[PhasingKey]), dict((field, row.get(field, "")) for field in PhasingFields))
+			for row in csv.DictReader(fin) if row.get(PhasingKey))
+
+
+def _SplitWeights(values):
+
+	# Each --weights value is a comma list of named weightings, or one weighting of SEVERITY:WEIGHT pairs
+	return [text for value in values for text in ([value] if ":" in value else value.split(","))]
+
+
+def _Key(int_id):
+	try:
+		return int(int_id)
+	except (TypeError, ValueError):
+		return int_id
+
+
+##### Rank #####
+def SeverityCounts(collisions, start, end):
+
+	# (intersections x severities) collision counts in [start, end); unknown severities are not counted
+	keep = np.ones(len(collisions.day), dtype=bool)
+	if start is not None:
+		keep &= collisions.day >= np.datetime64(start, "D")
+	if end is not None:
+		keep &= collisions.day < np.datetime64(end, "D")
+	keep &= (collisions.severity >= 0) & (collisions.severity < len(Severities))
+	width = len(Severities)
+	cells = collisions.row[keep] * width + collisions.severity[keep]
+	counts = np.bincount(cells, minlength=len(collisions.int_ids) * width)
+	return counts.reshape(len(collisions.int_ids), width)
+
+
+def TopIntersections(scores, ksi, total, top_k):
+
+	# The top_k rows by score, then KSI, then all collisions. Intersections without a weighted
+	# collision are not ranked; ties keep the order of the intersections
+	candidates = np.flatnonzero(scores > 0)
+	if not top_k:
+		return candidates[np.lexsort((-total[candidates], -ksi[candidates], -scores[candidates]))].tolist()
+
+	# Only the intersections scoring at least the top_k-th score can make the list
+	if len(candidates) > top_k:
+		cutoff = np.partition(scores[candidates], len(candidates) - top_k)[len(candidates) - top_k]
+		candidates = candidates[scores[candidates] >= cutoff]
+	keys = dict(zip(candidates.tolist(), zip(scores[candidates].tolist(), ksi[candidates].tolist(), total[candidates].tolist())))
+	return heapq.nlargest(top_k, candidates.tolist(), key=keys.get)
+
+
+def RankScenarios(collisions, scenarios, top_k=TopK):
+
+	# Scenarios of the same window share its count matrix. Returns {scenario name: [ranked rows]},
+	# each row being (IntID, score, KSI, injury, collisions)
+	rankings = OrderedDict()
+	window = None
+	for scenario in scenarios:
+
+		# Count the collisions of the window when it changes (ScenarioGrid keeps each window's scenarios together)
+		if (scenario.start, scenario.end) != window:
+			window = (scenario.start, scenario.end)
+			with Stage("count"):
+				counts = SeverityCounts(collisions, scenario.start, scenario.end)
+				ksi, injury, total = counts[:, KsiSeverities].sum(axis=1), counts[:, InjurySeverities].sum(axis=1), counts.sum(axis=1)
+
+		with Stage("rank"):
+			weights = np.array([scenario.weights.get(severity, 0) for severity in Severities], dtype=np.float64)
+			scores = counts.dot(weights)
+			top = TopIntersections(scores, ksi, total, top_k)
+		rankings[scenario.name] = [(collisions.int_ids[row], float(scores[row]), int(ksi[row]), int(injury[row]), int(total[row])) for row in top]
+		Count("scenarios")
+		log.debug("%s: %d intersections ranked, top score %s", scenario.name, len(top), rankings[scenario.name][0][1] if top else 0)
+	return rankings
+
+
+##### Write #####
+def WriteRankings(rankings, out_path, phasing=None):
+
+	phasing = phasing or {}
+	blank = dict((field, "") for field in PhasingFields)
+	with da.OpenCsv(out_path, "w") as fout:
+		writer = csv.writer(fout)
+		writer.writerow(out_fields)
+		for name, ranked in rankings.items():
+			for rank, (int_id, score, ksi, injury, total) in enumerate(ranked, 1):
+				attributes = phasing.get(_Key(int_id), blank)
+				writer.writerow([name, rank, int_id, "%g" % score, ksi, injury, total] + [attributes[field] for field in PhasingFields])
+
+
+##### Main Function #####
+def RankIntersections(collision_table, windows, weightings, out_path, top_k=TopK, intersection_fcs=None, phasing_path=PhasingTable,
+	candidates_only=False, max_distance=None, exclude_alcohol=False):
+
+	with Stage("load"):
+		phasing = ReadPhasing(phasing_path) if phasing_path else {}
+		int_ids = None
+		if candidates_only:
+			int_ids = list(phasing)
+		elif intersection_fcs:
+			int_ids = []
+			for intersection_fc in intersection_fcs:
+				int_ids.extend(row[0] for row in da.SearchCursor(intersection_fc, ["ASSETID"]))
+			int_ids = list(OrderedDict.fromkeys(int_ids))
+
+		# Only the dates of the windows are read, unless the default window needs the latest year
+		start = min(window[1] for window in windows) if windows else None
+		end = max(window[2] for window in windows) if windows else None
+		collisions = LoadCollisions(collision_table, int_ids, max_distance, exclude_alcohol, start, end)
+	log.info("Read %d collisions at %d intersections", len(collisions.row), len(collisions.int_ids))
+	Count("intersections", len(collisions.int_ids))
+
+	scenarios = ScenarioGrid(windows or [DefaultWindow(collisions, read_years=env.years)], weightings)
+	rankings = RankScenarios(collisions, scenarios, top_k)
+	log.info("Ranked %d scenarios", len(scenarios))
+
+	with Stage("write"):
+		WriteRankings(rankings, out_path, phasing)
+	return rankings
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Rank intersections by weighted collision severity, for many date windows and weightings in one pass.")
+	parser.add_argument("--workspace", default=env.workspace, help="geodatabase, GeoPackage, SQLite file or folder of CSV/Parquet tables")
+	parser.add_argument("--years", default=None, help="first-last collision years to read, e.g. 2012-2016 (collision store workspaces only, see Common/CollisionStore.py)")
+	parser.add_argument("--collisions", default=Collisions, help="collision table, with IntID assigned")
+	parser.add_argument("--output", default=outpath, help="output CSV (one row per scenario & rank)")
+	parser.add_argument("--window", default=None, help="comma list of windows, as years (2012-2016) or dates (2012-01-01:2016-12-31); default: the latest %d years (within --years)" % DefaultYears)
+	parser.add_argument("--weights", action="append", default=None,
+		help="comma list of weightings (%s), or one weighting as SEVERITY:WEIGHT pairs with an optional NAME=, e.g. KSI3=1:3,2:3,3:1,4:1; can be repeated (default: KSI)" % ", ".join(Weightings))
+	parser.add_argument("--top", type=int, default=TopK, help="intersections kept per scenario (0 for all)")
+	parser.add_argument("--intersections", default=None, help="comma list of intersection feature classes to rank (ASSETID); default: every intersection with a collision")
+	parser.add_argument("--phasing", default=PhasingTable, help="CSV of phasing attributes by Int (the LT Crash Analysis table), or '' for none")
+	parser.add_argument("--candidates-only", action="store_true", help="only rank the intersections of the --phasing table")
+	parser.add_argument("--max-distance", type=float, default=None, help="skip collisions further than this from the intersection (feet)")
+	parser.add_argument("--exclude-alcohol", action="store_true", help="skip collisions involving alcohol")
+	Instrument.AddArguments(parser)
+	args = parser.parse_args()
+	Instrument.Configure(args)
+
+	env.workspace = args.workspace
+	env.years = da.ParseYears(args.years)
+	if env.years and not da.IsCollisionStore(env.workspace):
+		parser.error("--years needs a collision store workspace (see Common/CollisionStore.py)")
+	if args.candidates_only and not args.phasing:
+		parser.error("--candidates-only needs a --phasing table")
+
+	try:
+		windows = [ParseWindow(text) for text in args.window.split(",")] if args.window else []
+		weightings = [ParseWeights(text) for text in _SplitWeights(args.weights or ["KSI"])]
+	except ValueError as e:
+		parser.error(str(e))
+
+	with Stage("total"):
+		RankIntersections(args.collisions, windows, weightings, args.output, args.top,
+			args.intersections.split(",") if args.intersections else None, args.phasing, args.candidates_only,
+			args.max_distance, args.exclude_alcohol)
+	Instrument.Finish(args, "KsiRanking")
@@ -0,0 +1,73 @@
+#### Benchmark for the Left-Turn Counter #####
+
+#### Times the single-pass counter against the original nested loop on random data shaped like
+#### the 2013 inputs (SigIntwithin3miBuffer & Parties2013DriversUorLTurn), at 1x, 10x and 100x.
+#### The nested loop is only run while it finishes in a reasonable time; past that it is skipped.
+
+import random
+import sys
+import time
+
+from LTurnCounter import IntersectionIndex, CountLTurns, CountLTurnsNested
+
+# Approximate size of the current tables
+CurrentIntersections = 4500
+CurrentCollisions = 3000
+
+# Skip the nested loop above this many intersection x collision comparisons
+NestedLimit = 5 * 10 ** 7
+
+# Share of each direction of travel in the party table ('-' is not stated)
+DirectionWeights = [("N", 0.24), ("S", 0.24), ("E", 0.24), ("W", 0.24), ("-", 0.04)]
+
+
+##### Random Inputs #####
+def RandomTables(scale, seed=2016):
+
+	rand = random.Random(seed)
+	n_int = CurrentIntersections * scale
+	n_col = CurrentCollisions * scale
+	int_ids = rand.sample(range(1, n_int * 10), n_int)
+
+	directions = []
+	for direction, weight in DirectionWeights:
+		directions += [direction] * int(weight * 100)
+
+	# Most collisions are at a signalized intersection, some are not
+	collision_rows = []
+	for i in range(n_col):
+		if rand.random() < 0.9:
+			int_id = rand.choice(int_ids)
+		else:
+			int_id = -rand.randint(1, n_int)
+		collision_rows.append((rand.choice(directions), int_id))
+
+	return int_ids, collision_rows
+
+
+##### Run the Benchmark #####
+def RunBenchmark(scales=(1, 10, 100)):
+
+	print("%6s %12s %12s %14s %14s" % ("scale", "ints", "collisions", "single (s)", "nested (s)"))
+	for scale in scales:
+		int_ids, collision_rows = RandomTables(scale)
+
+		t0 = time.time()
+		counts = CountLTurns(IntersectionIndex(int_ids), collision_rows)
+		single_time = time.time() - t0
+
+		nested_time = "skipped"
+		if len(int_ids) * len(collision_rows) <= NestedLimit:
+			t0 = time.time()
+			nested_counts = CountLTurnsNested(int_ids, collision_rows)
+			nested_time = "%.3f" % (time.time() - t0)
+			if not (nested_counts == counts).all():
+				raise AssertionError("Counts differ from the nested loop at scale %d" % scale)
+
+		print("%6s %12d %12d %14.3f %14s" % ("%dx" % scale, len(int_ids), len(collision_rows), single_time, nested_time))
+
+
+if __name__ == '__main__':
+
+	scales = [int(arg) for arg in sys.argv[1:]] or [1, 10, 100]
+	RunBenchmark(scales)
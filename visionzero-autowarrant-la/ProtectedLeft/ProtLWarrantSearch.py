@@ -8,74 +8,141 @@
 #### In this script, we had already joined the party table to the collision table, and subset out
 #### collisions that did not involve a left or U-Turn.
 
-import arcpy
-from arcpy import env
+#### The collision table is only read once: the counts for every intersection are tallied in a
+#### single pass (see LTurnCounter.py) and then written back with one pass of the Update Cursor.
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+import DataAccess as da
+from DataAccess import env
+from LTurnCounter import IntersectionIndex, CountLTurns, CountFields, DirectionCols, NotStatedCol
+from WarrantState import WarrantState, Fingerprint
+import Instrument
+from Instrument import Stage, Count
 
 ##### Setup Workspace #####
 
+# The workspace can be a file geodatabase, or a GeoPackage / SQLite / folder of CSV or Parquet tables (see DataAccess.py)
 env.workspace = "Z:/VisionZero/GIS/Data/OtherDOT_AnalysisProjects/MetroExpressLanes Mar2016/MetroExpressLanesMar2016.gdb"
 SigInt = "SigIntwithin3miBuffer" # Feature class containing all signalized intersections in the City
 Collisions = "Parties2013DriversUorLTurn" # Parties table that has been joined to the collisions table, which includes the unique intersection ID
 
-##### Loop through the Intersections & Count Collisions per Intersection #####
-
-Collision_Table = []
-int_fields = ["ASSETID","LTurn_N","LTurn_S","LTurn_E","LTurn_W","LTurn_None"]
-collision_fields = ["Parties_DIR_OF_TRAVEL","SWITRS2009_to_2013_IntID"]
-int_rows = arcpy.da.UpdateCursor(SigInt, int_fields)
-
-ct = 0
-
-# Loop through all signalized intersections
-for row in int_rows:
-	
-	# Add unique intersection ID to the Collision Table
-	row_list = []
-	row_list.append(row[0])
-
-	# Set the counters for each direction of travel
-	N_ct = 0
-	S_ct = 0
-	E_ct = 0
-	W_ct = 0
-	NotStated = 0
-
-	# Loop through all the collisions; add to the count for each direction
-	collision_rows = arcpy.da.SearchCursor(Collisions,collision_fields)
-	for row2 in collision_rows:
-		if row2[1] == row[0]:
-			if row2[0] == "N":
-				N_ct += 1
-			elif row2[0] == "S":
-				S_ct += 1
-			elif row2[0] == "E":
-				E_ct += 1
-			elif row2[0] == "W":
-				W_ct += 1
-			else:
-				NotStated += 1
-
-
-	# Update the Collision_Table with final counts
-	row_list.append(N_ct)
-	row[1] = N_ct
-	row_list.append(S_ct)
-	row[2] = S_ct
-	row_list.append(E_ct)
-	row[3] = E_ct
-	row_list.append(W_ct)
-	row[4] = W_ct
-	row_list.append(NotStated)
-	row[5] = NotStated
-	Collision_Table.append(row_list)
-	int_rows.updateRow(row)
-
-	# Update the counter variable
-	ct += 1
-
-print "Done"
-
-
-
-
-
+log = Instrument.Logger("ProtLWarrantSearch")
+
+##### Main Function #####
+def LeftTurnWarrantSearch(intersection_fc, collision_table):
+
+	int_fields = ["ASSETID"] + CountFields
+	collision_fields = ["Parties_DIR_OF_TRAVEL","SWITRS2009_to_2013_IntID"]
+
+	# Index all signalized intersections
+	with Stage("load"):
+		int_ids = [row[0] for row in da.SearchCursor(intersection_fc, ["ASSETID"])]
+		int_index = IntersectionIndex(int_ids)
+
+	# Loop through all the collisions once; add to the count for each intersection & direction
+	with Stage("count"):
+		counts = CountLTurns(int_index, da.SearchCursor(collision_table, collision_fields))
+	Count("intersections", len(int_ids))
+	Count("collisions_counted", int(counts.sum()))
+	log.info("Counted %d left/U-turn collisions at %d intersections", int(counts.sum()), len(int_ids))
+
+	# Write the counts back to the intersections in one pass
+	Collision_Table = []
+	with Stage("write"), da.UpdateCursor(intersection_fc, int_fields) as int_rows:
+		for row in int_rows:
+
+			# Update the Collision_Table and the row with final counts
+			int_counts = [int(ct) for ct in counts[int_index[row[0]]]]
+			row[1:] = int_counts
+			Collision_Table.append([row[0]] + int_counts)
+			int_rows.updateRow(row)
+
+	return Collision_Table
+
+##### Incremental Search #####
+
+#### Keeps the counts per intersection in a state file (see Common/WarrantState.py). The party table is
+#### compared by CASE_ID with the snapshot from the last run; the counts are adjusted only for the
+#### collisions that were added, removed or changed, and only the touched intersections are updated.
+#### If the state is new or the list of intersections changed, everything is counted again.
+
+def IncrementalLeftTurnSearch(intersection_fc, collision_table, state_path):
+
+	int_fields = ["ASSETID"] + CountFields
+	collision_fields = ["Parties_CASE_ID","Parties_DIR_OF_TRAVEL","SWITRS2009_to_2013_IntID"]
+	state = WarrantState(state_path)
+
+	# Group the party rows of each collision
+	with Stage("load"):
+		int_ids = [row[0] for row in da.SearchCursor(intersection_fc, ["ASSETID"])]
+		cases = {}
+		for case_id, direction, int_id in da.SearchCursor(collision_table, collision_fields):
+			cases.setdefault(int(case_id), []).append([direction, int_id])
+		collisions = dict((case_id, (Fingerprint(rows), rows)) for case_id, rows in cases.items())
+	Count("collisions_scanned", len(collisions))
+
+	counts = state.LTurnCounts()
+	if set(counts) != set(int_ids) or not state.HasSnapshot("lturn"):
+
+		# Count everything again
+		int_index = IntersectionIndex(int_ids)
+		all_counts = CountLTurns(int_index, (tuple(row) for rows in cases.values() for row in rows))
+		counts = dict((int_id, [int(ct) for ct in all_counts[i]]) for int_id, i in int_index.items())
+		state.ReplaceLTurnCounts(counts, replace_all=True)
+		state.ClearSnapshot("lturn")
+		touched = set(int_ids)
+		delta = state.Diff("lturn", collisions)
+	else:
+
+		# Take out the old version of each removed/changed collision, add the new version of each added/changed one
+		delta = state.Diff("lturn", collisions)
+		touched = set()
+		for sign, payloads in ((-1, delta.removed), (-1, delta.changed_old), (1, delta.added), (1, delta.changed_new)):
+			for rows in payloads.values():
+				for direction, int_id in rows:
+					if int_id in counts:
+						counts[int_id][DirectionCols.get(direction, NotStatedCol)] += sign
+						touched.add(int_id)
+		state.ReplaceLTurnCounts(dict((int_id, counts[int_id]) for int_id in touched))
+
+	log.info("%d collisions added, %d removed, %d changed; updating %d of %d intersections",
+		len(delta.added), len(delta.removed), len(delta.changed_new), len(touched), len(int_ids))
+	Count("intersections_updated", len(touched))
+
+	# Write the counts of the touched intersections only
+	if touched:
+		where_clause = None if len(touched) == len(int_ids) else "ASSETID IN (%s)" % ", ".join(str(int_id) for int_id in sorted(touched))
+		with Stage("write"), da.UpdateCursor(intersection_fc, int_fields, where_clause) as int_rows:
+			for row in int_rows:
+				row[1:] = counts[row[0]]
+				int_rows.updateRow(row)
+
+	state.ApplyDelta("lturn", collisions, delta)
+	state.Commit()
+	state.Close()
+
+##### Run the Script #####
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Count left/U-turn collisions by direction at each signalized intersection.")
+	parser.add_argument("--workspace", default=env.workspace, help="geodatabase, GeoPackage, SQLite file or folder holding the input tables")
+	parser.add_argument("--state", default=None, help="state file for incremental runs; only intersections touched by changed collisions are updated")
+	parser.add_argument("--years", default=None, help="first-last collision years to read, e.g. 2012-2016 (collision store workspaces only, see Common/CollisionStore.py)")
+	Instrument.AddArguments(parser)
+	args = parser.parse_args()
+	env.workspace = args.workspace
+	env.years = da.ParseYears(args.years)
+	if env.years and not da.IsCollisionStore(env.workspace):
+		parser.error("--years needs a collision store workspace (see Common/CollisionStore.py)")
+	Instrument.Configure(args)
+
+	if args.state:
+		IncrementalLeftTurnSearch(SigInt, Collisions, args.state)
+	else:
+		LeftTurnWarrantSearch(SigInt, Collisions)
+	log.info("Done")
+	Instrument.Finish(args, "ProtLWarrantSearch")
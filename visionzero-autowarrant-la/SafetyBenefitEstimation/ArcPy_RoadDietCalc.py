@@ -1,12 +1,21 @@
 ##### Setup Workspace #####
 
-import operator
-import arcpy
+import argparse
+import os
+import sys
 import csv
-from arcpy import env
-from collections import defaultdict
-
-# Inputs
+from collections import defaultdict, OrderedDict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+import DataAccess as da
+from DataAccess import env
+from PartyIndex import PartyIndex
+from WarrantState import WarrantState, Fingerprint, Payloads
+from CollisionClassifier import RoadDietParties, RoadDietCodes, Discarded, PcfCategories
+import Instrument
+from Instrument import Stage, Count
+
+# Inputs (the workspace can be a file geodatabase, or a GeoPackage / SQLite / folder of CSV or Parquet tables, see DataAccess.py)
 env.workspace = "Z:/VisionZero/GIS/Projects/PrioritizationCorridors/data/RoadDietStats.gdb"
 
 Segment_Table = "Z:/VisionZero/GIS/Projects/PrioritizationCorridors/data/segment_table.csv"
@@ -15,15 +24,25 @@ Intersection_Table = "Z:/VisionZero/GIS/Projects/PrioritizationCorridors/data/in
 Collisions = "SWITRS2009_to_2013"
 Parties = "Collisions2009to2013PartiesJoin"
 
+# Output
+outpath = "Z:/VisionZero/GIS/Projects/PrioritizationCorridors/data/road_diet_stats.csv"
+
+# Columns of the output table, one row per corridor
+StatFields = ["Corridor","Ped","Bike","Sideswipe","LTurn","RearEnd","OtherRD","NonRD","Total","PrimaryPCF22350","SecondaryPCF22350"]
+
+collision_fields = ["CASE_ID","COLLISION_DATE","PARTY_COUNT","DISTANCE","ALCOHOL_INVOLVED","IntID","PEDESTRIAN_ACCIDENT","BICYCLE_ACCIDENT","COLLISION_SEVERITY","SegID","PCF_VIOL_CATEGORY","TYPE_OF_COLLISION"]
+
+log = Instrument.Logger("RoadDietCalc")
+
 ##### Prep Function #####
-def csvTableToList(seg_csv, int_csv):
+def csvTableToList(seg_csv, int_csv, state_path=None, outpath=outpath, pcf_lists=None, sweep=False):
 	
 	linking_table_dict = defaultdict(list)
 	int_table_dict = defaultdict(list)
 	dir_table_dict = defaultdict(list)
 	
 	# Convert Segment CSV list to dictionary
-	with open(seg_csv, 'rb') as fin:
+	with da.OpenCsv(seg_csv) as fin:
 		reader = csv.reader(fin)
 		for row in reader:
 			corridor_id = int(row[0])
@@ -33,134 +52,264 @@ def csvTableToList(seg_csv, int_csv):
 			linking_table_dict[corridor_id].append(seg_id)
 			dir_table_dict[corridor_id].append(direction)
 
-	with open(int_csv, 'rb') as fin:
-		print "beginning to read the csv"
+	with da.OpenCsv(int_csv) as fin:
 		reader = csv.reader(fin)
 		for row in reader:
 			corridor_id = int(row[0])
 			int_id = row[1]
-			print "int_id: " + str(corridor_id) + " " + str(int_id) 
 			int_table_dict[corridor_id].append(int_id)
-	
-	# Testing
-	print linking_table_dict
-	SegmentQuery(linking_table_dict, dir_table_dict, int_table_dict)
+
+	log.info("Read %d corridors", len(linking_table_dict))
+	# Load the party table once, instead of querying it for every collision
+	with Stage("load"):
+		party_index = PartyIndex.Load(Parties)
+	log.info("Loaded party index: %s", party_index.Summary())
+	pcf_lists = pcf_lists or [PcfCategories]
+
+	# Sweep mode: a matrix of the road diet collisions per corridor for each list of PCF categories
+	if sweep:
+		SweepCorridors(linking_table_dict, dir_table_dict, int_table_dict, party_index, pcf_lists, outpath)
+		return
+
+	# Incremental mode: only the corridors touched by changed collisions (or changed corridor definitions)
+	if state_path:
+		state = WarrantState(state_path)
+		with Stage("diff"):
+			touched = TouchedCorridors(linking_table_dict, dir_table_dict, int_table_dict, party_index, state)
+		corridor_stats = SegmentQuery(dict((c, segs) for c, segs in linking_table_dict.items() if c in touched), dir_table_dict, int_table_dict, party_index)
+		state.ReplaceCorridorStats(corridor_stats, keep_corridor_ids=linking_table_dict)
+		state.Commit()
+		corridor_stats = state.LoadCorridorStats(sorted(linking_table_dict))
+		state.Close()
+	else:
+		corridor_stats = SegmentQuery(linking_table_dict, dir_table_dict, int_table_dict, party_index, pcf_lists[0])
+
+	with Stage("write"):
+		WriteCorridorStats(corridor_stats, outpath)
+
+##### Incremental Function #####
+
+#### Compares the collisions (with their parties) and the corridor definitions with the snapshot in the
+#### state file (see Common/WarrantState.py) and returns the corridors that need to be computed again:
+#### new or redefined corridors, and corridors holding the old or new location of a changed collision.
+def TouchedCorridors(linking_table_dict, dir_table_dict, int_table_dict, party_index, state):
+
+	# Corridor definitions
+	corridors = {}
+	for corridor_id in linking_table_dict:
+		definition = [linking_table_dict[corridor_id], dir_table_dict[corridor_id], int_table_dict[corridor_id]]
+		corridors[corridor_id] = (Fingerprint(definition), [])
+	corridor_delta = state.Diff("roaddiet_corridors", corridors)
+	touched = set(corridor_delta.added) | set(corridor_delta.changed_new)
+
+	# Collisions, fingerprinted with their parties; the payload is where the collision is
+	collisions = {}
+	for collision in da.SearchCursor(Collisions, collision_fields):
+		case_id = int(collision[0])
+		values = list(collision) + party_index.Parties(case_id)
+		collisions[case_id] = (Fingerprint(values), [collision[9], collision[5], collision[3]])
+	Count("party_lookups", len(collisions))
+	delta = state.Diff("roaddiet", collisions)
+
+	seg_corridors, int_corridors = CorridorIndex(linking_table_dict, int_table_dict)
+	for seg_id, int_id, distance in Payloads(delta):
+		touched |= RouteCollision(seg_corridors, int_corridors, seg_id, int_id, distance)
+
+	log.info("%d collisions added, %d removed, %d changed; recomputing %d of %d corridors",
+		len(delta.added), len(delta.removed), len(delta.changed_new), len(touched), len(linking_table_dict))
+
+	state.ApplyDelta("roaddiet_corridors", corridors, corridor_delta)
+	state.ApplyDelta("roaddiet", collisions, delta)
+	return touched
+
+##### Corridor Index #####
+
+#### Inverted indexes from SegID and IntID to the corridors that include them, so each collision can be
+#### routed to its corridors without a query per corridor.
+def CorridorIndex(linking_table_dict, int_table_dict):
+
+	seg_corridors = defaultdict(set)
+	int_corridors = defaultdict(set)
+	for corridor_id in linking_table_dict:
+		for seg_id in linking_table_dict[corridor_id]:
+			seg_corridors[_LocationKey(seg_id)].add(corridor_id)
+		for int_id in int_table_dict[corridor_id]:
+			int_corridors[_LocationKey(int_id)].add(corridor_id)
+	return seg_corridors, int_corridors
+
+def RouteCollision(seg_corridors, int_corridors, seg_id, int_id, distance):
+
+	# Same matching as the old corridor query: SegID IN (segments) OR (IntID IN (intersections) AND DISTANCE = 0)
+	corridors = seg_corridors.get(_LocationKey(seg_id), set())
+	if distance == 0:
+		corridors = corridors | int_corridors.get(_LocationKey(int_id), set())
+	return corridors
+
+def _LocationKey(value):
+
+	# SegIDs & IntIDs are text in the CSVs and numbers in the collision table
+	if value is None:
+		return None
+	try:
+		return str(int(float(value)))
+	except (TypeError, ValueError):
+		return str(value)
 
 ##### Main Function #####
-def SegmentQuery(linking_table_dict, dir_table_dict, int_table_dict):
 
-	segment_dict = defaultdict(list)
+#### Streams the collision table once and routes each collision to every corridor it belongs to,
+#### counting it with that corridor's directions. Returns {corridor_id: [counts in StatFields order]}.
+def SegmentQuery(linking_table_dict, dir_table_dict, int_table_dict, party_index, pcf_categories=PcfCategories):
 
-	# Loop through each segment
+	routed, directions = RouteCollisions(linking_table_dict, dir_table_dict, int_table_dict)
+	with Stage("classify"):
+		parties = ClassifyParties(routed, directions, party_index)
+		col_cats = CollisionCodes(routed, parties, pcf_categories)
+	with Stage("tally"):
+		return TallyCorridors(routed, directions, col_cats, linking_table_dict)
+
+def RouteCollisions(linking_table_dict, dir_table_dict, int_table_dict):
+
+	seg_corridors, int_corridors = CorridorIndex(linking_table_dict, int_table_dict)
+
+	# Direction(s) of each corridor, e.g. "E,W" -> ['E', 'W']
+	directions = {}
 	for segment in linking_table_dict:
-		
-		# Cut #1 Counters
-		NonRD_col_ct = 0
-		primary_pcf22350_ct = 0
-		secondary_pcf22350_ct = 0
-
-		# Road Diet (Cut #2) Counters
-		ped_ct = 0
-		bike_ct = 0
-		sideswipe = 0
-		rear_end = 0
-		L_Turn = 0
-		other_rd_collisions = 0
-
-		# Testing
-		print linking_table_dict[segment]
-		print 'PRINTING INT LINKING TABLE'
-		print int_table_dict[segment]
-
-
-		# Testing: Prints all the field names
-		flds=[]
-		fldObj=arcpy.ListFields(Collisions)
-		for fld in fldObj:
-			print fld.name
-
-		# Direction
 		direction = set(dir_table_dict[segment])
-		direction_f =  (''.join(list(direction))).split(',')
-		print direction_f
-
-		# Query Collisions Attached to Intersection, Query Parties for each Collision
-		pcf_vio_cat = ['03','06','07','09','10','11']
-		str_pcf_vio_cat = str(('03','06','07','09','10','11'))
-		str_linking_dict = ", ".join(linking_table_dict[segment])
-		str_int_dict = ", ".join(int_table_dict[segment])
-		collision_fields = ["CASE_ID","COLLISION_DATE","PARTY_COUNT","DISTANCE","ALCOHOL_INVOLVED","IntID","PEDESTRIAN_ACCIDENT","BICYCLE_ACCIDENT","COLLISION_SEVERITY","SegID","PCF_VIOL_CATEGORY","TYPE_OF_COLLISION"]
-		#collision_query =  """ SegID IN (%s) AND ALCOHOL_INVOLVED IS NULL AND PCF_VIOL_CATEGORY IN %s """ % (str_linking_dict, str_pcf_vio_cat)
-		collision_query =  """ SegID IN (%s) OR (IntID IN (%s) AND DISTANCE = 0) """ % (str_linking_dict, str_int_dict)
-
-		# Loop through the result
-		collision_rows =  arcpy.da.SearchCursor(Collisions, collision_fields, where_clause=collision_query)
-		for collision in collision_rows:
-			col_id = int(collision[0])
-			print "----------"
-			print col_id
-
-			alcohol = collision[4]
-			pcf = collision[10]
-			
-			# col_cat is the return from running the PartyFilter function
-			col_cat = []
-			col_cat = PartyFilter(col_id, direction_f, alcohol, pcf)
-			
-			if col_cat is not None:
-				# If the collision would be directly targeted by a road diet
-				if col_cat[0] >= 1:	
-					print segment, col_id
-					
-					# Append to final table of segment ID and qualifying collisions
-					linking_table_dict[segment].append(col_id)
-
-					# Checks for bike/ped related
-					if collision[6] == 'Y': # Ped collisions
-						ped_ct += 1
-					elif collision[7] == 'Y': # Bike collisions
-						bike_ct += 1
-					elif collision[11] == 'B': # Sideswipe Type
-						sideswipe += 1
-					elif col_cat[0] == 4:
-						L_Turn += 1
-					elif collision[11] == 'C': # Rear-end Type
-						rear_end += 1
-					else:
-						other_rd_collisions += 1 # All other collisions
-
-				# Collision is on the corridor, but would not directly be affected by a road diet
-				elif col_cat[0] == 0:
-					NonRD_col_ct += 1
-
-				# Check PCF 22350
-				if pcf == "03":
-					primary_pcf22350_ct += 1
-				elif col_cat[1] == True:
-					secondary_pcf22350_ct += 1
-
-		# Calculate total # of collisions on Corridor
-		total_col = ped_ct + bike_ct + sideswipe + rear_end + L_Turn + other_rd_collisions + NonRD_col_ct
-
-		print "Stats for Segment: " + str(segment)
-		print "ped ct " + str(ped_ct)
-		print "bike ct " + str(bike_ct)
-		print "sideswipe " + str(sideswipe)
-		print "L Turns " + str(L_Turn)
-		print "rear end " + str(rear_end)
-		print "other_rd_target " + str(other_rd_collisions)
-		print "total collision ct: " + str(total_col)
-		print "Primary PCF22350 Ct: " + str(primary_pcf22350_ct)
-		print "Secondary PCF22350 Ct: " + str(secondary_pcf22350_ct)
-		
+		directions[segment] = tuple((''.join(list(direction))).split(','))
+
+	# Loop through the collisions once, keeping those on a corridor
+	routed = []
+	scanned = 0
+	with Stage("filter"):
+		for collision in da.SearchCursor(Collisions, collision_fields):
+			scanned += 1
+			corridors = RouteCollision(seg_corridors, int_corridors, collision[9], collision[5], collision[3])
+			if corridors:
+				routed.append((collision, corridors))
+	Count("collisions_scanned", scanned)
+	Count("collisions_on_corridors", len(routed))
+	log.info("%d of %d collisions are on a corridor", len(routed), scanned)
+	return routed, directions
+
+def ClassifyParties(routed, directions, party_index):
+
+	# The party side of the criteria (PartyFilter) for all routed collisions at once, for each set of
+	# corridor directions
+	case_ids = [collision[0] for collision, corridors in routed]
+	parties = {}
+	for direction in set(directions.values()):
+		parties[direction] = RoadDietParties(party_index, direction, case_ids)
+		Count("collisions_classified", len(case_ids))
+	return parties
+
+def CollisionCodes(routed, parties, pcf_categories=PcfCategories):
+
+	# Collision code & OAF 22350 flag of each routed collision, as returned by PartyFilter, per direction set
+	alcohol_values = [collision[4] for collision, corridors in routed]
+	pcf_values = [collision[10] for collision, corridors in routed]
+	col_cats = {}
+	for direction, direction_parties in parties.items():
+		col_codes = RoadDietCodes(direction_parties, alcohol_values, pcf_values, pcf_categories)
+		col_cats[direction] = (col_codes.tolist(), direction_parties[3].tolist())
+	return col_cats
+
+def TallyCorridors(routed, directions, col_cats, linking_table_dict):
+
+	# Cut #1 Counters: NonRD, Primary & Secondary PCF 22350
+	# Road Diet (Cut #2) Counters: Ped, Bike, Sideswipe, L Turn, Rear End, Other
+	corridor_stats = OrderedDict((segment, [0] * (len(StatFields) - 1)) for segment in sorted(linking_table_dict))
+	PED, BIKE, SIDESWIPE, LTURN, REAR_END, OTHER_RD, NON_RD, TOTAL, PRIMARY_PCF, SECONDARY_PCF = range(len(StatFields) - 1)
+
+	for i, (collision, corridors) in enumerate(routed):
+		pcf = collision[10]
+
+		for segment in corridors:
+			stats = corridor_stats[segment]
+
+			# col_cat is the collision code & OAF 22350 flag, as returned by the PartyFilter function
+			col_codes, oaf_22350 = col_cats[directions[segment]]
+			col_cat = [col_codes[i], oaf_22350[i]]
+			if col_cat[0] == Discarded:
+				continue
+
+			# If the collision would be directly targeted by a road diet
+			if col_cat[0] >= 1:
+				# Checks for bike/ped related
+				if collision[6] == 'Y': # Ped collisions
+					stats[PED] += 1
+				elif collision[7] == 'Y': # Bike collisions
+					stats[BIKE] += 1
+				elif collision[11] == 'B': # Sideswipe Type
+					stats[SIDESWIPE] += 1
+				elif col_cat[0] == 4:
+					stats[LTURN] += 1
+				elif collision[11] == 'C': # Rear-end Type
+					stats[REAR_END] += 1
+				else:
+					stats[OTHER_RD] += 1 # All other collisions
+
+			# Collision is on the corridor, but would not directly be affected by a road diet
+			elif col_cat[0] == 0:
+				stats[NON_RD] += 1
+
+			# Check PCF 22350
+			if pcf == "03":
+				stats[PRIMARY_PCF] += 1
+			elif col_cat[1] == True:
+				stats[SECONDARY_PCF] += 1
+
+	# Calculate total # of collisions on Corridor
+	for stats in corridor_stats.values():
+		stats[TOTAL] = sum(stats[PED:TOTAL])
+
+	return corridor_stats
+
+##### Parameter Sweep #####
+
+#### Counts the corridors for several lists of PCF categories in one job: the collisions are read and
+#### routed once and the party criteria run once per set of directions; only the collision codes and
+#### the tally are redone for each list. Writes a matrix with a row per corridor and a column per list,
+#### holding the collisions a road diet would target (Ped + Bike + Sideswipe + LTurn + RearEnd + OtherRD).
+def SweepCorridors(linking_table_dict, dir_table_dict, int_table_dict, party_index, pcf_lists, outpath):
+
+	routed, directions = RouteCollisions(linking_table_dict, dir_table_dict, int_table_dict)
+	with Stage("classify"):
+		parties = ClassifyParties(routed, directions, party_index)
+
+	labels, columns = [], []
+	for pcf_categories in pcf_lists:
+		with Stage("tally"):
+			corridor_stats = TallyCorridors(routed, directions, CollisionCodes(routed, parties, pcf_categories), linking_table_dict)
+		labels.append("PCF" + "_".join(pcf_categories))
+		columns.append([stats[StatFields.index("Total") - 1] - stats[StatFields.index("NonRD") - 1] for stats in corridor_stats.values()])
+		log.info("%s: %d road diet collisions on %d corridors", labels[-1], sum(columns[-1]), len(corridor_stats))
+	Count("configurations", len(labels))
+
+	with Stage("write"), da.OpenCsv(outpath, 'w') as fout:
+		writer = csv.writer(fout, lineterminator='\n')
+		writer.writerow(["Corridor"] + labels)
+		for i, corridor_id in enumerate(sorted(linking_table_dict)):
+			writer.writerow([corridor_id] + [column[i] for column in columns])
+
+##### Output Function #####
+def WriteCorridorStats(corridor_stats, outpath):
+
+	with da.OpenCsv(outpath, 'w') as fout:
+		writer = csv.writer(fout, lineterminator='\n')
+		writer.writerow(StatFields)
+		for corridor_id, stats in corridor_stats.items():
+			writer.writerow([corridor_id] + list(stats))
 
 ##### Check Party Criteria Function #####
-def PartyFilter(case_id, direction, alcohol, pcf):
 
-	# Query the Party Table
-	party_fields = ["Parties_CASE_ID","Parties_DIR_OF_TRAVEL","Parties_PARTY_TYPE","Parties_MOVE_PRE_ACC","Parties_OAF_VIOL_SECTION"]
-	party_query =  """ Parties_CASE_ID = '%s' """ % (str(case_id))
-	party_rows = arcpy.da.SearchCursor(Parties, party_fields, where_clause=party_query)
+#### Row-by-row version of the party criteria; SegmentQuery uses CollisionClassifier.RoadDietParties and
+#### RoadDietCodes (the two halves of RoadDietRule), which apply the same rules to all collisions at once
+#### (checked against this by Common/CompareClassifier.py)
+def PartyFilter(case_id, direction, alcohol, pcf, party_index):
+
+	# Look up the parties in the party index (rows are CASE_ID, DIR_OF_TRAVEL, PARTY_TYPE, MOVE_PRE_ACC, OAF_VIOL_SECTION)
+	party_rows = party_index.Parties(case_id)
 	
 	pcf_vio_cat = ['03','06','07','09','10','11']
 	party_traveldir_list = []
@@ -196,18 +345,15 @@ def PartyFilter(case_id, direction, alcohol, pcf):
 			mvmt_pre_acc_list.append(party[3])
 
 	# If more than two parties, collision qualifies. BUT, first check for L Turns w/ opposing direction
-	print "length of party_traveldir_list: " + str(len(party_traveldir_list))
 
 	if len(party_traveldir_list) >= 2:
 		
 		# If alcohol is invovlved, separate and end
 		if alcohol == 'Y':
-			print "alcohol involved"
 			col_code = 0
 		
 		# If alcohol not involved, separate btw in/out of the pcf vio categories
 		elif pcf in pcf_vio_cat:
-			print "pcf in pcf_vio_cat"
 
 			# Check for L Turns
 			if 'E' in mvmt_pre_acc_list:
@@ -216,30 +362,21 @@ def PartyFilter(case_id, direction, alcohol, pcf):
 				L_turn_index = mvmt_pre_acc_list.index('E')
 				L_turn_direction = party_traveldir_list[L_turn_index]
 
-				# Testing
-				print "Checking L Turn..."
-				print "L_turn_direction " + str(L_turn_direction)
-				print "All directions " + str(party_traveldir_list)
-
 				# Check the direction of the opposing vehicle
 				if (L_turn_direction == "N"):
 					if "S" in party_traveldir_list:
-						print "N v S"
 						col_code = 4
 
 				elif (L_turn_direction == "S"):
 					if "N" in party_traveldir_list:
-						print "S v N"
 						col_code = 4
 
 				elif (L_turn_direction == "E"):
 					if "W" in party_traveldir_list:
-						print "E v W"
 						col_code = 4
 
 				elif (L_turn_direction == "W"):
 					if "E" in party_traveldir_list:
-						print "W v E"
 						col_code = 4
 
 			# Alcohol not involved, pcf in category, but not L Turn
@@ -255,16 +392,40 @@ def PartyFilter(case_id, direction, alcohol, pcf):
 		col_code = 0
 
 	if len(party_traveldir_list) < 1:
-		print "discarding..."
 		return None
 
 	output = [col_code, oaf_22350]
-	print output
 	return output
 
 
 ##### Run the Script #####
 if __name__ == '__main__':
 
+	parser = argparse.ArgumentParser(description="Estimate the road diet safety benefit for each corridor.")
+	parser.add_argument("--workspace", default=env.workspace, help="geodatabase, GeoPackage, SQLite file or folder holding the collision & party tables")
+	parser.add_argument("--segments", default=Segment_Table, help="CSV of corridor ID, segment ID and direction")
+	parser.add_argument("--intersections", default=Intersection_Table, help="CSV of corridor ID and intersection ID")
+	parser.add_argument("--output", default=outpath, help="CSV file for the counts per corridor")
+	parser.add_argument("--state", default=None, help="state file for incremental runs; only corridors touched by changed collisions are recomputed")
+	parser.add_argument("--years", default=None, help="first-last collision years to read, e.g. 2012-2016 (collision store workspaces only, see Common/CollisionStore.py)")
+	parser.add_argument("--pcf-categories", action="append", default=None, help="comma-separated PCF_VIOL_CATEGORY codes targeted by a road diet (default %s); with --sweep, repeat for each list" % ",".join(PcfCategories))
+	parser.add_argument("--sweep", action="store_true", help="count the corridors for every --pcf-categories list in one pass, and write the matrix of road diet collisions to --output")
+	Instrument.AddArguments(parser)
+	args = parser.parse_args()
+	env.workspace = args.workspace
+	env.years = da.ParseYears(args.years)
+	if env.years and not da.IsCollisionStore(env.workspace):
+		parser.error("--years needs a collision store workspace (see Common/CollisionStore.py)")
+	Instrument.Configure(args)
+
+	pcf_lists = [[code.strip() for code in value.split(",") if code.strip()] for value in args.pcf_categories or [",".join(PcfCategories)]]
+	if args.sweep and args.state:
+		parser.error("--sweep cannot be combined with --state")
+	if not args.sweep and len(pcf_lists) > 1:
+		parser.error("several --pcf-categories lists need --sweep")
+	if args.state and pcf_lists[0] != PcfCategories:
+		parser.error("--state keeps the results of the default --pcf-categories only")
+
  	#Function
-	csvTableToList(Segment_Table,Intersection_Table)
+	csvTableToList(args.segments, args.intersections, args.state, args.output, pcf_lists, args.sweep)
+	Instrument.Finish(args, "RoadDietCalc")